@@ -1,19 +1,38 @@
 # db_worker.py
-import os, django, json, redis
+import os, django, json, redis, socket, time
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Bingo.settings")
 django.setup()
 
+from django.db import transaction, close_old_connections
+
 from game.models import Game
+from game.db_events import DB_EVENTS_STREAM, DB_EVENTS_GROUP, ensure_group
+from game.random_players import flush_house_wallets
 from custom_auth.models import User
 
-r = redis.Redis(decode_responses=True)
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+
+BATCH_SIZE = int(os.environ.get("DB_WORKER_BATCH_SIZE", 100))
+BLOCK_MS = int(os.environ.get("DB_WORKER_BLOCK_MS", 2000))
+# Entries left unacked this long by a dead worker are taken over
+RECLAIM_IDLE_MS = int(os.environ.get("DB_WORKER_RECLAIM_IDLE_MS", 60000))
+# Entries that failed this many deliveries are moved to the dead-letter stream
+MAX_DELIVERIES = int(os.environ.get("DB_WORKER_MAX_DELIVERIES", 5))
+DEAD_LETTER_STREAM = f"{DB_EVENTS_STREAM}:dead"
+# Seconds between writes of the accumulated house (random player) wallet changes
+HOUSE_WALLET_FLUSH_INTERVAL = float(os.environ.get("HOUSE_WALLET_FLUSH_INTERVAL", 30))
 
-def handle_db_event(event):
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+def apply_db_event(event):
+    """Apply one event; must run inside a transaction, raises on failure."""
     from game.models import Game
-    from custom_auth.models import User, RandomPlayer
+    from custom_auth.models import User
+    from game.random_players import random_players, add_to_house_wallet
+    from game.settlement import settle_consecutive_losses
     from decimal import Decimal
-    from django.db import transaction
 
     event_type = event.get("event")
     data = event.get("data", {})
@@ -23,51 +42,153 @@ def handle_db_event(event):
 
         print("🧠 Processing GAME_ENDED for game:", game_id)
 
-        try:
-            with transaction.atomic():
-                game = Game.objects.select_for_update().get(id=game_id)
-
-                # ✅ Idempotency guard
-                if game.played == "closed":
-                    print("⚠️ Game already closed, skipping.")
-                    return
-
-                game.winner = data["winner_id"]
-                game.winner_card = data["winner_card"]
-                game.winner_name = data["winner_name"]
-                game.winner_price = Decimal(str(data["winner_price"]))
-                game.played = "closed"
-                game.total_calls = data["total_calls"]
-                game.save()
-
-                # ✅ Wallet credit
-                if int(data["winner_id"]) == 0:
-                    rp = RandomPlayer.objects.get(stake=Decimal(game.stake))
-                    rp.wallet += Decimal(str(data["winner_price"])) + Decimal(str(data["bones_won"]))
-                    rp.save(update_fields=["wallet"])
-                else:
-                    user = User.objects.select_for_update().get(id=data["winner_id"])
-                    user.wallet += Decimal(str(data["winner_price"])) + Decimal(str(data["bones_won"]))
-                    user.save(update_fields=["wallet"])
-
-                print("✅ GAME_END persisted successfully")
+        game = Game.objects.select_for_update().get(id=game_id)
+
+        # ✅ Idempotency guard (events are delivered at least once)
+        if game.played == "closed":
+            print("⚠️ Game already closed, skipping.")
+            return
+
+        game.played = "closed"
+        game.total_calls = data["total_calls"]
+        if data.get("called_numbers") is not None:
+            game.called_numbers = json.dumps(data["called_numbers"])
+
+        participant_ids = {int(entry["user"]) for entry in game.playerCard or [] if int(entry["user"]) != 0}
+
+        # Nobody won (all numbers drawn): close the game, everyone lost
+        if data.get("winner_id") is None:
+            game.save(update_fields=["played", "total_calls", "called_numbers"])
+            settle_consecutive_losses(participant_ids, [])
+            print("✅ GAME_END persisted (no winner)")
+            return
+
+        game.winner = data["winner_id"]
+        game.winner_card = data["winner_card"]
+        game.winner_name = data["winner_name"]
+        game.winner_price = Decimal(str(data["winner_price"]))
+        game.bonus = data.get("bones_won", 0)
+        game.save()
+
+        # ✅ Wallet credit
+        if data.get("random_player") or int(data["winner_id"]) == 0:
+            rp = random_players.get(game.stake)
+            if rp:
+                amount = Decimal(str(data["winner_price"])) + Decimal(str(data["bones_won"]))
+                transaction.on_commit(lambda: add_to_house_wallet(rp.pk, amount))
+        else:
+            user = User.objects.select_for_update().get(id=data["winner_id"])
+            user.wallet += Decimal(str(data["winner_price"])) + Decimal(str(data["bones_won"]))
+            user.save(update_fields=["wallet"])
+
+        # ✅ Loss streaks (same transaction)
+        winner_ids = [] if data.get("random_player") else [data["winner_id"]]
+        settle_consecutive_losses(participant_ids, winner_ids)
+
+        print("✅ GAME_END persisted successfully")
+
+    elif event_type == "GAME_CHECKPOINT":
+        # Periodic progress of a running game; never touches a closed row
+        Game.objects.filter(id=data["game_id"]).exclude(played="closed").update(
+            called_numbers=json.dumps(data["called_numbers"]),
+            total_calls=data["total_calls"],
+        )
+
+
+def process_batch(entries):
+    """
+    Apply a batch of stream entries in ONE transaction and return the ids to ack.
+    Each event runs in its own savepoint, so a bad event is rolled back (and
+    left pending for a retry) without undoing the rest of the batch.
+    """
+    done = []
+    with transaction.atomic():
+        for entry_id, fields in entries:
+            try:
+                event = json.loads(fields["event"])
+            except (KeyError, TypeError, ValueError) as e:
+                print("Bad db event, dropping:", entry_id, e)
+                done.append(entry_id)
+                continue
+            try:
+                with transaction.atomic():
+                    apply_db_event(event)
+                done.append(entry_id)
+            except Exception as e:
+                print(f"❌ Failed to persist {event.get('event')} ({entry_id}):", e)
+    return done
+
+
+def reclaim(consumer):
+    """Take over entries a crashed worker left pending; dead-letter poison ones."""
+    claimed = r.xautoclaim(DB_EVENTS_STREAM, DB_EVENTS_GROUP, consumer,
+                           min_idle_time=RECLAIM_IDLE_MS, start_id="0-0", count=BATCH_SIZE)
+    # entries trimmed from the stream come back without fields
+    entries = [(entry_id, fields) for entry_id, fields in claimed[1] if fields]
+    if not entries:
+        return []
+
+    # one XPENDING per claimed id: a range query capped at len(entries) can
+    # stop at ids pending for other consumers and miss some of ours
+    pipe = r.pipeline(transaction=False)
+    for entry_id, _ in entries:
+        pipe.xpending_range(DB_EVENTS_STREAM, DB_EVENTS_GROUP, min=entry_id, max=entry_id, count=1)
+    deliveries = {p["message_id"]: p["times_delivered"] for pending in pipe.execute() for p in pending}
+
+    retry = []
+    for entry_id, fields in entries:
+        if entry_id not in deliveries:
+            continue  # acked since the claim
+        if deliveries[entry_id] > MAX_DELIVERIES:
+            print("☠️ Giving up on db event", entry_id)
+            r.xadd(DEAD_LETTER_STREAM, fields)
+            r.xack(DB_EVENTS_STREAM, DB_EVENTS_GROUP, entry_id)
+        else:
+            retry.append((entry_id, fields))
+    return retry
 
-        except Exception as e:
-            print("❌ Failed to persist GAME_ENDED:", e)
-    
 
 def run():
-    pubsub = r.pubsub()
-    pubsub.psubscribe("game:*:db_events")
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    ensure_group(r)
 
-    print("✅ DB Worker running")
+    print(f"✅ DB Worker running as {consumer} on {DB_EVENTS_STREAM}")
 
-    for msg in pubsub.listen():
-        print("Received message:", msg)
-        if msg["type"] != "pmessage":
-            continue
-        event = json.loads(msg["data"])
-        handle_db_event(event)
+    last_reclaim = 0.0
+    last_flush = time.monotonic()
+    while True:
+        try:
+            if time.monotonic() - last_flush >= HOUSE_WALLET_FLUSH_INTERVAL:
+                last_flush = time.monotonic()
+                flushed = flush_house_wallets(r)
+                if flushed:
+                    print(f"💰 Flushed house wallet changes for {len(flushed)} random player(s)")
+
+            entries = []
+            if time.monotonic() - last_reclaim >= RECLAIM_IDLE_MS / 1000:
+                last_reclaim = time.monotonic()
+                entries = reclaim(consumer)
+
+            if not entries:
+                response = r.xreadgroup(DB_EVENTS_GROUP, consumer, {DB_EVENTS_STREAM: ">"},
+                                        count=BATCH_SIZE, block=BLOCK_MS)
+                entries = response[0][1] if response else []
+
+            if not entries:
+                continue
+
+            done = process_batch(entries)
+            if done:
+                r.xack(DB_EVENTS_STREAM, DB_EVENTS_GROUP, *done)
+            print(f"Processed {len(done)}/{len(entries)} db events")
+        except redis.RedisError as e:
+            print("Redis error in DB worker:", e)
+            time.sleep(1)
+        except Exception as e:
+            # e.g. the database went away: nothing was acked, the batch is retried
+            print("DB worker error:", e)
+            close_old_connections()
+            time.sleep(1)
 
 if __name__ == "__main__":
     run()
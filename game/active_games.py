@@ -0,0 +1,157 @@
+"""
+Snapshot of every stake room for the "all games" lobby.
+
+Building it used to cost ~24 Redis GETs plus one ``Game`` query per running
+stake, and it is rebuilt on every lobby change.  Here all stake keys are read
+with one MGET, the per-game running flags with a second one, and running games
+with a single ``id__in`` query.  The Redis part is always read fresh (it is
+what lobby changes modify); the database rows of the running games are kept
+for ``SNAPSHOT_TTL`` seconds, so a burst of lobby changes shares one query.
+"""
+import json
+import os
+import threading
+import time
+
+from django.utils import timezone
+
+from game.payout import BONUS_STAKES
+
+
+STAKES = [10, 20, 30, 40, 50, 100, 150, 200]
+
+SNAPSHOT_TTL = float(os.environ.get("ACTIVE_GAMES_SNAPSHOT_TTL", 0.5))
+
+
+def _loads(value):
+    return json.loads(value) if value else None
+
+
+def _idle(has_bonus):
+    return {
+        "is_running": False,
+        "remaining_seconds": 0,
+        "winner_price": 0,
+        "bonus": has_bonus,
+    }
+
+
+class RunningGamesCache:
+    """(played, winner_price) of the running games, shared for ``ttl`` seconds."""
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._ids = None
+        self._rows = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, game_ids):
+        from game.models import Game
+
+        game_ids = frozenset(game_ids)
+        if not game_ids:
+            return {}
+        with self._lock:
+            if game_ids != self._ids or time.monotonic() - self._loaded_at >= self.ttl:
+                self._rows = {
+                    game_id: (played, winner_price)
+                    for game_id, played, winner_price in Game.objects.filter(id__in=game_ids)
+                    .values_list("id", "played", "winner_price")
+                }
+                self._ids = game_ids
+                self._loaded_at = time.monotonic()
+            return self._rows
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+
+running_games_cache = RunningGamesCache()
+
+
+def _stake_keys():
+    keys = []
+    for stake in STAKES:
+        keys += [
+            f"stake_state_{stake}_current_game_id",
+            f"stake_state_{stake}_next_game_start",
+            f"player_count_{stake}",
+        ]
+    return keys
+
+
+def _rooms(values):
+    rooms = {}
+    for i, stake in enumerate(STAKES):
+        game_id, next_start, player_count = values[i * 3:i * 3 + 3]
+        rooms[stake] = (_loads(game_id), _loads(next_start), int(player_count or 0))
+    return rooms
+
+
+def _current_game_ids(rooms):
+    return [game_id for game_id, _, _ in rooms.values() if game_id]
+
+
+def build_active_games(redis_client, calculate_winner_price):
+    current_timestamp = timezone.now().timestamp()
+    rooms = _rooms(redis_client.mget(_stake_keys()))
+
+    # running flags of the current games, one round trip
+    game_ids = _current_game_ids(rooms)
+    running_ids = set()
+    if game_ids:
+        flags = redis_client.mget([f"game_state_{game_id}_is_running" for game_id in game_ids])
+        running_ids = {game_id for game_id, flag in zip(game_ids, flags) if _loads(flag)}
+
+    games = running_games_cache.get(running_ids)
+    return _snapshot(rooms, running_ids, games, current_timestamp, calculate_winner_price)
+
+
+async def abuild_active_games(redis_client, calculate_winner_price):
+    """``build_active_games`` for a redis.asyncio client (the async consumers)."""
+    from channels.db import database_sync_to_async
+
+    current_timestamp = timezone.now().timestamp()
+    rooms = _rooms(await redis_client.mget(_stake_keys()))
+
+    game_ids = _current_game_ids(rooms)
+    running_ids = set()
+    if game_ids:
+        flags = await redis_client.mget([f"game_state_{game_id}_is_running" for game_id in game_ids])
+        running_ids = {game_id for game_id, flag in zip(game_ids, flags) if _loads(flag)}
+
+    games = await database_sync_to_async(running_games_cache.get)(running_ids) if running_ids else {}
+    return _snapshot(rooms, running_ids, games, current_timestamp, calculate_winner_price)
+
+
+def _snapshot(rooms, running_ids, games, current_timestamp, calculate_winner_price):
+    active_games = {}
+    for stake, (game_id, next_game_start, no_p) in rooms.items():
+        has_bonus = stake in BONUS_STAKES
+
+        if game_id in running_ids:
+            game = games.get(game_id)
+            if game is None or game[0] == "closed":
+                active_games[str(stake)] = _idle(has_bonus)
+            else:
+                active_games[str(stake)] = {
+                    "is_running": True,
+                    "remaining_seconds": 0,
+                    "winner_price": float(game[1]),
+                    "bonus": has_bonus,
+                }
+
+        elif next_game_start and next_game_start > current_timestamp:
+            active_games[str(stake)] = {
+                "is_running": False,
+                "remaining_seconds": int(next_game_start - current_timestamp),
+                "winner_price": calculate_winner_price(no_p, stake),
+                "bonus": has_bonus,
+            }
+        else:
+            active_games[str(stake)] = _idle(has_bonus)
+
+    return active_games
+
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class GameConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'game'
+
+    def ready(self):
+        # connects the RandomPlayer save/delete receivers
+        from game import random_players  # noqa: F401
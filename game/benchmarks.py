@@ -0,0 +1,188 @@
+"""
+Micro-benchmarks for the code that runs on every draw or click.
+
+    python manage.py test game.benchmarks                    # compare with the baseline
+    BENCHMARK_SAVE=1 python manage.py test game.benchmarks   # record a new baseline
+
+Not part of the regular test run (the module is not named test*.py).  Redis
+is fakeredis (the benchmarks that need it are skipped when it is not
+installed) and the database is the test database, so nothing outside the
+process is touched.  Each benchmark reports the median time per call; when
+the baseline file has an entry for it, the test fails if the median is more
+than BENCHMARK_TOLERANCE times the baseline.  Baselines are machine specific:
+record them on the machine that runs the comparison.
+"""
+import json
+import os
+import random
+import statistics
+import time
+
+from django.test import TestCase
+
+from game import patterns
+from game.lobby import flatten_cards
+from game.settlement import flatten_entry_cards
+
+
+BENCHMARK_BASELINE = os.environ.get(
+    "BENCHMARK_BASELINE", os.path.join(os.path.dirname(__file__), "benchmark_baseline.json")
+)
+BENCHMARK_TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", 1.5))
+BENCHMARK_ROUNDS = int(os.environ.get("BENCHMARK_ROUNDS", 7))
+BENCHMARK_SAVE = os.environ.get("BENCHMARK_SAVE") == "1"
+
+LOBBY_SIZES = (10, 100, 500)
+
+
+def measure(fn, *args, rounds=BENCHMARK_ROUNDS, min_round_time=0.02):
+    """Median seconds per call, over ``rounds`` rounds of at least ``min_round_time``."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(*args)
+        if time.perf_counter() - started >= min_round_time:
+            break
+        number *= 2
+
+    per_call = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn(*args)
+        per_call.append((time.perf_counter() - started) / number)
+    return statistics.median(per_call)
+
+
+def fake_redis():
+    try:
+        import fakeredis
+    except ImportError:
+        return None
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+class HotPathBenchmark(TestCase):
+    baseline = {}
+    results = {}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            with open(BENCHMARK_BASELINE) as f:
+                cls.baseline = json.load(f)
+        except FileNotFoundError:
+            cls.baseline = {}
+        cls.results = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if BENCHMARK_SAVE and cls.results:
+            with open(BENCHMARK_BASELINE, "w") as f:
+                json.dump({**cls.baseline, **cls.results}, f, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        random.seed(1234)
+        self.redis = fake_redis()
+
+    def require_redis(self):
+        if self.redis is None:
+            self.skipTest("fakeredis is not installed")
+
+    def bench(self, name, fn, *args):
+        median = measure(fn, *args)
+        self.results[name] = median
+        baseline = self.baseline.get(name)
+        note = f" (baseline {baseline * 1e6:.2f}us)" if baseline else ""
+        print(f"\n  {name}: {median * 1e6:.2f}us{note}", end="")
+        if baseline and not BENCHMARK_SAVE:
+            self.assertLessEqual(
+                median, baseline * BENCHMARK_TOLERANCE,
+                f"{name} regressed: {median * 1e6:.2f}us against a baseline of {baseline * 1e6:.2f}us",
+            )
+
+    # --- fixtures ---
+    def make_cards(self, count=120):
+        from game.models import Card
+        from game.management.commands.generate_cards import generate_bingo_card
+
+        Card.objects.bulk_create(
+            [Card(id=i, numbers=json.dumps(generate_bingo_card())) for i in range(1, count + 1)]
+        )
+
+    def lobby_players(self, size):
+        return [{"user": i + 1, "card": [2 * i + 1, 2 * i + 2]} for i in range(size)]
+
+    # --- benchmarks ---
+    def test_has_bingo(self):
+        from game.management.commands.generate_cards import generate_bingo_card
+
+        grid = generate_bingo_card()
+        called = random.sample(range(1, 76), 30) + [0]
+        masks = patterns.card_number_masks(grid)
+        called_mask = patterns.called_mask(called)
+
+        self.bench("has_bingo.grid_and_list", patterns.has_bingo, grid, called)
+        self.bench("has_bingo.precomputed_masks", patterns.has_bingo, masks, called_mask)
+
+        if self.redis is not None:
+            from game.card_catalog import CardCatalog
+
+            self.make_cards()
+            catalog = CardCatalog(redis_client=self.redis)
+            catalog.load()
+            self.bench("has_bingo.card_catalog", catalog.has_bingo, 7, called_mask)
+
+    def test_flatten(self):
+        nested = [[1, 2], [3, [4, 5]], 6]
+        flat = list(range(1, 11))
+        self.bench("flatten.lobby_nested", flatten_cards, nested)
+        self.bench("flatten.lobby_flat", flatten_cards, flat)
+        self.bench("flatten.settlement_nested", flatten_entry_cards, [[1, 2], [3, 4], [5, 6]])
+
+    def test_get_all_active_games(self):
+        self.require_redis()
+        from django.utils import timezone
+        from game import payout
+        from game.active_games import STAKES, build_active_games, running_games_cache
+        from game.models import Game
+
+        now = timezone.now().timestamp()
+        for index, stake in enumerate(STAKES):
+            if index % 2:
+                game = Game.objects.create(stake=str(stake), winner_price=80, played="Playing", random_numbers="[]")
+                self.redis.set(f"stake_state_{stake}_current_game_id", json.dumps(game.id))
+                self.redis.set(f"game_state_{game.id}_is_running", "true")
+            else:
+                self.redis.set(f"stake_state_{stake}_next_game_start", json.dumps(now + 25))
+                self.redis.set(f"player_count_{stake}", 12)
+        running_games_cache.invalidate()
+
+        self.bench("get_all_active_games", build_active_games, self.redis, payout.calculate_winner_price)
+
+    def test_add_player_conflict_detection(self):
+        self.require_redis()
+        from game.lobby import LobbyStore
+
+        lobby = LobbyStore(self.redis, "bench")
+        lobby.set_selected_players(self.lobby_players(50))
+
+        # card 1 belongs to user 1: rejected without touching the lobby
+        self.bench("add_player.conflict", lobby.claim, 999, [1])
+        # user 1 swapping between two free cards
+        swaps = iter([[201], [202]] * 10 ** 7)
+        self.bench("add_player.claim", lambda: lobby.claim(1, next(swaps)))
+
+    def test_generate_random_numbers(self):
+        from game.ws_handlers import GameManager, RedisState
+
+        manager = GameManager(RedisState(self.redis, "10"), "10", "game_10")
+        self.bench("generate_random_numbers", manager.generate_random_numbers)
+
+    def test_player_list_json(self):
+        for size in LOBBY_SIZES:
+            message = {"type": "player_list", "seq": 1, "player_list": self.lobby_players(size)}
+            self.bench(f"player_list_json.{size}", json.dumps, message)
@@ -0,0 +1,56 @@
+"""
+Coalesced lobby broadcasts.
+
+Every card selection used to push the full player list (plus game_stat and
+the all-stakes overview) to the whole room, so a busy countdown meant O(n²)
+bytes through pub/sub.  Lobby changes now only *request* a broadcast: the
+first request for a room opens a window of ``LOBBY_BROADCAST_WINDOW`` seconds
+and one snapshot of the latest state is sent when it closes; requests made
+while the window is open ride along.
+
+The window is marked with a short-lived Redis key as well, so when several
+worker processes serve the same room only one of them sends the snapshot.
+``arequest`` is the same for the async consumers (redis.asyncio client,
+coroutine flush on the ASGI event loop).
+"""
+import os
+
+from game.scheduler import async_scheduler, scheduler
+
+
+LOBBY_BROADCAST_WINDOW = float(os.environ.get("LOBBY_BROADCAST_WINDOW", 0.15))
+
+
+class BroadcastCoalescer:
+    def __init__(self, window=LOBBY_BROADCAST_WINDOW):
+        self.window = window
+
+    def request(self, key, fn, *args, redis_client=None):
+        """
+        Run ``fn(*args)`` once at the end of the current window for ``key``.
+        Returns False when a window for ``key`` is already open.
+        """
+        # A flush already pending here will send this change: claiming the
+        # Redis key now would hold it past that flush and refuse the next change.
+        if scheduler.is_pending(f"broadcast:{key}"):
+            return False
+        if redis_client is not None:
+            # The key expires a little before the flush fires: a change landing
+            # right at the edge then opens a new window instead of being missed.
+            ttl_ms = max(1, int(self.window * 800))
+            if not redis_client.set(f"broadcast_window:{key}", 1, nx=True, px=ttl_ms):
+                return False
+        return scheduler.call_later(self.window, f"broadcast:{key}", fn, *args)
+
+    async def arequest(self, key, fn, *args, redis_client=None):
+        """``request`` for a coroutine function ``fn`` and a redis.asyncio client."""
+        if async_scheduler.is_pending(f"broadcast:{key}"):
+            return False
+        if redis_client is not None:
+            ttl_ms = max(1, int(self.window * 800))
+            if not await redis_client.set(f"broadcast_window:{key}", 1, nx=True, px=ttl_ms):
+                return False
+        return async_scheduler.call_later(self.window, f"broadcast:{key}", fn, *args)
+
+
+lobby_broadcasts = BroadcastCoalescer()
@@ -0,0 +1,151 @@
+"""
+In-process catalog of the (fixed) bingo card set.
+
+All cards are read with one query, their JSON decoded once and their pattern
+masks precomputed, so a bingo check or a card lookup touches neither the
+database nor the JSON parser.  The catalog is versioned through a Redis key:
+``regenrate_cards`` / ``regenerate_all_cards`` bump it and every process
+reloads on its next version check.
+
+Each card is also kept JSON-encoded for the card endpoints, and the loaded set
+gets a ``revision`` (version key plus a digest of the grids) that the views
+use as the ETag / cache key of the card set.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import redis
+
+from game import patterns
+
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+
+CARD_CATALOG_VERSION_KEY = "card_catalog:version"
+# How often (seconds) a process looks at the version key; lookups in between
+# are pure memory reads.
+VERSION_CHECK_INTERVAL = 2.0
+
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+
+
+def _decode(numbers):
+    # Card.numbers is a JSONField that historically holds a JSON string.
+    if isinstance(numbers, str):
+        numbers = json.loads(numbers)
+    return tuple(tuple(int(n) for n in row) for row in numbers)
+
+
+class CardCatalog:
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or r
+        self.version = None
+        self._grids = []  # index = card id -> 5x5 tuple grid (None for gaps)
+        self._masks = []  # index = card id -> patterns.card_number_masks()
+        self._encoded = []  # index = card id -> '{"id": .., "numbers": ..}'
+        self.revision = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # --- loading ---
+    def _read_version(self):
+        try:
+            return int(self.redis_client.get(CARD_CATALOG_VERSION_KEY) or 0)
+        except redis.RedisError:
+            return self.version or 0
+
+    def load(self):
+        from game.models import Card
+
+        with self._lock:
+            version = self._read_version()
+            rows = list(Card.objects.values_list("id", "numbers"))
+            size = max((card_id for card_id, _ in rows), default=0) + 1
+            grids = [None] * size
+            masks = [None] * size
+            encoded = [None] * size
+            digest = hashlib.blake2b(digest_size=6)
+            for card_id, numbers in sorted(rows):
+                try:
+                    grid = _decode(numbers)
+                except (TypeError, ValueError):
+                    continue
+                grids[card_id] = grid
+                masks[card_id] = patterns.card_number_masks(grid)
+                encoded[card_id] = json.dumps({"id": card_id, "numbers": grid})
+                digest.update(encoded[card_id].encode())
+
+            self._grids, self._masks, self._encoded = grids, masks, encoded
+            self.revision = f"{version}-{digest.hexdigest()}"
+            self.version = version
+            self._checked_at = time.monotonic()
+
+    def refresh(self):
+        """Reload if the catalog was never loaded or the version key moved."""
+        if self.version is None:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._read_version() != self.version:
+            self.load()
+
+    # --- lookups ---
+    def grid(self, card_id):
+        self.refresh()
+        try:
+            return self._grids[int(card_id)]
+        except (IndexError, TypeError, ValueError):
+            return None
+
+    def masks(self, card_id):
+        self.refresh()
+        try:
+            return self._masks[int(card_id)]
+        except (IndexError, TypeError, ValueError):
+            return None
+
+    def cards(self, card_ids):
+        """``[{"id", "numbers"}]`` for the known ids, ordered by id like the old queries."""
+        self.refresh()
+        result = []
+        for card_id in sorted({int(c) for c in card_ids}):
+            grid = self._grids[card_id] if 0 <= card_id < len(self._grids) else None
+            if grid is not None:
+                result.append({"id": card_id, "numbers": grid})
+        return result
+
+    def cards_json(self, card_ids):
+        """
+        ``(revision, ids, body)``: the same cards as ``cards()`` as one
+        pre-encoded JSON array, with the ids found and the set's revision.
+        """
+        self.refresh()
+        revision, encoded = self.revision, self._encoded
+        found = [card_id for card_id in sorted({int(c) for c in card_ids})
+                 if 0 <= card_id < len(encoded) and encoded[card_id] is not None]
+        return revision, found, "[" + ", ".join(encoded[card_id] for card_id in found) + "]"
+
+    def has_bingo(self, card_id, called_numbers):
+        number_masks = self.masks(card_id)
+        if number_masks is None:
+            return []
+        return patterns.has_bingo(number_masks, called_numbers)
+
+
+catalog = CardCatalog()
+
+
+def bump_version(redis_client=None):
+    """Invalidate every process' catalog after the card set was rewritten."""
+    version = (redis_client or r).incr(CARD_CATALOG_VERSION_KEY)
+    # Other processes notice on their next version check; reload ours now.
+    if catalog.version is not None:
+        catalog.load()
+    return version
@@ -0,0 +1,68 @@
+"""
+Per-stake command streams between twisted_ws.py and redis_worker.py.
+
+Client commands are appended to ``game:{stake}:commands`` instead of being
+published on pub/sub, so a command is handled exactly once no matter how many
+workers run, and none is lost while workers restart.  Each stake stream is
+owned by one worker at a time (a lease key), which keeps a room's commands in
+order while different stakes are processed in parallel.
+"""
+import json
+import os
+
+import redis
+
+
+COMMAND_GROUP = os.environ.get("COMMAND_GROUP", "redis_worker")
+COMMAND_STAKES_KEY = "game:command_stakes"  # set of stakes that have a stream
+COMMAND_MAXLEN = int(os.environ.get("COMMAND_MAXLEN", 10000))
+COMMAND_BACKLOG_KEY = "game:commands:backlog"  # stake -> {"lag", "pending"} (JSON)
+
+
+def command_stream(stake):
+    return f"game:{stake}:commands"
+
+
+def owner_key(stake):
+    return f"game:{stake}:commands:owner"
+
+
+def queue_command(pipe, stake, data):
+    """Add the commands for one client message to ``pipe`` (sync or asyncio pipeline)."""
+    pipe.xadd(command_stream(stake), {"data": data}, maxlen=COMMAND_MAXLEN, approximate=True)
+    pipe.sadd(COMMAND_STAKES_KEY, stake)
+    return pipe
+
+
+def ensure_group(redis_client, stake):
+    try:
+        redis_client.xgroup_create(command_stream(stake), COMMAND_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def stake_backlog(redis_client):
+    """``{stake: {"lag": undelivered, "pending": delivered but unacked}}`` for every stream."""
+    backlog = {}
+    for stake in sorted(redis_client.smembers(COMMAND_STAKES_KEY)):
+        stream = command_stream(stake)
+        try:
+            groups = redis_client.xinfo_groups(stream)
+        except redis.ResponseError:
+            continue
+        group = next((g for g in groups if g["name"] == COMMAND_GROUP), None)
+        if group is None:
+            backlog[stake] = {"lag": redis_client.xlen(stream), "pending": 0}
+            continue
+        lag = group.get("lag")
+        backlog[stake] = {
+            "lag": lag if lag is not None else redis_client.xlen(stream),
+            "pending": group["pending"],
+        }
+    return backlog
+
+
+def publish_backlog(redis_client, backlog):
+    if backlog:
+        redis_client.hset(COMMAND_BACKLOG_KEY, mapping={stake: json.dumps(depth) for stake, depth in backlog.items()})
@@ -1,20 +1,33 @@
+import asyncio
 import json
-import threading
 import time
 import random
 
 from django.template.defaultfilters import lower
 from django.utils import timezone
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
-import redis
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from redis import asyncio as aioredis
 import uuid
 
-
-class GameConsumer(WebsocketConsumer):
-    redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+from game import patterns
+from game.card_catalog import catalog as card_catalog, bump_version as bump_card_catalog_version
+from game.scheduler import async_scheduler
+from game.lobby import AsyncLobbyStore
+from game import room_snapshot
+from game.active_games import abuild_active_games
+from game.broadcast import lobby_broadcasts
+from game.settlement import charge_entries, record_participation, settle_consecutive_losses
+from game import payout
+from game.random_players import random_players, add_to_house_wallet
+
+
+class GameConsumer(AsyncWebsocketConsumer):
+    # Redis state through redis.asyncio, countdowns and draw loops as tasks on the
+    # server's event loop; only ORM work leaves the loop (database_sync_to_async).
+    redis_client = aioredis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
     game_threads_started = set()
-    lock = threading.Lock()
+    lock = asyncio.Lock()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -81,87 +94,64 @@ class GameConsumer(WebsocketConsumer):
         for i, card in enumerate(cards_to_regen, 1):
             self.regenerate_card_numbers(card, existing_cards)
 
-    def connect(self):
+        bump_card_catalog_version()
+
+    async def connect(self):
         self.stake = self.scope['url_route']['kwargs']['stake']
         self.room_group_name = f'game_{self.stake}'
-        self.accept()
+        await self.accept()
 
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
         if self.room_group_name == "all":
 
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "active_game_data",
-                "data": self.get_all_active_games()
+                "data": await self.get_all_active_games()
             }))
 
         else:
-            current_game_id = self.get_stake_state("current_game_id")
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
+            # One HGETALL of the frames the game loop keeps encoded; the slow
+            # path below only runs until the room's first document exists.
+            doc = await self.snapshot.load()
+            frames = room_snapshot.frames(doc)
+            if frames is not None:
+                for frame in frames:
+                    await self.send(text_data=frame)
+                if room_snapshot.needs_start(doc):
+                    await self.try_start_game()
+                return
 
-            if is_running:
-                from game.models import Game
-                try:
-                    current_game = Game.objects.get(id=current_game_id)
-                    # Bonus text logic
-                    stake_value = int(self.stake or 0)
-                    if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                        bonus_text = "10X"
-                    else:
-                        bonus_text = ""
-
-                    stats = {
-                        "type": "game_stat",
-                        'number_of_players': current_game.numberofplayers,
-                        'stake': current_game.stake,
-                        'winner_price': float(current_game.winner_price),
-                        'bonus': bonus_text,
-                        'game_id': current_game.id,
-                        "running": True,
-                        "called_numbers": self.get_game_state("called_numbers", current_game_id) or [],
-                    }
-                    self.send(text_data=json.dumps({
-                        "type": "game_in_progress",
-                        "game_id": current_game_id
-                    }))
-                except Game.DoesNotExist:
-                    self.try_start_game()
-                    stats = {
-                        "type": "game_stat",
-                        "running": False,
-                        "message": "No game is currently running.",
-                        "number_of_players": self.get_player_count(),
-                        "remaining_seconds": self.get_remaining_time(),
-                    }
+            current_game_id = await self.get_stake_state("current_game_id")
+            is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
+
+            current_game = await self.get_game(current_game_id) if is_running else None
+            if current_game is not None:
+                stats = await self.running_game_stat(current_game)
+                await self.send(text_data=json.dumps({
+                    "type": "game_in_progress",
+                    "game_id": current_game_id
+                }))
             else:
-                self.try_start_game()
-                stats = {
-                    "type": "game_stat",
-                    "running": False,
-                    "message": "No game is currently running.",
-                    "number_of_players": self.get_player_count(),
-                    "remaining_seconds": self.get_remaining_time(),
-                }
+                await self.try_start_game()
+                stats = await self.idle_game_stat()
 
-            self.send(text_data=json.dumps(stats))
-            self.send(text_data=json.dumps({
-                'type': 'player_list',
-                'player_list': self.get_selected_players()
-            }))
+            await self.send(text_data=json.dumps(stats))
+            await self.send_player_list_snapshot()
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    def receive(self, text_data):
+    async def receive(self, text_data):
         # Handle empty or None messages
         if not text_data or text_data.strip() == "":
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "error",
                 "message": "Empty message received."
             }))
@@ -170,7 +160,7 @@ class GameConsumer(WebsocketConsumer):
         try:
             data = json.loads(text_data)
         except json.JSONDecodeError:
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "error",
                 "message": "Invalid JSON format."
             }))
@@ -178,36 +168,38 @@ class GameConsumer(WebsocketConsumer):
 
         if data['type'] == 'select_number':
 
-            current_game_id = self.get_stake_state("current_game_id")
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
+            current_game_id = await self.get_stake_state("current_game_id")
+            is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
 
             if is_running:
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "error",
                     "message": "Game already in progress. Please wait for the next round."
                 }))
                 return
 
-            self.add_player(data['player_id'], data['card_id'])
+            await self.add_player(data['player_id'], data['card_id'])
 
         if data['type'] == 'remove_number':
-            self.remove_player(data['userId'])
+            await self.remove_player(data['userId'])
+
+        if data['type'] == 'player_list_sync':
+            await self.send_player_list_snapshot()
 
         if data['type'] == 'bingo':
-            async_to_sync(self.checkBingo(int(data['userId']), data['calledNumbers'], data['gameId']))
-            bingo = self.get_game_state("bingo", game_id=data['gameId'])
+            await self.checkBingo(int(data['userId']), data['calledNumbers'], data['gameId'])
+            bingo = await self.get_game_state("bingo", game_id=data['gameId'])
             if bingo:
-                self.set_game_state("is_running", False, game_id=data['gameId'])
-                self.set_stake_state("current_game_id", None)
-                self.set_selected_players([])
-                self.set_player_count(0)
-                self.broadcast_player_list()
+                await self.set_game_state("is_running", False, game_id=data['gameId'])
+                await self.set_stake_state("current_game_id", None)
+                await self.snapshot.clear_running()
+                await self.set_selected_players([])
+                await self.set_player_count(0)
+                await self.broadcast_player_list()
 
         if data['type'] == 'card_data':
-            from game.models import Card
-
             user_cards = []
-            selected_players = self.get_selected_players()
+            selected_players = await self.get_selected_players()
             for player in selected_players:
                 if player['user'] == int(data.get("userId")):
                     cards_field = player['card']
@@ -225,218 +217,131 @@ class GameConsumer(WebsocketConsumer):
                     break
 
             if not user_cards:
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "no_cards",
                     "message": "No cards found for user."
                 }))
                 return  # ✅ Don't send empty card data
 
-            cards = Card.objects.filter(id__in=user_cards)
-            bingo_table_data = [
-                {
-                    "id": card.id,
-                    "numbers": json.loads(card.numbers)
-                }
-                for card in cards
-            ]
-            self.send(text_data=json.dumps({
+            # the catalog (re)loads from the database when its version moves
+            bingo_table_data = await database_sync_to_async(card_catalog.cards)(user_cards)
+            await self.send(text_data=json.dumps({
                 "type": "card_data",
                 "cards": bingo_table_data
             }))
             return
 
         if data['type'] == "get_stake_stat":
-            current_game_id = self.get_stake_state("current_game_id")
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
+            current_game_id = await self.get_stake_state("current_game_id")
+            is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
 
-            if is_running:
-                from game.models import Game
-                try:
-                    current_game = Game.objects.get(id=current_game_id)
-                    # Bonus text logic
-                    stake_value = int(self.stake or 0)
-                    if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                        bonus_text = "10X"
-                    else:
-                        bonus_text = ""
-
-                    stats = {
-                        "type": "game_stat",
-                        'number_of_players': current_game.numberofplayers,
-                        'stake': current_game.stake,
-                        'winner_price': float(current_game.winner_price),
-                        'bonus': bonus_text,
-                        'game_id': current_game.id,
-                        "running": True,
-                        "called_numbers": self.get_game_state("called_numbers", current_game_id) or [],
-                    }
-                except Game.DoesNotExist:
-                    stats = {
-                        "type": "game_stat",
-                        "running": False,
-                        "message": "No game is currently running.",
-                        "number_of_players": self.get_player_count(),
-                        "remaining_seconds": self.get_remaining_time(),
-                    }
+            current_game = await self.get_game(current_game_id) if is_running else None
+            if current_game is not None:
+                stats = await self.running_game_stat(current_game)
             else:
-                stats = {
-                    "type": "game_stat",
-                    "running": False,
-                    "message": "No game is currently running.",
-                    "number_of_players": self.get_player_count(),
-                    "remaining_seconds": self.get_remaining_time(),
-                }
+                stats = await self.idle_game_stat()
 
-            self.send(text_data=json.dumps(stats))
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps(stats))
+            await self.send(text_data=json.dumps({
                 'type': 'player_list',
-                'player_list': self.get_selected_players()
+                'player_list': await self.get_selected_players()
             }))
 
         if data['type'] == "block_user":
             user_id = data.get("userId")
             if user_id:
-                self.block(user_id)
-                self.remove_player(user_id)
-                self.send(text_data=json.dumps({
+                await self.block(user_id)
+                await self.remove_player(user_id)
+                await self.send(text_data=json.dumps({
                     "type": "user_blocked",
                     "message": f"User {user_id} has been blocked."
                 }))
             else:
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "error",
                     "message": "User ID not provided."
                 }))
 
         if data['type'] == "fetch_active_game":
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "active_game_data",
-                "data": self.get_all_active_games()
+                "data": await self.get_all_active_games()
             }))
 
+    async def running_game_stat(self, current_game):
+        # Bonus text logic
+        bonus_text = payout.for_stake(self.stake or 0).bonus_text(current_game.numberofplayers)
+
+        return {
+            "type": "game_stat",
+            'number_of_players': current_game.numberofplayers,
+            'stake': current_game.stake,
+            'winner_price': float(current_game.winner_price),
+            'bonus': bonus_text,
+            'game_id': current_game.id,
+            "running": True,
+            "called_numbers": await self.get_game_state("called_numbers", current_game.id) or [],
+        }
+
+    async def idle_game_stat(self):
+        return {
+            "type": "game_stat",
+            "running": False,
+            "message": "No game is currently running.",
+            "number_of_players": await self.get_player_count(),
+            "remaining_seconds": await self.get_remaining_time(),
+        }
+
     # --- Redis state helpers ---
-    def get_selected_players(self):
-        key = f"selected_players_{self.stake}"
-        data = self.redis_client.get(key)
-        return json.loads(data) if data else []
+    @property
+    def lobby(self):
+        return AsyncLobbyStore(self.redis_client, self.stake)
+
+    @property
+    def snapshot(self):
+        return room_snapshot.AsyncRoomSnapshot(self.redis_client, room_snapshot.stake_key(self.stake))
 
-    def set_selected_players(self, players):
-        key = f"selected_players_{self.stake}"
-        self.redis_client.set(key, json.dumps(players))
+    async def get_selected_players(self):
+        return await self.lobby.get_selected_players()
 
-    def get_player_count(self):
-        return int(self.redis_client.get(f"player_count_{self.stake}") or 0)
+    async def set_selected_players(self, players):
+        await self.lobby.set_selected_players(players)
 
-    def set_player_count(self, count):
-        self.redis_client.set(f"player_count_{self.stake}", count)
+    async def get_player_count(self):
+        return await self.lobby.get_player_count()
 
-    def get_game_state(self, key, game_id):
-        game_id = game_id
-        val = self.redis_client.get(f"game_state_{game_id}_{key}")
+    async def set_player_count(self, count):
+        await self.redis_client.set(f"player_count_{self.stake}", count)
+
+    async def get_game_state(self, key, game_id):
+        val = await self.redis_client.get(f"game_state_{game_id}_{key}")
         return json.loads(val) if val else None
 
-    def set_game_state(self, key, value, game_id):
-        game_id = game_id
-        self.redis_client.set(f"game_state_{game_id}_{key}", json.dumps(value))
+    async def set_game_state(self, key, value, game_id):
+        await self.redis_client.set(f"game_state_{game_id}_{key}", json.dumps(value))
 
-    def get_stake_state(self, key):
-        val = self.redis_client.get(f"stake_state_{self.stake}_{key}")
+    async def get_stake_state(self, key):
+        val = await self.redis_client.get(f"stake_state_{self.stake}_{key}")
         return json.loads(val) if val else None
 
-    def set_stake_state(self, key, value):
-        self.redis_client.set(f"stake_state_{self.stake}_{key}", json.dumps(value))
+    async def set_stake_state(self, key, value):
+        await self.redis_client.set(f"stake_state_{self.stake}_{key}", json.dumps(value))
 
-    def get_bingo_page_users(self):
-        data = self.redis_client.get(f"bingo_page_users_{self.stake}")
+    async def get_bingo_page_users(self):
+        data = await self.redis_client.get(f"bingo_page_users_{self.stake}")
         return set(json.loads(data)) if data else set()
 
-    def set_bingo_page_users(self, users):
-        self.redis_client.set(f"bingo_page_users_{self.stake}", json.dumps(list(users)))
-
-    def end_game(self, game_id):
-        self.set_game_state("is_running", False, game_id=game_id)
-        self.set_stake_state("current_game_id", None)
+    async def set_bingo_page_users(self, users):
+        await self.redis_client.set(f"bingo_page_users_{self.stake}", json.dumps(list(users)))
 
-    def get_all_active_games(self):
-        from .models import Game
-        from django.utils import timezone
-        import json
+    async def end_game(self, game_id):
+        await self.set_game_state("is_running", False, game_id=game_id)
+        await self.set_stake_state("current_game_id", None)
 
+    async def get_all_active_games(self):
+        active_games = {}
         try:
-            active_games = {}
-            stakes = [10, 20, 30, 40, 50, 100, 150, 200]
-            bonus_stakes = {10, 20, 50}  # ✅ Stakes that have bonus
-
-            current_time = timezone.now()
-            current_timestamp = current_time.timestamp()
-
-            for stake in stakes:
-                stake_str = str(stake)
-                stake_key = f"stake_state_{stake}_current_game_id"
-                next_start_key = f"stake_state_{stake}_next_game_start"
-                player_count_key = f"player_count_{stake}"
-
-                current_game_id = self.redis_client.get(stake_key)
-                current_game_id = json.loads(current_game_id) if current_game_id else None
-
-                next_game_start = self.redis_client.get(next_start_key)
-                next_game_start = json.loads(next_game_start) if next_game_start else None
-
-                is_running = (
-                    self.get_game_state("is_running", current_game_id)
-                    if current_game_id
-                    else False
-                )
-
-                # Default bonus flag
-                has_bonus = stake in bonus_stakes
-
-                if is_running and current_game_id:
-                    try:
-                        current_game = Game.objects.get(id=current_game_id)
-                    except Game.DoesNotExist:
-                        active_games[stake_str] = {
-                            "is_running": False,
-                            "remaining_seconds": 0,
-                            "winner_price": 0,
-                            "bonus": has_bonus,
-                        }
-                        continue
-
-                    if current_game.played == "closed":
-                        active_games[stake_str] = {
-                            "is_running": False,
-                            "remaining_seconds": 0,
-                            "winner_price": 0,
-                            "bonus": has_bonus,
-                        }
-                    else:
-                        active_games[stake_str] = {
-                            "is_running": True,
-                            "remaining_seconds": 0,
-                            "winner_price": float(current_game.winner_price),
-                            "bonus": has_bonus,
-                        }
-
-                elif next_game_start and next_game_start > current_timestamp:
-                    remaining = int(next_game_start - current_timestamp)
-                    no_p = int(self.redis_client.get(player_count_key) or 0)
-                    winner = self.calculate_winner_price(no_p, stake)
-
-                    active_games[stake_str] = {
-                        "is_running": False,
-                        "remaining_seconds": remaining,
-                        "winner_price": winner,
-                        "bonus": has_bonus,
-                    }
-                else:
-                    active_games[stake_str] = {
-                        "is_running": False,
-                        "remaining_seconds": 0,
-                        "winner_price": 0,
-                        "bonus": has_bonus,
-                    }
-
+            active_games = await abuild_active_games(self.redis_client, self.calculate_winner_price)
         except Exception as e:
             print(f"Error fetching active games: {e}")
 
@@ -461,66 +366,103 @@ class GameConsumer(WebsocketConsumer):
             return data
 
     def calculate_winner_price(self, no_p, stake):
-        try:
-            no_p = float(no_p)
-            stake = float(stake)
-            winner = no_p * stake
-
-            if winner > 100:
-                winner -= (winner * 0.2)
-
-            # Optional: round to 2 decimal places
-            winner = round(winner, 2)
-
-            return winner
-
-        except (ValueError, TypeError) as e:
-            print(f"Error calculating winner price: {e}")
-            return 0.0
+        return payout.calculate_winner_price(no_p, stake)
 
-    def broadcast_active_games(self):
-        async_to_sync(self.channel_layer.group_send)(
+    async def broadcast_active_games(self):
+        await self.channel_layer.group_send(
             "game_all",
             {
                 "type": "active_game_data",
-                "data": self.get_all_active_games()
+                "data": await self.get_all_active_games()
             }
         )
 
-    # --- Player management ---
-    def add_player(self, player_id, card_id):
+    # --- Database (the only blocking work; runs on the ORM thread) ---
+    @database_sync_to_async
+    def get_game(self, game_id):
+        from game.models import Game
+        try:
+            return Game.objects.get(id=game_id)
+        except Game.DoesNotExist:
+            return None
+
+    @database_sync_to_async
+    def get_user(self, user_id):
         from custom_auth.models import User
+        return User.objects.get(id=user_id)
+
+    @database_sync_to_async
+    def close_expired_game(self, game_id, current_time):
+        """Close a game that has been running for more than 400s; True if it was closed."""
+        from game.models import Game
+        try:
+            current_game = Game.objects.get(id=game_id)
+        except Game.DoesNotExist:
+            print(f"Game {game_id} not found.")
+            return False
+        if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400:
+            # Game expired
+            current_game.played = "closed"
+            current_game.save(update_fields=["played"])
+            return True
+        return False
+
+    @database_sync_to_async
+    def create_game(self, selected_players):
+        from game.models import Game
+
+        player_card_map = {str(p['user']): p['card'] for p in selected_players}
+        return Game.objects.create(
+            stake=self.stake,
+            numberofplayers=sum(len(c) for c in player_card_map.values()),
+            playerCard=player_card_map,
+            random_numbers=json.dumps(self.generate_random_numbers()),
+            winner_price=0,
+            admin_cut=0,
+            created_at=timezone.now(),
+            started_at=timezone.now(),
+            played='Started'
+        )
+
+    @database_sync_to_async
+    def settle_entries(self, game, deduplicated_players):
         from decimal import Decimal
 
-        selected_players = self.get_selected_players()
+        random_player = random_players.get(self.stake)
+        stake_amount = Decimal(game.stake)
 
-        # Remove existing entry for this user (if re-adding)
-        selected_players = [p for p in selected_players if p['user'] != player_id]
+        # One transaction: lock all participants, split wallet/bonus in memory, bulk write
+        updated_player_cards, rejected = charge_entries(deduplicated_players, stake_amount, random_player)
 
-        # Ensure card_id is a list
-        card_ids = card_id if isinstance(card_id, list) else [card_id]
+        # Record user-game participation
+        record_participation(game, updated_player_cards)
 
-        # Get all used card IDs (excluding current user)
-        used_cards = set()
-        for player in selected_players:
-            used_cards.update(player['card'])
+        game.numberofplayers = sum(len(p['card']) for p in updated_player_cards)
+        game.playerCard = updated_player_cards
 
-        # Check if requested cards are already taken
-        conflicting_cards = [cid for cid in card_ids if cid in used_cards]
-        if conflicting_cards:
-            async_to_sync(self.channel_layer.send)(
-                self.channel_name,
-                {
-                    'type': 'error',
-                    'message': f"Card(s) already selected: {conflicting_cards}. Please choose different card(s)."
-                }
-            )
-            return
+        winner_price, game.admin_cut = payout.for_stake(stake_amount).split(game.numberofplayers)
+        game.winner_price = winner_price
+        game.save()
+        return rejected
+
+    @database_sync_to_async
+    def close_game(self, game_id):
+        from game.models import Game
+        game = Game.objects.get(id=game_id)
+        game.played = 'closed'
+        game.save()
+
+    # --- Player management ---
+    async def add_player(self, player_id, card_id):
+        from decimal import Decimal
+
+        # Ensure card_id is a list
+        card_ids = card_id if isinstance(card_id, list) else [card_id]
 
         # User lookup and validation
-        user = User.objects.get(id=player_id)
+        user = await self.get_user(player_id)
         if not user.is_active:
-            async_to_sync(self.channel_layer.send)(
+            await self.channel_layer.send(
                 self.channel_name,
                 {
                     'type': 'error',
@@ -533,7 +475,7 @@ class GameConsumer(WebsocketConsumer):
         available_balance=user.wallet + user.bonus
 
         if available_balance< total_cost:
-            async_to_sync(self.channel_layer.send)(
+            await self.channel_layer.send(
                 self.channel_name,
                 {
                     'type': 'error',
@@ -542,75 +484,81 @@ class GameConsumer(WebsocketConsumer):
             )
             return
 
-        # Add the player to the selection
-        selected_players.append({'user': player_id, 'card': card_ids})
-        self.set_selected_players(selected_players)
-
-        # Update player count
-        player_count = sum(len(p['card']) for p in selected_players)
-        self.set_player_count(player_count)
+        # Reserve the cards; the conflict check and player count update are atomic
+        claimed, conflicting_cards = await self.lobby.claim(player_id, card_ids)
+        if not claimed:
+            await self.channel_layer.send(
+                self.channel_name,
+                {
+                    'type': 'error',
+                    'message': f"Card(s) already selected: {conflicting_cards}. Please choose different card(s)."
+                }
+            )
+            return
 
         # Notify user
-        self.send(text_data=json.dumps({
+        await self.send(text_data=json.dumps({
             "type": "success",
             "message": "card selected!",
             "card_ids": card_ids
         }))
 
         # Notify all players
-        self.broadcast_player_list()
+        await self.broadcast_player_list()
 
-    def remove_player(self, player_id):
-        selected_players = [p for p in self.get_selected_players() if p['user'] != player_id]
-        self.set_selected_players(selected_players)
-        self.set_player_count(sum(len(p['card']) for p in selected_players))
-        self.send(text_data=json.dumps({
+    async def remove_player(self, player_id):
+        await self.lobby.release(player_id)
+        await self.send(text_data=json.dumps({
             "type": "player_removed",
             "user_id": player_id
         }))
-        self.broadcast_player_list()
-
-    def broadcast_player_list(self):
-        async_to_sync(self.channel_layer.group_send)(
-            self.room_group_name,
-            {
-                'type': 'update_player_list',
-                'player_list': self.get_selected_players()
-            }
-        )
-        async_to_sync(self.channel_layer.group_send)(
+        await self.broadcast_player_list()
+
+    async def broadcast_player_list(self):
+        # Coalesced: lobby changes within one window share a single snapshot
+        await lobby_broadcasts.arequest(f"channels:{self.room_group_name}", self._send_lobby_state, redis_client=self.redis_client)
+        await lobby_broadcasts.arequest("channels:game_all", self.broadcast_active_games, redis_client=self.redis_client)
+
+    async def _send_lobby_state(self):
+        snapshot_seq, players = await self.lobby.snapshot()
+        await self.snapshot.set_lobby(await self.idle_game_stat(), players, snapshot_seq)
+
+        # Deltas since the last broadcast; the full list only after a reset
+        from_seq, seq, changes = await self.lobby.take_changes(stream="channels")
+        if changes is None:
+            seq, players = await self.lobby.snapshot()
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    'type': 'update_player_list',
+                    'seq': seq,
+                    'player_list': players
+                }
+            )
+        elif changes:
+            await self.channel_layer.group_send(
+                self.room_group_name,
+                {
+                    'type': 'player_list_delta',
+                    'from_seq': from_seq,
+                    'seq': seq,
+                    'changes': changes
+                }
+            )
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_stat',
-                'number_of_players': self.get_player_count(),
+                'number_of_players': await self.get_player_count(),
                 'stake': self.stake,
-                'remaining_seconds': self.get_remaining_time()
+                'remaining_seconds': await self.get_remaining_time()
             }
         )
 
-        self.broadcast_active_games()
-    
-    def try_adding_random_players(self):
-        from custom_auth.models import RandomPlayer
-        from decimal import Decimal
-
-        from decimal import Decimal, InvalidOperation
-
-        try:
-            # Normalize stake to a Decimal if possible
-            if self.stake is None:
-                return
-
-            try:
-                stake_value = Decimal(self.stake)
-            except (InvalidOperation, TypeError):
-                return
-
-            random_player_config = RandomPlayer.objects.get(on_off=True, stake=stake_value)
-        except RandomPlayer.DoesNotExist:
+    async def try_adding_random_players(self):
+        random_player_config = await database_sync_to_async(random_players.get)(self.stake)
+        if random_player_config is None or not random_player_config.on_off:
             return
-        
-        time.sleep(3)  # Initial delay before adding random players
 
         number_of_players = random_player_config.number_of_players
         # Randomize number of players within range (-6 to +5)
@@ -620,71 +568,64 @@ class GameConsumer(WebsocketConsumer):
         if number_of_players >= 10:
             selection = 2
 
-        for _ in range(number_of_players // selection):  # use integer division
-            selected_players = self.get_selected_players()
-            used_cards = set()
-            next_game_start = self.get_stake_state("next_game_start")
-            current_time = timezone.now()
-
-            if next_game_start < current_time.timestamp():
-                break
+        await self._add_random_player(number_of_players // selection, selection)  # use integer division
 
-            for player in selected_players:
-                used_cards.update(player['card'])
+    async def _add_random_player(self, remaining, selection):
+        # One random player per scheduler tick, every 2 seconds
+        next_game_start = await self.get_stake_state("next_game_start")
+        current_time = timezone.now()
 
-            card_ids = []
-            while len(card_ids) < selection:  # each random player gets `selection` cards
-                new_card_id = random.randint(1, 120)  # Adjust range as needed
-                if new_card_id not in used_cards:
-                    card_ids.append(new_card_id)
-                    used_cards.add(new_card_id)
+        if remaining <= 0 or not next_game_start or next_game_start < current_time.timestamp():
+            return
 
-            selected_players.append({'user': 0, 'card': card_ids})
-            self.set_selected_players(selected_players)
-            self.broadcast_player_list()
-            self.set_player_count(sum(len(p['card']) for p in selected_players))
+        used_cards = await self.lobby.taken_cards()
+        free_cards = [c for c in range(1, 121) if c not in used_cards]  # Adjust range as needed
 
-            time.sleep(2)
+        # Retry a couple of times if a real player grabs one of the picks first
+        for _ in range(3):
+            if len(free_cards) < selection:
+                break
+            card_ids = random.sample(free_cards, selection)  # each random player gets `selection` cards
+            claimed, conflicting_cards = await self.lobby.claim(0, card_ids)
+            if claimed:
+                await self.broadcast_player_list()
+                break
+            free_cards = [c for c in free_cards if c not in conflicting_cards]
 
-        
-    def try_start_game(self):
-        from game.models import Game  # adjust this import if needed
+        async_scheduler.call_later(2, f"random_players:{self.stake}", self._add_random_player, remaining - 1, selection)
 
-        current_game_id = self.get_stake_state("current_game_id")
+    async def try_start_game(self):
+        current_game_id = await self.get_stake_state("current_game_id")
         current_time = timezone.now()
 
-        is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
-        next_game_start = self.get_stake_state("next_game_start")
+        is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
+        next_game_start = await self.get_stake_state("next_game_start")
 
         # ✅ Check if running game has expired
         if is_running and current_game_id:
-            try:
-                current_game = Game.objects.get(id=current_game_id)
-                if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400:
-                    # Game expired
-                    current_game.played = "closed"  # assuming status is a string field
-                    current_game.save(update_fields=["status"])
-                    self.set_game_state("is_running", False, current_game_id)
-                    current_game_id = None
-                    self.set_stake_state("current_game_id", None)
-            except Game.DoesNotExist:
-                print(f"Game {current_game_id} not found.")
+            if await self.close_expired_game(current_game_id, current_time):
+                await self.set_game_state("is_running", False, current_game_id)
+                current_game_id = None
+                await self.set_stake_state("current_game_id", None)
+                await self.snapshot.clear_running()
 
         # 🔁 Re-check if still running after timeout check
-        if current_game_id and self.get_game_state("is_running", current_game_id):
-            self.send(text_data=json.dumps({
+        if current_game_id and await self.get_game_state("is_running", current_game_id):
+            await self.send(text_data=json.dumps({
                 "type": "game_in_progress",
                 "game_id": current_game_id
             }))
             return
 
-        self.broadcast_active_games()
+        await self.broadcast_active_games()
 
         # ✅ Start new game if no future schedule exists or time has passed
         if not next_game_start or next_game_start < current_time.timestamp():
-            self.set_stake_state("next_game_start", current_time.timestamp() + 30)
+            next_game_start = current_time.timestamp() + 30
+            await self.set_stake_state("next_game_start", next_game_start)
+            await self.snapshot.set_countdown(next_game_start)
 
-            async_to_sync(self.channel_layer.group_send)(
+            await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'timer_message',
@@ -692,49 +633,31 @@ class GameConsumer(WebsocketConsumer):
                 }
             )
 
-            self.broadcast_active_games()
+            await self.broadcast_active_games()
 
-            def delayed_start():
-                time.sleep(30)
-                self._start_game_logic()
+            async_scheduler.call_later(30, f"start:{self.stake}", self._start_game_logic)
+            # Initial delay before adding random players
+            async_scheduler.call_later(3, f"random_players:{self.stake}", self.try_adding_random_players)
 
-            threading.Thread(target=delayed_start, daemon=True).start()
-            threading.Thread(target=self.try_adding_random_players, daemon=True).start()
-
-    def _start_game_logic(self):
-        from game.models import Game
-        from django.utils import timezone
-
-        selected_players = self.get_selected_players()
+    async def _start_game_logic(self):
+        selected_players = await self.get_selected_players()
         if not selected_players or len(selected_players) < 2:
-            async_to_sync(self.channel_layer.group_send)(
+            await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'error',
                     'message': 'Not enough players selected. Cannot start game.'
                 }
             )
-            self.try_start_game()
+            await self.try_start_game()
             return
 
-        player_card_map = {str(p['user']): p['card'] for p in selected_players}
-        new_game = Game.objects.create(
-            stake=self.stake,
-            numberofplayers=sum(len(c) for c in player_card_map.values()),
-            playerCard=player_card_map,
-            random_numbers=json.dumps(self.generate_random_numbers()),
-            winner_price=0,
-            admin_cut=0,
-            created_at=timezone.now(),
-            started_at=timezone.now(),
-            played='Started'
-        )
-        new_game.save()
+        new_game = await self.create_game(selected_players)
 
-        self.set_game_state("is_running", True, game_id=new_game.id)
-        self.set_stake_state("current_game_id", new_game.id)
+        await self.set_game_state("is_running", True, game_id=new_game.id)
+        await self.set_stake_state("current_game_id", new_game.id)
 
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_started',
@@ -744,89 +667,10 @@ class GameConsumer(WebsocketConsumer):
             }
         )
 
-        threading.Thread(
-            target=self.start_game_with_random_numbers,
-            args=(new_game, selected_players),
-            daemon=True
-        ).start()
-
-    # # --- Automatic Game Loop ---
-    # def auto_game_start_loop(self):
-    #     while True:
-    #         selected_players = self.get_selected_players()
-    #         player_count = self.get_player_count()
-    #         active_games = self.get_active_games()
-
-    #         print(f"Checking game start conditions: {player_count} players, {len(active_games)} active games")
-    #         if len(active_games) < 2:
-    #             from game.models import Game  # ✅ Make sure it's the correct path
-    #             from django.utils import timezone
-
-    #             self.set_stake_state("next_game_start", timezone.now().timestamp() + 30)
-
-    #             async_to_sync(self.channel_layer.group_send)(
-    #                 self.room_group_name,
-    #                 {
-    #                     'type': 'timer_message',
-    #                     'remaining_seconds': 30,
-    #                 }
-    #             )
-
-    #             time.sleep(30)  # Wait before checking again
-
-    #             print("Starting a new game with selected players:", selected_players)
-    #             # Build the playerCard map: {user_id: [card_ids]}
-    #             player_card_map = {
-    #                 str(p['user']): p['card'] for p in selected_players
-    #             }
-
-    #             # Calculate number of cards
-    #             number_of_cards = sum(len(c) for c in player_card_map.values())
-
-    #             # Create game in DB
-    #             new_game = Game.objects.create(
-    #                 stake=self.stake,
-    #                 numberofplayers=number_of_cards,
-    #                 playerCard=player_card_map,
-    #                 random_numbers=json.dumps(self.generate_random_numbers()),
-    #                 winner_price=0,  # Can be updated later
-    #                 admin_cut=0,     # Can be calculated
-    #                 created_at=timezone.now(),
-    #                 started_at=timezone.now(),
-    #                 played='Started'
-    #             )
-    #             new_game.save()
-    #             print(f"New game created with ID: {new_game.id} and stake: {self.stake}")
-
-    #             # Add game_id to Redis active games
-    #             active_games.append(new_game.id)
-    #             self.set_active_games(active_games)
-
-    #             # Broadcast the game start
-    #             async_to_sync(self.channel_layer.group_send)(
-    #                 self.room_group_name,
-    #                 {
-    #                     'type': 'game_started',
-    #                     'game_id': new_game.id,
-    #                     'player_list': selected_players,
-    #                     'stake': self.stake
-    #                 }
-    #             )
-
-    #             print(f"Starting game with ID: {new_game.id} and players: {selected_players}")
-    #             threading.Thread(
-    #                 target=self.start_game_with_random_numbers,
-    #                 args=(new_game, selected_players),
-    #                 daemon=True
-    #             ).start()
-    #             print(f"Game thread started for game ID: {new_game.id}")
-    #             # Reset players for new cycle
-    #             self.set_selected_players([])
-    #             self.set_player_count(0)
-    #             self.broadcast_player_list()
-
-    def get_remaining_time(self):
-        next_start_ts = self.get_stake_state("next_game_start")
+        async_scheduler.spawn(f"draw:{new_game.id}", self.start_game_with_random_numbers, new_game, selected_players)
+
+    async def get_remaining_time(self):
+        next_start_ts = await self.get_stake_state("next_game_start")
         if not next_start_ts:
             return 0
         now = time.time()
@@ -842,22 +686,15 @@ class GameConsumer(WebsocketConsumer):
             numbers[i], numbers[j] = numbers[j], numbers[i]
         return numbers
 
-    def start_game_with_random_numbers(self, game, selected_players):
-        from custom_auth.models import User, RandomPlayer
-        from decimal import Decimal
-        import json
-        from game.models import Game, UserGameParticipation  # ✅ Import new model
-
+    async def start_game_with_random_numbers(self, game, selected_players):
         self.game_id = game.id
-        self.set_game_state("is_running", True, game.id)
-        self.set_game_state("bingo", False, game.id)
+        await self.set_game_state("is_running", True, game.id)
+        await self.set_game_state("bingo", False, game.id)
 
         game.played = 'Playing'
-        game.save()
-
-        random_player = RandomPlayer.objects.filter(stake=Decimal(self.stake)).first()
+        await database_sync_to_async(game.save)()
 
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'playing',
@@ -866,8 +703,6 @@ class GameConsumer(WebsocketConsumer):
             }
         )
 
-        stake_amount = Decimal(game.stake)
-        updated_player_cards = []
         unique_entries = {}
 
         # Remove duplicate users: keep only last submitted entry per user
@@ -887,91 +722,13 @@ class GameConsumer(WebsocketConsumer):
             entry for key, entry in unique_entries.items() if key != "zero_users"
         ]
 
-        for entry in deduplicated_players:
-            try:
-                if str(entry["user"]) == "0" or int(entry["user"]) == 0:
-                    cards = entry["card"]
-                    flat_cards = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
-                    total_deduction = stake_amount * len(flat_cards)
-                    random_player.wallet -= total_deduction
-                    random_player.save(update_fields=['wallet'])
-                else:
-                    user_id = entry["user"]
-                    cards = entry["card"]
-                    flat_cards = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
-                    total_deduction = stake_amount * len(flat_cards)
-                    user = User.objects.get(id=user_id)
-
-                    # ✅ STEP 1: Check combined balance (wallet + bonus)
-                    available_balance = user.wallet + user.bonus
-                    if available_balance < total_deduction:
-                        self.remove_player(user_id)
-                        continue
-
-                    # ✅ STEP 2: Deduct from wallet first
-                    remaining = total_deduction
-                    if user.wallet >= remaining:
-                        user.wallet -= remaining
-                        remaining = Decimal('0')
-                    else:
-                        remaining -= user.wallet
-                        user.wallet = Decimal('0')
-
-                    # ✅ STEP 3: Deduct remaining from bonus
-                    if remaining > 0:
-                        user.bonus -= remaining
-
-                    # ✅ STEP 4: Record user-game participation
-                    participation, created = UserGameParticipation.objects.get_or_create(
-                        user=user,
-                        game=game,
-                        defaults={'times_played': len(flat_cards)}
-                    )
-                    if not created:
-                        participation.times_played = len(flat_cards)
-                        participation.save(update_fields=['times_played'])
-
-                    # ✅ STEP 5: Update user's total games played
-                    try:
-                        user.no_of_games_played = (user.no_of_games_played or 0) + 1
-                    except AttributeError:
-                        print(f"User {user_id} does not have 'no_of_games_played' field, skipping increment.")
-
-                    user.save()
-
-                entry["card"] = flat_cards
-                updated_player_cards.append(entry)
-
+        rejected = await self.settle_entries(game, deduplicated_players)
+        for user_id in rejected:
+            await self.remove_player(user_id)
 
-            except Exception as e:
-                self.remove_player(user_id)
+        bonus_text = payout.for_stake(self.stake or 0).bonus_text(game.numberofplayers)
 
-        game.numberofplayers = sum(len(p['card']) for p in updated_player_cards)
-        game.playerCard = updated_player_cards
-
-        winner_price = stake_amount * game.numberofplayers
-
-        if winner_price >= 100:
-            admin_cut = winner_price * Decimal('0.2')  # 20%
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-        elif 50 <= winner_price < 100:
-            admin_cut = winner_price * Decimal('0.1')  # 10%
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-        else:
-            game.admin_cut = Decimal('0')
-
-        game.winner_price = winner_price
-        game.save()
-
-        stake_value = int(self.stake or 0)
-        if stake_value in [10, 20, 50] and game.numberofplayers >= 10:
-            bonus_text = "10X"
-        else:
-            bonus_text = ""
-
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_stat',
@@ -983,58 +740,80 @@ class GameConsumer(WebsocketConsumer):
                 "is_running": True,
             }
         )
+        running_stat = await self.running_game_stat(game)
+        await self.snapshot.set_running(running_stat)
 
-        time.sleep(5)
+        await asyncio.sleep(5)
         # Broadcast random numbers every 4 seconds
         for num in json.loads(game.random_numbers):
-            is_running = self.get_game_state("is_running", game.id)
-            bingo = self.get_game_state("bingo", game.id)
+            is_running = await self.get_game_state("is_running", game.id)
+            bingo = await self.get_game_state("bingo", game.id)
             if not is_running or bingo:
                 break
 
-            with self.lock:
-                async_to_sync(self.channel_layer.group_send)(
+            async with self.lock:
+                await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         'type': 'random_number',
                         'random_number': num,
-                        'game_id': game.id
+                        'game_id': game.id,
+                        'sent_at': time.time(),
                     }
                 )
 
-                called = self.get_game_state("called_numbers", game.id) or []
+                called = await self.get_game_state("called_numbers", game.id) or []
                 if not isinstance(called, list):
                     called = []
                 called.append(num)
-                self.set_game_state("called_numbers", called, game.id)
+                await self.set_game_state("called_numbers", called, game.id)
+                running_stat["called_numbers"] = called
+                await self.snapshot.set_running(running_stat)
 
-            time.sleep(2)
-            
-            self.checkBingoforRandomPlayers(called, game.id)
+            await asyncio.sleep(2)
 
-            time.sleep(2)
+            await self.checkBingoforRandomPlayers(called, game.id)
 
-        game = Game.objects.get(id=game.id)
-        game.played = 'closed'
-        game.save()
-        self.set_game_state("is_running", False, game.id)
+            await asyncio.sleep(2)
+
+        await self.close_game(game.id)
+        await self.set_game_state("is_running", False, game.id)
+        await self.snapshot.clear_running()
 
         # Reset selection state
-        self.set_selected_players([])
-        self.set_player_count(0)
-        self.broadcast_player_list()
+        await self.set_selected_players([])
+        await self.set_player_count(0)
+        await self.broadcast_player_list()
         # self.regenerate_all_cards()
-        self.try_start_game()
-    
-    def checkBingoforRandomPlayers(self, calledNumbers, game_id):
-        from game.models import Card, Game
-        from custom_auth.models import RandomPlayer, User
+        await self.try_start_game()
+
+    async def checkBingoforRandomPlayers(self, calledNumbers, game_id):
+        result = await self.settle_random_player_bingo(calledNumbers, game_id)
+        if result is None:
+            return
+
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'result',
+                'data': result,
+                'game_id': int(game_id)
+            }
+        )
+
+        await self.set_game_state("bingo", True, game_id)
+
+    @database_sync_to_async
+    def settle_random_player_bingo(self, calledNumbers, game_id):
+        """Close the game if a random player's card has bingo; returns the result rows or None."""
+        from game.models import Game
+        from custom_auth.models import User
 
         game = Game.objects.get(id=int(game_id))
         selected_players = game.playerCard
 
         if game.winner or game.played == 'closed':
-            return
+            return None
 
         called_numbers_list = calledNumbers + [0]
         game.total_calls = len(called_numbers_list)
@@ -1046,38 +825,17 @@ class GameConsumer(WebsocketConsumer):
             if entry['user'] == 0:  # Random Player
                 player_cards = entry['card']
                 for card_id in player_cards:
-                    try:
-                        card = Card.objects.get(id=card_id)
-                    except Card.DoesNotExist:
+                    if card_catalog.grid(card_id) is None:
                         continue
 
-                    numbers = json.loads(card.numbers)
-                    winning_numbers = self.has_bingo(numbers, called_numbers_list)
+                    winning_numbers = card_catalog.has_bingo(card_id, called_numbers_list)
 
                     if winning_numbers:
                         # Determine bones amount
-                        random_player = RandomPlayer.objects.get(stake=self.stake)
-                        stake = int(self.stake)
-                        bones_amount = 0
-                        if stake in [10, 20, 50] and game.numberofplayers >= 10:
-                            bones = len(called_numbers_list)
-                            if bones <= 5:
-                                multiplier = 10
-                            elif bones == 6:
-                                multiplier = 8
-                            elif bones == 7:
-                                multiplier = 6
-                            elif bones == 8:
-                                multiplier = 4
-                            elif bones == 9:
-                                multiplier = 3
-                            elif bones == 10:
-                                multiplier = 2
-                            elif bones == 11:
-                                multiplier = 1
-                            else:
-                                multiplier = 0
-                            bones_amount = stake * multiplier
+                        random_player = random_players.get(self.stake)
+                        if random_player is None:
+                            continue
+                        bones_amount = payout.for_stake(self.stake).bonus(len(called_numbers_list), game.numberofplayers, "channels")
 
                         # Check all real players for bingo
                         winners = self.check_bingo_for_all_players(game, called_numbers_list)
@@ -1092,13 +850,11 @@ class GameConsumer(WebsocketConsumer):
 
                         for w in winners:
                             if w['user_id'] == 0:
-                                random_player.wallet += split_amount
+                                add_to_house_wallet(random_player.pk, split_amount)
                                 random_ids = [217, 72, 173, 1, 170]
                                 random_id = random.choice(random_ids)
 
                                 winner_ids.append(random_id)
-                                
-                                random_player.save()
                                 result.append({
                                     'user_id': random_id,
                                     'name': random_name,
@@ -1112,7 +868,7 @@ class GameConsumer(WebsocketConsumer):
                                 winner_user = User.objects.get(id=w['user_id'])
                                 winner_user.wallet += split_amount
                                 winner_user.save()
-                                winner_ids.append(w['user_id'])                                  
+                                winner_ids.append(w['user_id'])
                                 result.append({
                                     'user_id': winner_user.id,
                                     'name': winner_user.name,
@@ -1124,62 +880,49 @@ class GameConsumer(WebsocketConsumer):
                                 })
 
                         # Close game and save the actual caller's info
-                        
+
                         game.played = "closed"
                         game.winner = winner_ids
                         game.winner_name = random_name
-                        game.winner_card = card.id
+                        game.winner_card = card_id
                         game.bonus = bones_amount
                         game.save()
+                        return result
 
-                        async_to_sync(self.channel_layer.group_send)(
-                            self.room_group_name,
-                            {
-                                'type': 'result',
-                                'data': result,
-                                'game_id': game.id
-                            }
-                        )
-
-                        self.set_game_state("bingo", True, game.id)
-                        return
+        return None
 
      # NEW HELPER: Update consecutive losses after game ends with a winner
     def update_consecutive_losses_after_game(self, game_id, winner_user_id):
-            from custom_auth.models import User
-            from game.models import UserGameParticipation
-
-            # Get all user IDs who participated in this game
-            participant_user_ids = UserGameParticipation.objects.filter(game_id=game_id).values_list('user_id',
-                                                                                                     flat=True)
-            for user_id in participant_user_ids:
-                try:
-                    user = User.objects.get(id=user_id)
-            
-                    # Ensure defaults for safety
-                    if user.consecutive_losses is None:
-                        user.consecutive_losses = 0
-                    if user.bonus is None:
-                        user.bonus = 0
-            
-                    if user_id == winner_user_id:
-                        # Winner: reset loss streak
-                        user.consecutive_losses = 0
-                        user.save(update_fields=['consecutive_losses'])
-                    else:
-                        user.consecutive_losses += 1
-                        if user.consecutive_losses >= 10:
-                            user.bonus += 10
-                            user.consecutive_losses = 0
-                            user.save(update_fields=['bonus', 'consecutive_losses'])
-                        else:
-                            user.save(update_fields=['consecutive_losses'])
-            
-                except User.DoesNotExist:
-                    continue
-
-    def checkBingo(self, user_id, calledNumbers, game_id):
-        from game.models import Card, Game
+        from game.models import UserGameParticipation
+
+        participant_ids = UserGameParticipation.objects.filter(game_id=game_id).values_list('user_id', flat=True)
+        settle_consecutive_losses(participant_ids, winner_user_id)
+
+    async def checkBingo(self, user_id, calledNumbers, game_id):
+        outcome = await self.settle_bingo_claim(user_id, calledNumbers, game_id)
+        if outcome is None:
+            return
+
+        to_room, result, game_id = outcome
+        message = {
+            'type': 'result',
+            'data': result,
+            'game_id': game_id
+        }
+        if to_room:
+            await self.channel_layer.group_send(self.room_group_name, message)
+            await self.set_game_state("bingo", True, game_id)
+        else:
+            await self.send(text_data=json.dumps(message))
+
+    @database_sync_to_async
+    def settle_bingo_claim(self, user_id, calledNumbers, game_id):
+        """
+        Check a player's claim and pay the winners.  Returns
+        ``(to_room, result, game_id)``: the result goes to the whole room when
+        the game was won, else only to the caller; None sends nothing.
+        """
+        from game.models import Game
         from custom_auth.models import User
 
         game = Game.objects.get(id=int(game_id))
@@ -1193,12 +936,7 @@ class GameConsumer(WebsocketConsumer):
         if not player_cards:
             # User does not have any cards associated
             result.append({'user_id': user_id, 'message': 'Not a Player'})
-            self.send(text_data=json.dumps({
-                'type': 'result',
-                'data': result,
-                'game_id': game.id,
-            }))
-            return
+            return False, result, game.id
 
         # Flatten it safely
         def flatten(lst):
@@ -1211,10 +949,10 @@ class GameConsumer(WebsocketConsumer):
         user_cards = list(flatten(player_cards))
 
         if game.winner:
-            return
+            return None
 
         if game.played == 'closed':
-            return
+            return None
 
             # Include a zero at the end of the called numbers (for "free space" if applicable)
         # if not set(calledNumbers).issubset(self.get_game_state("called_numbers",game.id) or []):
@@ -1226,58 +964,23 @@ class GameConsumer(WebsocketConsumer):
         game.save_called_numbers(called_numbers_list)
         game.save()
 
-        def flatten_card_ids(card_list):
-            """Recursively flatten card IDs to handle any nested lists."""
-            flattened = []
-            for card in card_list:
-                if isinstance(card, list):
-                    flattened.extend(flatten_card_ids(card))
-                else:
-                    flattened.append(int(card))
-            return flattened
-
-        # Fetch the Card objects
-        cards = Card.objects.filter(id__in=user_cards)
-
         # Loop through all the cards assigned to the user
-        for card in cards:
-            numbers = json.loads(card.numbers)
+        called = patterns.called_mask(called_numbers_list)
+        for card_id in sorted({int(c) for c in user_cards}):
+            if card_catalog.grid(card_id) is None:
+                continue
             # Check if this card has a Bingo with the called numbers
-            winning_numbers = self.has_bingo(numbers, called_numbers_list)
+            winning_numbers = card_catalog.has_bingo(card_id, called)
 
             if winning_numbers:
 
                 if game.played == "closed":
-                    return
+                    return None
 
                 # ---- CHECK ALL PLAYERS ----
                 winners = self.check_bingo_for_all_players(game, called_numbers_list)
 
-                # Get stake amount (assuming game.stake or similar field exists)
-                stake = game.stake
-                bones_amount = 0
-
-                if stake in [10, 20, 50] and game.numberofplayers >= 10:
-                    bones = len(called_numbers_list)
-
-                    if bones <= 5:
-                        multiplier = 10
-                    elif bones == 6:
-                        multiplier = 8
-                    elif bones == 7:
-                        multiplier = 6
-                    elif bones == 8:
-                        multiplier = 4
-                    elif bones == 9:
-                        multiplier = 3
-                    elif bones == 10:
-                        multiplier = 2
-                    elif bones == 11:
-                        multiplier = 1
-                    else:
-                        multiplier = 0
-
-                    bones_amount = stake * multiplier
+                bones_amount = payout.for_stake(game.stake).bonus(len(called_numbers_list), game.numberofplayers, "off")
 
                 # ---- SPLIT AMOUNT ----
                 total_win = game.winner_price + bones_amount
@@ -1309,21 +1012,10 @@ class GameConsumer(WebsocketConsumer):
                 game.played = "closed"
                 game.winner = winner_ids
                 game.winner_name = user.name
-                game.winner_card = card.id
+                game.winner_card = card_id
                 game.bonus = bones_amount
                 game.save()
-
-                async_to_sync(self.channel_layer.group_send)(
-                    self.room_group_name,
-                    {
-                        'type': 'result',
-                        'data': result,
-                        'game_id': game.id
-                    }
-                )
-
-                self.set_game_state("bingo", True, game.id)
-                return
+                return True, result, game.id
 
 
         # If no Bingo was found for any card
@@ -1333,34 +1025,28 @@ class GameConsumer(WebsocketConsumer):
             'cards_checked': player_cards,
             'called_numbers': called_numbers_list
         })
-        self.send(text_data=json.dumps({
-            'type': 'result',
-            'data': result,
-            'game_id': game.id
-        }))
-    
+        return False, result, game.id
+
     def check_bingo_for_all_players(self, game, called_numbers):
-        from game.models import Card
         from custom_auth.models import User
 
         winners = []
+        called = patterns.called_mask(called_numbers)
 
         for entry in game.playerCard:
             user_id = int(entry['user'])
             card_ids = entry['card']
 
-            cards = Card.objects.filter(id__in=card_ids)
-
-            for card in cards:
-                numbers = json.loads(card.numbers)
-                winning_numbers = self.has_bingo(numbers, called_numbers)
+            for card in card_catalog.cards(card_ids):
+                numbers = card['numbers']
+                winning_numbers = card_catalog.has_bingo(card['id'], called)
 
                 if winning_numbers:
                     if user_id == 0:
                         winners.append({
                             'user_id': 0,
                             'name': 'Random Player',
-                            'card_id': card.id,
+                            'card_id': card['id'],
                             'card': numbers,
                             'winning_numbers': winning_numbers,
                         })
@@ -1370,7 +1056,7 @@ class GameConsumer(WebsocketConsumer):
                         winners.append({
                             'user_id': user.id,
                             'name': user.name,
-                            'card_id': card.id,
+                            'card_id': card['id'],
                             'card': numbers,
                             'winning_numbers': winning_numbers,
                         })
@@ -1379,85 +1065,50 @@ class GameConsumer(WebsocketConsumer):
         return winners
 
     def has_bingo(self, card, called_numbers):
-        winning_columns = 0
-        corner_count = 0
-        winning_numbers = []
-
-        # Check diagonals
-        diagonal2 = [card[i][i] for i in range(len(card))]
-        diagonal1 = [card[i][len(card) - 1 - i] for i in range(len(card))]
-        if all(number in called_numbers for number in diagonal2):
-            winning_numbers.extend([1, 7, 13, 19, 25])
-        if all(number in called_numbers for number in diagonal1):
-            winning_numbers.extend([5, 9, 13, 17, 21])
-
-        # Check rows
-        for row_index, row in enumerate(card):
-            if all(number in called_numbers for number in row):
-                winning_numbers.extend([(row_index * 5) + i + 1 for i in range(5)])
-
-        # Check columns
-        for col in range(len(card[0])):
-            if all(card[row][col] in called_numbers for row in range(len(card))):
-                winning_columns = col + 1
-                winning_numbers.extend([winning_columns + (i * 5) for i in range(5)])
-
-        # Check corners
-        if card[0][0] in called_numbers:
-            corner_count += 1
-        if card[0][4] in called_numbers:
-            corner_count += 1
-        if card[4][0] in called_numbers:
-            corner_count += 1
-        if card[4][4] in called_numbers:
-            corner_count += 1
-
-        if corner_count == 4:
-            winning_numbers.extend([1, 5, 21, 25])
-
-        inner_corner_count = 0
-        # Check the top-left corner (1, 1)
-        if card[1][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the top-right corner (1, 5)
-        if card[1][3] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-left corner (5, 1)
-        if card[3][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-right corner (5, 5)
-        if card[3][3] in called_numbers:
-            inner_corner_count += 1
-
-        if inner_corner_count == 4:
-            winning_numbers.extend([7, 9, 17, 19])
-
-        return winning_numbers
-
-    def block(self, user_id):
-        from game.models import Game
-        current_game_id = self.get_stake_state("current_game_id")
+        return patterns.has_bingo(card, called_numbers)
+
+    async def block(self, user_id):
+        current_game_id = await self.get_stake_state("current_game_id")
         if not current_game_id:
             return
-        last_game = Game.objects.get(id=current_game_id)
+        await self.remove_from_game(current_game_id, user_id)
+
+    @database_sync_to_async
+    def remove_from_game(self, game_id, user_id):
+        from game.models import Game
+        last_game = Game.objects.get(id=game_id)
         players = last_game.playerCard
         updated_list = [item for item in players if int(item['user']) != user_id]
         last_game.playerCard = json.dumps(updated_list)
         last_game.numberofplayers = len(updated_list)
         last_game.save()
 
+    async def send_player_list_snapshot(self):
+        seq, players = await self.lobby.snapshot()
+        await self.send(text_data=json.dumps({
+            'type': 'player_list',
+            'seq': seq,
+            'player_list': players
+        }))
+
     # --- WebSocket Handlers ---
-    def update_player_list(self, event):
-        self.send(text_data=json.dumps({
+    async def update_player_list(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'player_list',
+            'seq': event.get('seq'),
             'player_list': event['player_list']
         }))
 
-    def game_stat(self, event):
-        self.send(text_data=json.dumps({
+    async def player_list_delta(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'player_list_delta',
+            'from_seq': event['from_seq'],
+            'seq': event['seq'],
+            'changes': event['changes']
+        }))
+
+    async def game_stat(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'game_stat',
             'number_of_players': event['number_of_players'],
             'stake': event['stake'],
@@ -1469,42 +1120,43 @@ class GameConsumer(WebsocketConsumer):
             'called_numbers': event.get('called_numbers', [])
         }))
 
-    def game_started(self, event):
-        self.send(text_data=json.dumps({
+    async def game_started(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'game_started',
             'game_id': event['game_id'],
             'player_list': event['player_list'],
             'stake': event['stake']
         }))
 
-    def error(self, event):
-        self.send(text_data=json.dumps({
+    async def error(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'error',
             'message': event['message']
         }))
 
-    def random_number(self, event):
-        self.send(text_data=json.dumps({
+    async def random_number(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'random_number',
             'random_number': event['random_number'],
-            'game_id': event['game_id']
+            'game_id': event['game_id'],
+            'sent_at': event.get('sent_at'),
         }))
 
-    def timer_message(self, event):
-        self.send(text_data=json.dumps({
+    async def timer_message(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'timer_message',
             'remaining_seconds': event['remaining_seconds'],
         }))
 
-    def playing(self, event):
-        self.send(text_data=json.dumps({
+    async def playing(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'playing',
             'game_id': event['game_id'],
             'message': event['message']
         }))
 
-    def game_stats(self, event):
-        self.send(text_data=json.dumps({
+    async def game_stats(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'game_stats',
             'number_of_players': event['number_of_players'],
             'stake': event['stake'],
@@ -1513,21 +1165,21 @@ class GameConsumer(WebsocketConsumer):
             'game_id': event['game_id']
         }))
 
-    def result(self, event):
-        self.send(text_data=json.dumps({
+    async def result(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'result',
             'data': event['data'],
             'game_id': event['game_id']
         }))
 
-    def no_cards(self, event):
-        self.send(text_data=json.dumps({
+    async def no_cards(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'no_cards',
             'message': event['message']
         }))
 
-    def active_game_data(self, event):
-        self.send(text_data=json.dumps({
+    async def active_game_data(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'active_game_data',
             'data': event['data']
         }))
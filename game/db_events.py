@@ -0,0 +1,34 @@
+"""
+Redis Stream carrying row writes from the game engine to dbworker.py.
+
+Events are appended with XADD and read through a consumer group, so nothing
+is lost while no worker is running, every event is acknowledged only after
+its transaction committed, and several workers can share the stream.
+"""
+import json
+import os
+
+import redis
+
+
+DB_EVENTS_STREAM = os.environ.get("DB_EVENTS_STREAM", "game:db_events")
+DB_EVENTS_GROUP = os.environ.get("DB_EVENTS_GROUP", "dbworker")
+# Approximate cap on stream length; keep it well above any expected backlog
+DB_EVENTS_MAXLEN = int(os.environ.get("DB_EVENTS_MAXLEN", 100000))
+
+
+def publish_db_event(redis_client, event_type, data):
+    return redis_client.xadd(
+        DB_EVENTS_STREAM,
+        {"event": json.dumps({"event": event_type, "data": data})},
+        maxlen=DB_EVENTS_MAXLEN,
+        approximate=True,
+    )
+
+
+def ensure_group(redis_client):
+    try:
+        redis_client.xgroup_create(DB_EVENTS_STREAM, DB_EVENTS_GROUP, id="0", mkstream=True)
+    except redis.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
@@ -0,0 +1,268 @@
+"""
+Atomic lobby (card selection) store for one stake or group room.
+
+The selection used to be a single JSON list under ``selected_players_{room}``
+that every add/remove read, edited and wrote back, so two players grabbing
+cards at the same moment could both "win" the same card or overwrite each
+other's entry.  It is now kept in two Redis hashes:
+
+* ``lobby:{room}:players``  entry -> JSON list of card ids
+* ``lobby:{room}:cards``    card id -> owning entry
+
+An entry is the user id for real players and ``0:<first card>`` for random
+players (user 0 may hold several entries).  Claiming and releasing run as Lua
+scripts, so the conflict check, the card reservation and the
+``player_count_{room}`` update happen in one round trip and can never
+interleave with another request.
+
+Every change also bumps ``lobby:{room}:seq`` and appends a delta (cards added
+and removed for one user) to the capped ``lobby:{room}:log`` list.  Clients
+hold a full snapshot tagged with its seq and then apply deltas; a client that
+sees a gap asks for a new snapshot.
+
+``AsyncLobbyStore`` is the same store over a redis.asyncio client, for the
+async Channels consumers.
+"""
+import json
+import os
+
+
+# Deltas kept for clients catching up; anything older needs a full snapshot.
+LOBBY_LOG_SIZE = int(os.environ.get("LOBBY_LOG_SIZE", 500))
+
+# KEYS: players hash, cards hash, player count, seq, log
+# ARGV: entry, cards json, user id, log size, card ids...
+# Returns {1, player_count, seq} on success or {0, conflicting card ids}.
+CLAIM_SCRIPT = """
+local entry = ARGV[1]
+local conflicts = {}
+for i = 5, #ARGV do
+    local owner = redis.call("HGET", KEYS[2], ARGV[i])
+    if owner and owner ~= entry then
+        table.insert(conflicts, ARGV[i])
+    end
+end
+if #conflicts > 0 then
+    return {0, conflicts}
+end
+
+local previous = redis.call("HGET", KEYS[1], entry)
+if previous then
+    for _, card in ipairs(cjson.decode(previous)) do
+        redis.call("HDEL", KEYS[2], tostring(card))
+    end
+end
+for i = 5, #ARGV do
+    redis.call("HSET", KEYS[2], ARGV[i], entry)
+end
+redis.call("HSET", KEYS[1], entry, ARGV[2])
+
+local count = redis.call("HLEN", KEYS[2])
+redis.call("SET", KEYS[3], count)
+
+local seq = redis.call("INCR", KEYS[4])
+redis.call("RPUSH", KEYS[5], '{"seq":' .. seq .. ',"user":' .. ARGV[3]
+    .. ',"added":' .. ARGV[2] .. ',"removed":' .. (previous or "[]") .. '}')
+redis.call("LTRIM", KEYS[5], -tonumber(ARGV[4]), -1)
+return {1, count, seq}
+"""
+
+# KEYS: players hash, cards hash, player count, seq, log
+# ARGV: entry (= user id), log size
+# Returns the new player count.
+RELEASE_SCRIPT = """
+local previous = redis.call("HGET", KEYS[1], ARGV[1])
+if previous then
+    for _, card in ipairs(cjson.decode(previous)) do
+        if redis.call("HGET", KEYS[2], tostring(card)) == ARGV[1] then
+            redis.call("HDEL", KEYS[2], tostring(card))
+        end
+    end
+    redis.call("HDEL", KEYS[1], ARGV[1])
+
+    local seq = redis.call("INCR", KEYS[4])
+    redis.call("RPUSH", KEYS[5], '{"seq":' .. seq .. ',"user":' .. ARGV[1]
+        .. ',"added":[],"removed":' .. previous .. '}')
+    redis.call("LTRIM", KEYS[5], -tonumber(ARGV[2]), -1)
+end
+
+local count = redis.call("HLEN", KEYS[2])
+redis.call("SET", KEYS[3], count)
+return count
+"""
+
+
+def flatten_cards(cards):
+    """Card ids of an entry as ints, whether stored flat or nested."""
+    if not isinstance(cards, list):
+        return [int(cards)]
+    flat = []
+    for item in cards:
+        if isinstance(item, list):
+            flat.extend(flatten_cards(item))
+        else:
+            flat.append(int(item))
+    return flat
+
+
+def _players(entries):
+    return [
+        {"user": int(entry.split(":", 1)[0]), "card": json.loads(cards)}
+        for entry, cards in entries.items()
+    ]
+
+
+def _changes_since(previous, seq, log):
+    changes = [change for change in map(json.loads, log) if previous < change["seq"] <= seq]
+    if len(changes) != seq - previous:
+        return previous, seq, None
+    return previous, seq, changes
+
+
+def _claim_result(result):
+    if result[0]:
+        return True, int(result[1])
+    return False, [int(card_id) for card_id in result[1]]
+
+
+class LobbyStore:
+    def __init__(self, redis_client, room):
+        self.redis_client = redis_client
+        self.room = room
+        self.players_key = f"lobby:{room}:players"
+        self.cards_key = f"lobby:{room}:cards"
+        self.count_key = f"player_count_{room}"
+        self.seq_key = f"lobby:{room}:seq"
+        self.log_key = f"lobby:{room}:log"
+
+    @staticmethod
+    def entry_key(user_id, card_ids):
+        user_id = int(user_id)
+        if user_id == 0:
+            return f"0:{card_ids[0]}"
+        return str(user_id)
+
+    # --- reads ---
+    def get_selected_players(self):
+        """Same ``[{"user", "card"}]`` shape the JSON blob used to hold."""
+        return _players(self.redis_client.hgetall(self.players_key))
+
+    def snapshot(self):
+        """``(seq, players)`` read in one MULTI so the two always match."""
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.get(self.seq_key)
+        pipe.hgetall(self.players_key)
+        seq, entries = pipe.execute()
+        return int(seq or 0), _players(entries)
+
+    def take_changes(self, stream="events"):
+        """
+        Deltas since the last broadcast of this room on ``stream`` (the Twisted
+        pub/sub channel and the Channels group each track their own), as
+        ``(from_seq, seq, changes)``.  ``changes`` is None when the log no
+        longer covers the range (lobby reset or log trimmed): the room then
+        needs a full snapshot.
+        """
+        seq = int(self.redis_client.get(self.seq_key) or 0)
+        previous = int(self.redis_client.getset(f"lobby:{self.room}:flushed:{stream}", seq) or 0)
+        if seq <= previous:
+            return previous, previous, []
+        return _changes_since(previous, seq, self.redis_client.lrange(self.log_key, 0, -1))
+
+    def taken_cards(self):
+        return {int(card_id) for card_id in self.redis_client.hkeys(self.cards_key)}
+
+    def get_player_count(self):
+        return int(self.redis_client.get(self.count_key) or 0)
+
+    # --- atomic updates ---
+    def _claim_args(self, user_id, card_ids):
+        return (
+            CLAIM_SCRIPT, 5, self.players_key, self.cards_key, self.count_key, self.seq_key, self.log_key,
+            self.entry_key(user_id, card_ids), json.dumps(card_ids), int(user_id), LOBBY_LOG_SIZE, *card_ids,
+        )
+
+    def _release_args(self, user_id):
+        return (
+            RELEASE_SCRIPT, 5, self.players_key, self.cards_key, self.count_key, self.seq_key, self.log_key,
+            str(int(user_id)), LOBBY_LOG_SIZE,
+        )
+
+    def claim(self, user_id, card_ids):
+        """
+        Reserve ``card_ids`` for ``user_id``, replacing the user's previous
+        selection.  Returns ``(True, player_count)`` or ``(False, conflicts)``.
+        """
+        card_ids = flatten_cards(card_ids)
+        if not card_ids:
+            return False, []
+        return _claim_result(self.redis_client.eval(*self._claim_args(user_id, card_ids)))
+
+    def release(self, user_id):
+        """Drop a real player's selection; returns the new player count."""
+        return int(self.redis_client.eval(*self._release_args(user_id)))
+
+    def set_selected_players(self, players):
+        """
+        Replace the whole selection (used to reset the lobby between games).
+        The delta log is dropped, so clients get a full snapshot next.
+        """
+        pipe = self.redis_client.pipeline(transaction=True)
+        self._queue_reset(pipe, players)
+        pipe.execute()
+
+    def _queue_reset(self, pipe, players):
+        pipe.delete(self.players_key, self.cards_key, self.log_key)
+        pipe.incr(self.seq_key)
+        count = 0
+        for player in players:
+            card_ids = flatten_cards(player["card"])
+            if not card_ids:
+                continue
+            entry = self.entry_key(player["user"], card_ids)
+            pipe.hset(self.players_key, entry, json.dumps(card_ids))
+            for card_id in card_ids:
+                pipe.hset(self.cards_key, card_id, entry)
+            count += len(card_ids)
+        pipe.set(self.count_key, count)
+
+
+class AsyncLobbyStore(LobbyStore):
+    """``LobbyStore`` over a redis.asyncio client; every method is a coroutine."""
+
+    async def get_selected_players(self):
+        return _players(await self.redis_client.hgetall(self.players_key))
+
+    async def snapshot(self):
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.get(self.seq_key)
+        pipe.hgetall(self.players_key)
+        seq, entries = await pipe.execute()
+        return int(seq or 0), _players(entries)
+
+    async def take_changes(self, stream="events"):
+        seq = int(await self.redis_client.get(self.seq_key) or 0)
+        previous = int(await self.redis_client.getset(f"lobby:{self.room}:flushed:{stream}", seq) or 0)
+        if seq <= previous:
+            return previous, previous, []
+        return _changes_since(previous, seq, await self.redis_client.lrange(self.log_key, 0, -1))
+
+    async def taken_cards(self):
+        return {int(card_id) for card_id in await self.redis_client.hkeys(self.cards_key)}
+
+    async def get_player_count(self):
+        return int(await self.redis_client.get(self.count_key) or 0)
+
+    async def claim(self, user_id, card_ids):
+        card_ids = flatten_cards(card_ids)
+        if not card_ids:
+            return False, []
+        return _claim_result(await self.redis_client.eval(*self._claim_args(user_id, card_ids)))
+
+    async def release(self, user_id):
+        return int(await self.redis_client.eval(*self._release_args(user_id)))
+
+    async def set_selected_players(self, players):
+        pipe = self.redis_client.pipeline(transaction=True)
+        self._queue_reset(pipe, players)
+        await pipe.execute()
@@ -2,6 +2,7 @@ import random
 import json
 from django.core.management.base import BaseCommand
 from game.models import Card
+from game.card_catalog import bump_version
 
 
 def generate_bingo_card():
@@ -59,5 +60,8 @@ class Command(BaseCommand):
         with open("num.txt", "w") as file:
             file.writelines(card_strings)
 
+        # Make running workers reload their in-memory card catalog
+        bump_version()
+
         self.stdout.write(self.style.SUCCESS('Successfully generated and stored 500 unique bingo cards.'))
         self.stdout.write(self.style.SUCCESS('Bingo cards have been saved to num.txt.'))
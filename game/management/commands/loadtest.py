@@ -0,0 +1,282 @@
+"""
+Load test for the game WebSocket servers.
+
+    python manage.py loadtest --url ws://127.0.0.1:9000 --stakes 10,20 --clients 500 \\
+        --duration 120 --server-pid <pid of twisted_ws.py or daphne>
+
+Opens ``--clients`` fake players per stake against twisted_ws.py or the
+Channels GameConsumer (both serve ``/ws/game-socket/<stake>/``), has them pick
+cards, ask for their card data and claim bingo at the given rates, and
+reports connect latency, random_number fan-out latency (from the ``sent_at``
+stamp of the publisher to receipt), numbers a client missed while connected,
+and the server's CPU use.  Run the servers, redis_worker.py and dbworker.py
+against a local Redis and the database this command points at.
+"""
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand
+
+
+# --- stats ---
+def percentiles(values):
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000
+    return (f"p50 {pick(0.50):.1f}ms  p95 {pick(0.95):.1f}ms  p99 {pick(0.99):.1f}ms  "
+            f"max {values[-1] * 1000:.1f}ms  (n={len(values)})")
+
+
+class Stats:
+    def __init__(self):
+        self.connect_latency = []
+        self.connect_failures = 0
+        self.disconnects = 0
+        self.fanout_latency = []
+        self.sent = Counter()
+        self.received = Counter()
+        self.errors = Counter()
+        # (stake, game_id) -> number -> first time any client saw it
+        self.numbers_seen = defaultdict(dict)
+
+    def number(self, stake, game_id, number, received_at):
+        self.numbers_seen[(stake, game_id)].setdefault(number, received_at)
+
+    def dropped(self, clients):
+        """Numbers seen by some client while another client of the same room was connected but missed them."""
+        dropped = 0
+        for client in clients:
+            for game_id, numbers in self.numbers_seen.items():
+                if game_id[0] != client.stake:
+                    continue
+                got = client.numbers.get(game_id[1], set())
+                for number, first_seen in numbers.items():
+                    if client.opened_at <= first_seen <= client.closed_at and number not in got:
+                        dropped += 1
+        return dropped
+
+
+class CpuSampler:
+    """CPU use of one process, from psutil when installed, else /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.samples = []
+        try:
+            import psutil
+            self._process = psutil.Process(pid)
+        except ImportError:
+            self._process = None
+
+    def _cpu_seconds(self):
+        if self._process is not None:
+            times = self._process.cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+    async def run(self, interval=1.0):
+        last_cpu, last_at = self._cpu_seconds(), time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            cpu, now = self._cpu_seconds(), time.monotonic()
+            self.samples.append(100 * (cpu - last_cpu) / (now - last_at))
+            last_cpu, last_at = cpu, now
+
+
+# --- clients ---
+def make_protocol(stats):
+    from autobahn.asyncio.websocket import WebSocketClientProtocol
+
+    class LoadClient(WebSocketClientProtocol):
+        stake = None
+        user_id = None
+
+        def onOpen(self):
+            self.opened_at = time.time()
+            self.closed_at = float("inf")
+            self.numbers = defaultdict(set)  # game_id -> numbers received
+            self.game_id = None
+            stats.connect_latency.append(time.monotonic() - self.factory.started)
+            self.factory.opened.set_result(self)
+
+        def onMessage(self, payload, isBinary):
+            received_at = time.time()
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                stats.errors["invalid_json"] += 1
+                return
+            message_type = message.get("type")
+            stats.received[message_type] += 1
+            if message_type == "random_number":
+                self.game_id = message.get("game_id")
+                self.numbers[self.game_id].add(message["random_number"])
+                stats.number(self.stake, self.game_id, message["random_number"], received_at)
+                if message.get("sent_at"):
+                    stats.fanout_latency.append(received_at - message["sent_at"])
+            elif message_type in ("game_started", "game_in_progress"):
+                self.game_id = message.get("game_id")
+            elif message_type == "error":
+                stats.errors[message.get("message")] += 1
+
+        def onClose(self, wasClean, code, reason):
+            if not self.factory.opened.done():
+                self.factory.opened.set_exception(ConnectionError(reason or "closed during handshake"))
+                return
+            self.closed_at = time.time()
+            if not self.factory.stopping:
+                stats.disconnects += 1
+
+        def send_json(self, data):
+            stats.sent[data["type"]] += 1
+            self.sendMessage(json.dumps(data).encode("utf-8"))
+
+    return LoadClient
+
+
+async def connect(url, stake, user_id, protocol, stats, timeout):
+    from autobahn.asyncio.websocket import WebSocketClientFactory
+
+    parsed = urllib.parse.urlparse(url)
+    factory = WebSocketClientFactory(f"{url.rstrip('/')}/ws/game-socket/{stake}/")
+    factory.protocol = protocol
+    factory.stopping = False
+    factory.opened = asyncio.get_running_loop().create_future()
+    factory.started = time.monotonic()
+    try:
+        await asyncio.wait_for(asyncio.get_running_loop().create_connection(
+            factory, parsed.hostname, parsed.port or (443 if parsed.scheme == "wss" else 80),
+            ssl=parsed.scheme == "wss"), timeout)
+        client = await asyncio.wait_for(factory.opened, timeout)
+    except (OSError, ConnectionError, asyncio.TimeoutError):
+        stats.connect_failures += 1
+        return None
+    client.stake, client.user_id = stake, user_id
+    return client
+
+
+async def act(client, rate, build):
+    """Send ``build(client)`` at an average of ``rate`` messages per second."""
+    while True:
+        await asyncio.sleep(random.expovariate(rate))
+        data = build(client)
+        if data and client.transport and not client.transport.is_closing():
+            client.send_json(data)
+
+
+def select_number(client):
+    return {"type": "select_number", "player_id": client.user_id, "card_id": [random.randint(1, 120)]}
+
+
+def card_data(client):
+    return {"type": "card_data", "userId": client.user_id}
+
+
+def bingo(client):
+    if client.game_id is None:
+        return None
+    return {"type": "bingo", "userId": client.user_id, "gameId": client.game_id,
+            "calledNumbers": sorted(client.numbers.get(client.game_id, ()))}
+
+
+class Command(BaseCommand):
+    help = "Simulate WebSocket players against twisted_ws.py or the Channels GameConsumer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="ws://127.0.0.1:9000")
+        parser.add_argument("--stakes", default="10", help="comma separated, e.g. 10,20,50")
+        parser.add_argument("--clients", type=int, default=100, help="clients per stake")
+        parser.add_argument("--duration", type=float, default=60, help="seconds to run after ramp-up")
+        parser.add_argument("--ramp", type=float, default=200, help="new connections per second")
+        parser.add_argument("--select-rate", type=float, default=0.05, help="select_number per client per second")
+        parser.add_argument("--card-data-rate", type=float, default=0.02, help="card_data per client per second")
+        parser.add_argument("--bingo-rate", type=float, default=0.01, help="bingo claims per client per second")
+        parser.add_argument("--connect-timeout", type=float, default=10)
+        parser.add_argument("--server-pid", type=int, help="sample this process' CPU use")
+        parser.add_argument("--users", type=int, default=0,
+                            help="create (or reuse) this many funded load-test users; player ids cycle over them")
+
+    def handle(self, *args, **options):
+        user_ids = self.load_users(options["users"])
+        if not user_ids:
+            self.stdout.write(self.style.WARNING("No --users given: card selections will be rejected as unknown users."))
+            user_ids = [0]
+        asyncio.run(self.run(options, user_ids))
+
+    def load_users(self, count):
+        from decimal import Decimal
+        from custom_auth.models import User
+
+        user_ids = []
+        for i in range(count):
+            user, _ = User.objects.get_or_create(
+                phone_number=f"load{i:06d}",
+                defaults={"name": f"load {i}", "wallet": Decimal("1000000"), "bonus": Decimal("0")},
+            )
+            user_ids.append(user.id)
+        return user_ids
+
+    async def run(self, options, user_ids):
+        stats = Stats()
+        protocol = make_protocol(stats)
+        stakes = [s.strip() for s in options["stakes"].split(",") if s.strip()]
+        sampler = CpuSampler(options["server_pid"]) if options["server_pid"] else None
+        background = [asyncio.ensure_future(sampler.run())] if sampler else []
+
+        clients = []
+
+        async def join(i):
+            client = await connect(options["url"], stakes[i % len(stakes)], user_ids[i % len(user_ids)],
+                                   protocol, stats, options["connect_timeout"])
+            if client is not None:
+                clients.append(client)
+                for rate, build in ((options["select_rate"], select_number),
+                                    (options["card_data_rate"], card_data),
+                                    (options["bingo_rate"], bingo)):
+                    if rate > 0:
+                        background.append(asyncio.ensure_future(act(client, rate, build)))
+
+        # start connects on the ramp schedule without waiting for earlier ones,
+        # so a slow handshake does not hold back the ones after it
+        started = time.monotonic()
+        total = options["clients"] * len(stakes)
+        joining = []
+        for i in range(total):
+            joining.append(asyncio.ensure_future(join(i)))
+            delay = (i + 1) / options["ramp"] - (time.monotonic() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await asyncio.gather(*joining)
+        self.stdout.write(f"Connected {len(clients)}/{total} clients in {time.monotonic() - started:.1f}s")
+
+        await asyncio.sleep(options["duration"])
+
+        for task in background:
+            task.cancel()
+        for client in clients:
+            client.factory.stopping = True
+            client.sendClose()
+        await asyncio.sleep(1)
+        self.report(stats, clients, sampler)
+
+    def report(self, stats, clients, sampler):
+        write = self.stdout.write
+        write(f"connect latency:  {percentiles(stats.connect_latency)}")
+        write(f"connect failures: {stats.connect_failures}   unexpected disconnects: {stats.disconnects}")
+        write(f"fan-out latency:  {percentiles(stats.fanout_latency)}")
+        write(f"dropped numbers:  {stats.dropped(clients)} over {len(stats.numbers_seen)} game(s)")
+        write(f"sent:     {dict(stats.sent)}")
+        write(f"received: {dict(stats.received)}")
+        if stats.errors:
+            write(f"errors:   {dict(stats.errors.most_common(10))}")
+        if sampler and sampler.samples:
+            write(f"server CPU: avg {sum(sampler.samples) / len(sampler.samples):.0f}%  "
+                  f"max {max(sampler.samples):.0f}%")
@@ -4,56 +4,62 @@ from django.core.management import BaseCommand
 from django.db import transaction
 
 from custom_auth.models import User
-from game.models import Game, UserGameParticipation
+from game.models import Game
+from game.settlement import participation_rows, upsert_participation
 
 
 class Command(BaseCommand):
     help="Migrate legacy playerCard data to UserGameParticipation "
 
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000,
+                            help="games read and participation rows written per batch")
+
     def handle(self, *args, **options):
-        closed_games=Game.objects.filter(played='closed')
+        chunk_size=options["chunk_size"]
+        closed_games=Game.objects.filter(played='closed').only('id', 'playerCard').order_by('id')
         self.stdout.write(f"Found {closed_games.count()} closed games to migrate...")
 
         migrated=0
         errors=0
+        chunk=[]
+
+        # stream the games instead of loading the whole table
+        for game in closed_games.iterator(chunk_size=chunk_size):
+            players=game.playerCard
+            if not players:
+                continue
+            if isinstance(players,str):
+                try:
+                    players=json.loads(players)
+                except ValueError:
+                    players=None
 
-        for game in closed_games:
-            try:
-                if not game.playerCard:
-                    continue
-                if isinstance(game.playerCard,str):
-                    players=json.loads(game.playerCard)
-                else:
-                    players=game.playerCard
-
-                if not isinstance(players,list):
-                    self.stderr.write(f"Invalid playerCard format in game {game.id}: {game.playerCard}")
-                    errors+=1
-                    continue
-                with transaction.atomic():
-                    for entry in players:
-                        if not isinstance(entry,dict):
-                            continue
-                        user_id=entry.get('user')
-                        if not user_id:
-                            continue
-                        try:
-                            user=User.objects.get(id=user_id)
-                        except User.DoesNotExist:
-                            self.stderr.write(f"User {user_id} not found for {game.id}")
-
-                        participation, created=UserGameParticipation.objects.get_or_create(
-                            user=user,
-                            game=game,
-                            defaults={'times_played':1}
-
-                        )
-                        if created:
-                            migrated+=1
-            except Exception as e:
-                self.stderr.write(f"Error migrating game {game.id}: {e}")
+            if not isinstance(players,list):
+                self.stderr.write(f"Invalid playerCard format in game {game.id}: {game.playerCard}")
                 errors+=1
+                continue
+
+            chunk.extend(participation_rows(game, players))
+            if len(chunk)>=chunk_size:
+                migrated+=self.write(chunk)
+                chunk=[]
+
+        if chunk:
+            migrated+=self.write(chunk)
+
         self.stdout.write(
-            self.style.SUCCESS(f"Migration completed: {migrated} participations created, {errors} errors.")
+            self.style.SUCCESS(f"Migration completed: {migrated} participations written, {errors} errors.")
 
         )
+
+    def write(self, rows):
+        # rows of deleted users would fail the foreign key
+        known=set(User.objects.filter(id__in={row.user_id for row in rows}).values_list('id', flat=True))
+        for row in rows:
+            if row.user_id not in known:
+                self.stderr.write(f"User {row.user_id} not found for {row.game_id}")
+        rows=[row for row in rows if row.user_id in known]
+        with transaction.atomic():
+            upsert_participation(rows)
+        return len(rows)
@@ -2,6 +2,7 @@ import random
 import json
 from django.core.management.base import BaseCommand
 from game.models import Card
+from game.card_catalog import bump_version
 
 
 def generate_bingo_card():
@@ -43,4 +44,7 @@ class Command(BaseCommand):
             card_obj.numbers = card_json
             card_obj.save(update_fields=["numbers"])
 
+        # Make running workers reload their in-memory card catalog
+        bump_version()
+
         self.stdout.write(self.style.SUCCESS(f"Successfully updated {total_cards} bingo cards."))
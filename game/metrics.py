@@ -0,0 +1,140 @@
+"""
+Per-hop timing of client commands and game events, in Prometheus text format.
+
+A command is stamped with a trace (``{"id", "type", "received"}``) when
+twisted_ws.py receives it.  redis_worker.py records how long it waited in the
+command stream and how long its handler ran, and every event published while
+the handler runs carries the same trace plus a ``published`` stamp.  Events
+published outside a command (draws, countdowns) only carry ``published``.
+twisted_ws.py then records the Redis hop, the time spent writing the event to
+the room, and for traced events the whole round trip.
+
+Stamps are wall-clock (``time.time()``) seconds, since they are compared
+across processes; keep the hosts' clocks in sync.  Durations measured inside
+one process use ``time.perf_counter()``.
+
+Both processes serve ``render()`` on ``/metrics``; see ``serve()`` for the
+worker and twisted_ws.py for the server.
+"""
+import bisect
+import contextvars
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+
+# seconds; the last bucket is +Inf
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Commands redis_worker.handle_command knows; the type label of anything else
+# is "other", so a client cannot mint new series by sending made-up types.
+COMMAND_TYPES = frozenset({
+    "select_number", "remove_number", "bingo", "card_data", "get_stake_stat",
+    "player_list_sync", "block_user", "fetch_active_game", "request_game_start",
+})
+
+# Trace of the command being handled in this thread (None outside a command)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def command_label(command_type):
+    if isinstance(command_type, str) and command_type in COMMAND_TYPES:
+        return command_type
+    return "other"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, name, description, labels=("type", "stake"), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for key, values in sorted(series.items()):
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+# --- worker (redis_worker.py) ---
+queue_delay = Histogram("bingo_command_queue_seconds", "Time from the WebSocket server to the worker picking the command up")
+handler_time = Histogram("bingo_command_handler_seconds", "Time the worker spent handling a command")
+# --- WebSocket server (twisted_ws.py) ---
+event_delay = Histogram("bingo_event_delivery_seconds", "Time from publishing an event to the WebSocket server receiving it")
+fanout_time = Histogram("bingo_event_fanout_seconds", "Time spent writing one event to its recipients")
+round_trip = Histogram("bingo_command_round_trip_seconds", "Time from receiving a command to receiving the events it caused")
+
+
+def render():
+    lines = []
+    for histogram in REGISTRY:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- traces ---
+def new_trace(command_type):
+    return {"id": uuid.uuid4().hex, "type": command_label(command_type), "received": time.time()}
+
+
+def stamp(payload):
+    """Attach the current command's trace and a ``published`` stamp to an event payload."""
+    trace = dict(current_trace.get() or {})
+    trace["published"] = time.time()
+    payload["trace"] = trace
+    return payload
+
+
+# --- /metrics for processes without a web server ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port, host=METRICS_HOST):
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
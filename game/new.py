@@ -6,6 +6,8 @@ from channels.generic.websocket import WebsocketConsumer
 from asgiref.sync import async_to_sync
 import redis
 
+from game import patterns
+
 
 class GameConsumer(WebsocketConsumer):
     def __init__(self, *args, **kwargs):
@@ -581,46 +583,8 @@ class GameConsumer(WebsocketConsumer):
 
 
     def has_bingo(self, card, called_numbers):
-        winning_columns = 0
-        corner_count = 0
-        winning_numbers = []
-
-        print("Checking card for Bingo:", card)
-        print("Called numbers:", called_numbers)
-
-        # Check diagonals
-        diagonal2 = [card[i][i] for i in range(len(card))]
-        diagonal1 = [card[i][len(card) - 1 - i] for i in range(len(card))]
-        if all(number in called_numbers for number in diagonal2):
-            winning_numbers.extend([1, 7, 13, 19, 25])
-        if all(number in called_numbers for number in diagonal1):
-            winning_numbers.extend([5, 9, 13, 17, 21])
-
-        # Check rows
-        for row_index, row in enumerate(card):
-            if all(number in called_numbers for number in row):
-                winning_numbers.extend([(row_index * 5) + i + 1 for i in range(5)])
-
-        # Check columns
-        for col in range(len(card[0])):
-            if all(card[row][col] in called_numbers for row in range(len(card))):
-                winning_columns = col + 1
-                winning_numbers.extend([winning_columns + (i * 5) for i in range(5)])
-
-        # Check corners
-        if card[0][0] in called_numbers:
-            corner_count += 1
-        if card[0][4] in called_numbers:
-            corner_count += 1
-        if card[4][0] in called_numbers:
-            corner_count += 1
-        if card[4][4] in called_numbers:
-            corner_count += 1
-
-        if corner_count == 4:
-            winning_numbers.extend([1, 5, 21, 25])
-
-        return winning_numbers
+        # This consumer never paid out on the inner corners pattern.
+        return patterns.has_bingo(card, called_numbers, patterns.LINE_PATTERNS + (patterns.CORNERS,))
 
     def block(self, user_id):
         from game.models import Game
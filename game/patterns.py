@@ -0,0 +1,158 @@
+"""
+Bitmask bingo pattern engine shared by every game/group consumer.
+
+A card is a 5x5 grid; cell (row, col) is bit ``row * 5 + col`` of a 25-bit
+position mask.  Called numbers (0 = free space, 1..75 = balls) are kept as a
+76-bit integer, so "is this number called" is a shift and an AND instead of a
+list scan.  Each pattern is a precomputed position mask together with the
+1-based cell positions the clients expect in ``winning_numbers``.
+"""
+
+FREE_SPACE = 0
+MAX_NUMBER = 75
+
+
+def _bit(row, col):
+    return 1 << (row * 5 + col)
+
+
+def _pattern(cells):
+    mask = 0
+    for row, col in cells:
+        mask |= _bit(row, col)
+    positions = tuple(row * 5 + col + 1 for row, col in cells)
+    return mask, positions
+
+
+# Order matters: winning_numbers is built in this order, same as the old
+# has_bingo implementations (diagonals, rows, columns, corners, inner corners).
+DIAGONALS = (
+    _pattern([(i, i) for i in range(5)]),
+    _pattern([(i, 4 - i) for i in range(5)]),
+)
+ROWS = tuple(_pattern([(row, col) for col in range(5)]) for row in range(5))
+COLUMNS = tuple(_pattern([(row, col) for row in range(5)]) for col in range(5))
+CORNERS = _pattern([(0, 0), (0, 4), (4, 0), (4, 4)])
+INNER_CORNERS = _pattern([(1, 1), (1, 3), (3, 1), (3, 3)])
+
+LINE_PATTERNS = DIAGONALS + ROWS + COLUMNS
+PATTERNS = LINE_PATTERNS + (CORNERS, INNER_CORNERS)
+
+
+def card_number_masks(card):
+    """Map every number on a 5x5 card to the position mask of its cell(s)."""
+    masks = {}
+    for row_index, row in enumerate(card):
+        for col_index, number in enumerate(row):
+            number = int(number)
+            masks[number] = masks.get(number, 0) | _bit(row_index, col_index)
+    return masks
+
+
+def called_mask(called_numbers):
+    """Pack called numbers into a 76-bit integer (bit n set = number n called)."""
+    mask = 0
+    for number in called_numbers:
+        number = int(number)
+        if 0 <= number <= MAX_NUMBER:
+            mask |= 1 << number
+    return mask
+
+
+def hit_mask(number_masks, called):
+    """Position mask of the cells on a card whose number is in ``called``."""
+    hits = 0
+    for number, positions in number_masks.items():
+        if called >> number & 1:
+            hits |= positions
+    return hits
+
+
+def matched_patterns(hits, patterns=PATTERNS):
+    """Return the patterns fully covered by the ``hits`` position mask."""
+    return [pattern for pattern in patterns if hits & pattern[0] == pattern[0]]
+
+
+def winning_positions(hits, patterns=PATTERNS):
+    """Flatten the positions of every completed pattern, in pattern order."""
+    winning_numbers = []
+    for _, positions in matched_patterns(hits, patterns):
+        winning_numbers.extend(positions)
+    return winning_numbers
+
+
+def has_bingo(card, called_numbers, patterns=PATTERNS):
+    """
+    Drop-in replacement for the old ``has_bingo`` methods.
+
+    ``card`` is the 5x5 grid (or a precomputed ``card_number_masks`` dict) and
+    ``called_numbers`` an iterable of numbers or an already packed mask.
+    Returns the list of winning cell positions (empty when there is no bingo).
+    """
+    number_masks = card if isinstance(card, dict) else card_number_masks(card)
+    called = called_numbers if isinstance(called_numbers, int) else called_mask(called_numbers)
+    return winning_positions(hit_mask(number_masks, called), patterns)
+
+
+# Indices into PATTERNS of every pattern a cell belongs to, and how many cells
+# each pattern needs; used by GameTracker to touch only the affected lines.
+PATTERNS_BY_CELL = tuple(
+    tuple(index for index, (mask, _) in enumerate(PATTERNS) if mask >> cell & 1)
+    for cell in range(25)
+)
+PATTERN_SIZES = tuple(len(positions) for _, positions in PATTERNS)
+
+
+class GameTracker:
+    """
+    Incremental bingo state for the cards of one running game.
+
+    Built once at game start from ``{card_id: card_number_masks}``; an inverted
+    index maps every number to the (card, cell) pairs holding it, so calling a
+    number only updates the line counters of the cards that contain it.
+    A card is reported the moment one of its line counters reaches the
+    pattern size.
+    """
+
+    def __init__(self, cards, owners=None):
+        self.owners = owners or {}
+        self.called = 0
+        self.hits = {}
+        self.counters = {}
+        self.completed = []  # card ids in the order they first completed a pattern
+        self.index = {}
+        for card_id, number_masks in cards.items():
+            self.hits[card_id] = 0
+            self.counters[card_id] = [0] * len(PATTERNS)
+            for number, positions in number_masks.items():
+                for cell in range(25):
+                    if positions >> cell & 1:
+                        self.index.setdefault(number, []).append((card_id, cell))
+
+    def call(self, number):
+        """Mark ``number`` as called; return the cards it completed a pattern on."""
+        number = int(number)
+        if self.called >> number & 1:
+            return []
+        self.called |= 1 << number
+
+        newly_completed = []
+        for card_id, cell in self.index.get(number, ()):
+            self.hits[card_id] |= 1 << cell
+            counters = self.counters[card_id]
+            for pattern in PATTERNS_BY_CELL[cell]:
+                counters[pattern] += 1
+                if counters[pattern] == PATTERN_SIZES[pattern] and card_id not in newly_completed:
+                    newly_completed.append(card_id)
+
+        for card_id in newly_completed:
+            if card_id not in self.completed:
+                self.completed.append(card_id)
+        return newly_completed
+
+    def completed_for(self, owner):
+        """Completed card ids belonging to ``owner`` (e.g. 0 for random players)."""
+        return [card_id for card_id in self.completed if self.owners.get(card_id) == owner]
+
+    def winning_numbers(self, card_id):
+        return winning_positions(self.hits.get(card_id, 0))
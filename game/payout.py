@@ -0,0 +1,102 @@
+"""
+Payout rules: admin cut, bonus ("10X") multiplier ladder and bonus stakes.
+
+The rules used to be repeated as if/elif chains in the Twisted handlers, both
+Channels consumers and ``calculate_winner_price``, and the copies had drifted
+(``> 100`` against ``>= 100``, two different bonus ladders).  They are defined
+once here, and for each stake the prize for every card count and the bonus for
+every call count are computed once, so paying or displaying a game is a list
+lookup.
+
+Each bingo path keeps the bonus it has always paid, so its ladder is named by
+the caller: ``"twisted"`` for the Twisted/redis_worker engine, ``"channels"``
+for random players in the stake consumer, and ``"off"`` for the Channels and
+group player claims, which never paid one.
+"""
+import os
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+
+BONUS_STAKES = frozenset(int(s) for s in os.environ.get("BONUS_STAKES", "10,20,50").split(","))
+BONUS_MIN_PLAYERS = 10  # cards in the game before the bonus applies
+BONUS_TEXT = "10X"
+
+# Bonus multiplier of the stake by number of calls at the bingo, per path;
+# anything past the end of a ladder pays no bonus.
+BONUS_LADDERS = {
+    "twisted": (10, 10, 10, 10, 10, 10, 9, 8, 7, 6, 5, 4, 3, 3, 2, 2),
+    "channels": (10, 10, 10, 10, 10, 10, 8, 6, 4, 3, 2, 1),
+    "off": (),
+}
+
+# (minimum pot, admin share), highest tier first
+ADMIN_CUT_TIERS = (
+    (Decimal("100"), Decimal("0.2")),
+    (Decimal("50"), Decimal("0.1")),
+)
+
+MAX_CARDS = 120  # prizes are tabulated up to this many cards in a game
+
+
+def split_pot(pot):
+    """``(winner_price, admin_cut)`` for a pot (stake x cards)."""
+    pot = Decimal(pot)
+    for minimum, share in ADMIN_CUT_TIERS:
+        if pot >= minimum:
+            admin_cut = pot * share
+            return pot - admin_cut, admin_cut
+    return pot, Decimal("0")
+
+
+class StakePayout:
+    def __init__(self, stake):
+        self.stake = Decimal(stake)
+        self.is_bonus_stake = int(self.stake) in BONUS_STAKES
+        # index = number of cards in the game
+        self.prizes = [split_pot(self.stake * cards) for cards in range(MAX_CARDS + 1)]
+        # ladder -> index = number of calls at the bingo
+        self.bonuses = {
+            name: [int(self.stake) * m for m in ladder] if self.is_bonus_stake else []
+            for name, ladder in BONUS_LADDERS.items()
+        }
+
+    def split(self, cards):
+        """``(winner_price, admin_cut)`` for a game with ``cards`` cards."""
+        if 0 <= cards <= MAX_CARDS:
+            return self.prizes[cards]
+        return split_pot(self.stake * cards)
+
+    def winner_price(self, cards):
+        return self.split(cards)[0]
+
+    def has_bonus(self, cards):
+        return self.is_bonus_stake and cards >= BONUS_MIN_PLAYERS
+
+    def bonus(self, calls, cards, ladder):
+        """Bonus paid on top of the prize for a bingo on call ``calls`` (see BONUS_LADDERS)."""
+        bonuses = self.bonuses[ladder]
+        if not self.has_bonus(cards) or calls >= len(bonuses):
+            return 0
+        return bonuses[max(calls, 0)]
+
+    def bonus_text(self, cards):
+        return BONUS_TEXT if self.has_bonus(cards) else ""
+
+
+@lru_cache(maxsize=None)
+def _payout(stake):
+    return StakePayout(stake)
+
+
+def for_stake(stake):
+    """Shared ``StakePayout`` for a stake given as int, str or Decimal."""
+    return _payout(int(Decimal(str(stake))))
+
+
+def calculate_winner_price(no_p, stake):
+    """Prize shown before a game starts; the same amount settlement pays out."""
+    try:
+        return float(for_stake(stake).winner_price(int(Decimal(str(no_p)))))
+    except (ValueError, TypeError, InvalidOperation):
+        return 0.0
@@ -0,0 +1,172 @@
+"""
+In-process cache of the RandomPlayer (house player) rows, and the house wallet.
+
+Filling a lobby, settling a game and every random-player bingo sweep used to
+query ``RandomPlayer`` for the stake.  All rows are now read with one query
+and kept per stake; saving or deleting a row (e.g. from the admin) bumps the
+``random_player:version`` key and every process reloads on its next version
+check, the same way the card catalog works.  If Redis is down when a row is
+saved the save still goes through; the rows are also reloaded once they are
+``RANDOM_PLAYER_MAX_AGE`` seconds old, so a missed bump only delays the change.
+
+The house wallet moves on every game (entry fees out, prizes in).  Instead of
+a row update per game, changes are added to an atomic Redis counter (cents
+per row id) and ``flush_house_wallets`` applies the sums to the database;
+dbworker.py runs it every ``HOUSE_WALLET_FLUSH_INTERVAL`` seconds.  The
+``wallet`` of a cached row is therefore not current: use ``house_balance``.
+"""
+import logging
+import os
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+import redis
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from custom_auth.models import RandomPlayer
+
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+
+RANDOM_PLAYER_VERSION_KEY = "random_player:version"
+HOUSE_WALLET_DELTAS_KEY = "random_player:wallet_deltas"  # row id -> cents not yet in the DB
+VERSION_CHECK_INTERVAL = 2.0
+# seconds; rows are reloaded at least this often even if the version never moves
+RANDOM_PLAYER_MAX_AGE = float(os.environ.get("RANDOM_PLAYER_MAX_AGE", 60))
+
+logger = logging.getLogger(__name__)
+
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
+
+# Read and clear the pending deltas in one step
+TAKE_DELTAS_SCRIPT = """
+local deltas = redis.call("HGETALL", KEYS[1])
+redis.call("DEL", KEYS[1])
+return deltas
+"""
+
+
+def _stake_key(stake):
+    return Decimal(str(stake)).quantize(Decimal("0.01"))
+
+
+def _cents(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+class RandomPlayerCache:
+    def __init__(self, redis_client=None):
+        self.redis_client = redis_client or r
+        self.version = None
+        self._by_stake = {}
+        self._checked_at = 0.0
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _read_version(self):
+        try:
+            return int(self.redis_client.get(RANDOM_PLAYER_VERSION_KEY) or 0)
+        except redis.RedisError:
+            return self.version or 0
+
+    def load(self):
+        with self._lock:
+            version = self._read_version()
+            by_stake = {}
+            # first row per stake, like the old .filter(stake=...).first()
+            for row in RandomPlayer.objects.order_by("pk"):
+                by_stake.setdefault(_stake_key(row.stake), row)
+            self._by_stake = by_stake
+            self.version = version
+            self._checked_at = self._loaded_at = time.monotonic()
+
+    def refresh(self):
+        """Reload if the cache was never loaded, is too old or the version key moved."""
+        if self.version is None:
+            self.load()
+            return
+        now = time.monotonic()
+        if now - self._loaded_at >= RANDOM_PLAYER_MAX_AGE:
+            self.load()
+            return
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+        if self._read_version() != self.version:
+            self.load()
+
+    def get(self, stake):
+        """The stake's RandomPlayer row, or None."""
+        try:
+            key = _stake_key(stake)
+        except (InvalidOperation, TypeError, ValueError):
+            return None
+        self.refresh()
+        return self._by_stake.get(key)
+
+
+random_players = RandomPlayerCache()
+
+
+def bump_version(redis_client=None):
+    version = (redis_client or r).incr(RANDOM_PLAYER_VERSION_KEY)
+    if random_players.version is not None:
+        random_players.load()
+    return version
+
+
+@receiver(post_save, sender=RandomPlayer)
+@receiver(post_delete, sender=RandomPlayer)
+def _random_player_changed(sender, **kwargs):
+    transaction.on_commit(_bump_after_commit)
+
+
+def _bump_after_commit():
+    # The row is already committed: don't fail the request over Redis.  Other
+    # processes pick the change up at RANDOM_PLAYER_MAX_AGE at the latest.
+    try:
+        bump_version()
+    except redis.RedisError:
+        logger.error("random player version bump failed", exc_info=True)
+        if random_players.version is not None:
+            random_players.load()
+
+
+# --- house wallet ---
+def add_to_house_wallet(random_player_id, amount, redis_client=None):
+    cents = _cents(amount)
+    if cents:
+        (redis_client or r).hincrby(HOUSE_WALLET_DELTAS_KEY, random_player_id, cents)
+
+
+def house_balance(random_player, redis_client=None):
+    """Wallet in the database plus the changes not flushed yet."""
+    wallet = RandomPlayer.objects.filter(pk=random_player.pk).values_list("wallet", flat=True).first()
+    pending = (redis_client or r).hget(HOUSE_WALLET_DELTAS_KEY, random_player.pk)
+    return (wallet or Decimal("0")) + Decimal(int(pending or 0)) / 100
+
+
+def flush_house_wallets(redis_client=None):
+    """Apply the pending wallet changes in one transaction; returns ``{id: cents}``."""
+    client = redis_client or r
+    taken = client.eval(TAKE_DELTAS_SCRIPT, 1, HOUSE_WALLET_DELTAS_KEY)
+    deltas = {int(pk): int(cents) for pk, cents in zip(taken[::2], taken[1::2]) if int(cents)}
+    if not deltas:
+        return {}
+    try:
+        with transaction.atomic():
+            for pk, cents in deltas.items():
+                RandomPlayer.objects.filter(pk=pk).update(wallet=F("wallet") + Decimal(cents) / 100)
+    except Exception:
+        # give them back for the next flush
+        pipe = client.pipeline()
+        for pk, cents in deltas.items():
+            pipe.hincrby(HOUSE_WALLET_DELTAS_KEY, pk, cents)
+        pipe.execute()
+        raise
+    return deltas
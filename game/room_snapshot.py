@@ -0,0 +1,150 @@
+"""
+Connect-time snapshot of one stake or group room.
+
+A client joining a room used to cost several Redis GETs and a
+``Game``/``Group`` query to rebuild ``game_stat`` and ``player_list``, so a
+reconnect storm after a network blip hit the database once per client.  The
+game engine now keeps one Redis hash per room (``room_snapshot:stake:{stake}``
+or ``room_snapshot:group:{group}``) with the connect frames already
+JSON-encoded, rewritten whenever the state behind them changes:
+
+* ``game_in_progress`` / ``running_stat``  while a game runs (the stat carries
+  the called numbers, so it is rewritten on every draw)
+* ``idle_stat``        the "no game running" stat, without the countdown
+* ``player_list``      full selection with its lobby seq
+* ``next_game_start``  countdown deadline (epoch seconds)
+
+Connect is then one HGETALL and the stored frames are sent as they are; only
+``remaining_seconds`` is spliced into the idle stat at read time, since a
+stored value would be stale.  Fields are written independently (no
+read-modify-write), so the lobby and the draw loop never overwrite each
+other.  A missing or incomplete document means nothing was published yet:
+the caller builds the state the old way and the engine fills the hash in.
+
+``AsyncRoomSnapshot`` is the same document over a redis.asyncio client, for
+the async Channels consumers.
+"""
+import json
+import os
+import time
+
+
+# Refreshed on every write; a room nobody plays in drops its document.
+ROOM_SNAPSHOT_TTL = int(os.environ.get("ROOM_SNAPSHOT_TTL", 3600))
+
+RUNNING_FIELDS = ("game_in_progress", "running_stat")
+
+
+def stake_key(stake):
+    return f"room_snapshot:stake:{stake}"
+
+
+def group_key(group):
+    return f"room_snapshot:group:{group}"
+
+
+def remaining_seconds(doc, now=None):
+    deadline = doc.get("next_game_start")
+    if not deadline:
+        return 0
+    now = time.time() if now is None else now
+    return max(0, int(float(deadline) - now))
+
+
+def is_running(doc):
+    return all(field in doc for field in RUNNING_FIELDS)
+
+
+def needs_start(doc, now=None):
+    """Idle with no countdown pending: the connecting client should kick one off."""
+    return not is_running(doc) and not remaining_seconds(doc, now)
+
+
+def frames(doc, now=None):
+    """
+    Text frames for a connecting client, in the order connect always sent
+    them, or None when the document is incomplete.
+    """
+    if not doc or "player_list" not in doc:
+        return None
+    if is_running(doc):
+        return [doc["game_in_progress"], doc["running_stat"], doc["player_list"]]
+    if "idle_stat" not in doc:
+        return None
+    # the stored stat is a JSON object: reopen it for the countdown
+    idle_stat = doc["idle_stat"][:-1] + ', "remaining_seconds": %d}' % remaining_seconds(doc, now)
+    return [idle_stat, doc["player_list"]]
+
+
+def _player_list_frame(players, seq):
+    event = {"type": "player_list"}
+    if seq is not None:
+        event["seq"] = seq
+    event["player_list"] = players
+    return json.dumps(event)
+
+
+class RoomSnapshot:
+    def __init__(self, redis_client, key):
+        self.redis_client = redis_client
+        self.key = key
+
+    def load(self):
+        """The whole document in one round trip (empty dict if there is none)."""
+        return self.redis_client.hgetall(self.key)
+
+    def _write(self, mapping):
+        pipe = self.redis_client.pipeline(transaction=True)
+        pipe.hset(self.key, mapping=mapping)
+        pipe.expire(self.key, ROOM_SNAPSHOT_TTL)
+        return pipe
+
+    # --- engine updates ---
+    def _running_mapping(self, stat):
+        return {
+            "game_in_progress": json.dumps({"type": "game_in_progress", "game_id": stat["game_id"]}),
+            "running_stat": json.dumps(stat),
+        }
+
+    def _lobby_mapping(self, stat, players, seq):
+        stat = {k: v for k, v in stat.items() if k != "remaining_seconds"}
+        return {"idle_stat": json.dumps(stat), "player_list": _player_list_frame(players, seq)}
+
+    def set_running(self, stat):
+        """Running ``game_stat`` (with ``game_id`` and the called numbers so far)."""
+        self._write(self._running_mapping(stat)).execute()
+
+    def clear_running(self):
+        self.redis_client.hdel(self.key, *RUNNING_FIELDS)
+
+    def set_lobby(self, stat, players, seq=None):
+        """Idle ``game_stat`` and the full player list (``seq`` for sequenced lobbies)."""
+        self._write(self._lobby_mapping(stat, players, seq)).execute()
+
+    def set_countdown(self, next_game_start):
+        if next_game_start:
+            self._write({"next_game_start": next_game_start}).execute()
+        else:
+            self.redis_client.hdel(self.key, "next_game_start")
+
+
+class AsyncRoomSnapshot(RoomSnapshot):
+    """``RoomSnapshot`` over a redis.asyncio client; every method is a coroutine."""
+
+    async def load(self):
+        return await self.redis_client.hgetall(self.key)
+
+    async def set_running(self, stat):
+        await self._write(self._running_mapping(stat)).execute()
+
+    async def clear_running(self):
+        await self.redis_client.hdel(self.key, *RUNNING_FIELDS)
+
+    async def set_lobby(self, stat, players, seq=None):
+        await self._write(self._lobby_mapping(stat, players, seq)).execute()
+
+    async def set_countdown(self, next_game_start):
+        if next_game_start:
+            await self._write({"next_game_start": next_game_start}).execute()
+        else:
+            await self.redis_client.hdel(self.key, "next_game_start")
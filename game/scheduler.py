@@ -0,0 +1,152 @@
+"""
+Process-wide game timer.
+
+A single asyncio event loop, running in one daemon thread, owns every
+countdown, random-player injection step and number draw of the process.
+asyncio keeps its timers in a heap, so adding rooms adds heap entries instead
+of sleeping threads.  Callbacks do blocking ORM/Redis work, so when a timer
+fires the callback is handed to a small bounded thread pool; the loop itself
+never blocks and keeps firing on time.
+
+Timers are keyed (e.g. ``"start:10"``): scheduling a key that is already
+pending is a no-op, which is what keeps concurrent requests for the same
+stake from starting duplicate countdowns or draw loops.
+
+``AsyncGameScheduler`` is the same keyed timer for the async Channels
+consumers: it runs coroutines as tasks on the ASGI server's own event loop,
+so countdowns and draw loops need neither the timer thread nor a pool thread.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+GAME_SCHEDULER_WORKERS = int(os.environ.get("GAME_SCHEDULER_WORKERS", 8))
+
+
+class GameScheduler:
+    def __init__(self, workers=GAME_SCHEDULER_WORKERS):
+        self._workers = workers
+        self._loop = None
+        self._thread = None
+        self._executor = None
+        self._timers = {}  # key -> asyncio.TimerHandle (None until armed on the loop)
+        self._lock = threading.Lock()
+
+    # --- lifecycle ---
+    def start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="game-timer")
+            self._loop = asyncio.new_event_loop()
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="game-scheduler", daemon=True)
+            self._thread.start()
+        ready.wait()
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    @staticmethod
+    def now():
+        """Clock used for deadlines (same as the loop's: time.monotonic)."""
+        return time.monotonic()
+
+    # --- timers ---
+    def call_at(self, when, key, fn, *args):
+        """
+        Run ``fn(*args)`` at monotonic time ``when``.
+        Returns False (and schedules nothing) if ``key`` is already pending.
+        """
+        self.start()
+        with self._lock:
+            if key in self._timers:
+                return False
+            self._timers[key] = None
+        self._loop.call_soon_threadsafe(self._arm, when, key, fn, args)
+        return True
+
+    def call_later(self, delay, key, fn, *args):
+        return self.call_at(self.now() + delay, key, fn, *args)
+
+    def cancel(self, key):
+        with self._lock:
+            handle = self._timers.pop(key, None)
+        if handle is not None:
+            self._loop.call_soon_threadsafe(handle.cancel)
+
+    def is_pending(self, key):
+        with self._lock:
+            return key in self._timers
+
+    def _arm(self, when, key, fn, args):
+        with self._lock:
+            if key not in self._timers:
+                return  # cancelled before it was armed
+            self._timers[key] = self._loop.call_at(when, self._fire, key, fn, args)
+
+    def _fire(self, key, fn, args):
+        with self._lock:
+            self._timers.pop(key, None)
+        # The key is free again before fn runs, so fn may re-schedule itself.
+        self._loop.run_in_executor(self._executor, self._run, key, fn, args)
+
+    @staticmethod
+    def _run(key, fn, args):
+        try:
+            fn(*args)
+        except Exception as e:
+            print(f"⚠️ Scheduled task {key} failed:", e)
+
+
+scheduler = GameScheduler()
+
+
+class AsyncGameScheduler:
+    """Keyed timers for coroutines, on the event loop that schedules them."""
+
+    def __init__(self):
+        self._timers = {}  # key -> asyncio.Task still sleeping
+        self._running = set()  # tasks past their deadline (asyncio only keeps weak references)
+
+    def call_later(self, delay, key, fn, *args):
+        """
+        Await ``fn(*args)`` in ``delay`` seconds.
+        Returns False (and schedules nothing) if ``key`` is already pending.
+        """
+        if key in self._timers:
+            return False
+        self._timers[key] = asyncio.get_running_loop().create_task(self._run(delay, key, fn, args))
+        return True
+
+    def spawn(self, key, fn, *args):
+        """Start ``fn(*args)`` now, as a task of its own (e.g. a draw loop)."""
+        return self.call_later(0, key, fn, *args)
+
+    def cancel(self, key):
+        task = self._timers.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    def is_pending(self, key):
+        return key in self._timers
+
+    async def _run(self, delay, key, fn, args):
+        await asyncio.sleep(delay)
+        task = self._timers.pop(key, None)
+        # The key is free again before fn runs, so fn may re-schedule itself.
+        if task is not None:
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+        try:
+            await fn(*args)
+        except Exception as e:
+            print(f"⚠️ Scheduled task {key} failed:", e)
+
+
+async_scheduler = AsyncGameScheduler()
@@ -0,0 +1,146 @@
+"""
+Entry-fee settlement at game start, loss streaks after the game.
+
+All participant rows are locked with one ``select_for_update`` query, the
+wallet/bonus split is computed in memory and written back with a single
+``bulk_update``, all inside one transaction: either every player of the game
+is charged or nobody is.  Participation rows are upserted with one
+``bulk_create`` on the ``(user, game)`` key.  After a game, loss streaks and the streak bonus are
+set-based UPDATEs, so neither step grows in queries with the player count.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+
+def flatten_entry_cards(cards):
+    return [c for sub in cards for c in sub] if cards and isinstance(cards[0], list) else cards
+
+
+def split_charge(wallet, bonus, amount):
+    """Take ``amount`` from the wallet first and the rest from the bonus."""
+    if wallet >= amount:
+        return wallet - amount, bonus
+    return Decimal('0'), bonus - (amount - wallet)
+
+
+def charge_entries(entries, stake_amount, random_player=None):
+    """
+    Charge ``stake_amount`` per card for every (already de-duplicated) entry.
+
+    Entries of user 0 are paid from ``random_player``'s wallet (if any, see
+    game.random_players for the house wallet counter).  Returns
+    ``(accepted, rejected)``: the entries that were charged, with their cards
+    flattened, and the ids of users that were missing or could not pay.
+    """
+    from custom_auth.models import User
+    from game.random_players import add_to_house_wallet
+
+    accepted, rejected = [], []
+    user_ids = {int(entry["user"]) for entry in entries if int(entry["user"]) != 0}
+
+    with transaction.atomic():
+        users = {user.id: user for user in User.objects.select_for_update().filter(id__in=user_ids)}
+        charged = {}
+        random_total = Decimal('0')
+
+        for entry in entries:
+            user_id = int(entry["user"])
+            flat_cards = flatten_entry_cards(entry["card"])
+            total_ded = stake_amount * len(flat_cards)
+
+            if user_id == 0:
+                if random_player is not None:
+                    random_total += total_ded
+            else:
+                user = users.get(user_id)
+                if user is None or (user.wallet + user.bonus) < total_ded:
+                    rejected.append(user_id)
+                    continue
+                user.wallet, user.bonus = split_charge(user.wallet, user.bonus, total_ded)
+                user.no_of_games_played = (user.no_of_games_played or 0) + 1
+                charged[user_id] = user
+
+            entry["card"] = flat_cards
+            accepted.append(entry)
+
+        if charged:
+            User.objects.bulk_update(list(charged.values()), ["wallet", "bonus", "no_of_games_played"])
+        if random_total:
+            # house wallet changes go through the Redis counter, once this commits
+            transaction.on_commit(lambda: add_to_house_wallet(random_player.pk, -random_total))
+
+    return accepted, rejected
+
+
+def participation_rows(game, entries):
+    """Unsaved ``UserGameParticipation`` rows for the real players of ``entries``."""
+    from game.models import UserGameParticipation
+
+    times_played = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not entry.get("user"):
+            continue
+        user_id = int(entry["user"])
+        if user_id != 0:
+            times_played[user_id] = len(flatten_entry_cards(entry.get("card") or []))
+    return [
+        UserGameParticipation(user_id=user_id, game=game, times_played=count)
+        for user_id, count in times_played.items()
+    ]
+
+
+def upsert_participation(rows, batch_size=None):
+    """Insert participation rows in bulk; an existing (user, game) row gets the new card count."""
+    from game.models import UserGameParticipation
+
+    if not rows:
+        return []
+    return UserGameParticipation.objects.bulk_create(
+        rows,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=["user", "game"],
+        update_fields=["times_played", "updated_at"],
+    )
+
+
+def record_participation(game, entries):
+    """Record who played ``game`` (``times_played`` = card count) in one INSERT."""
+    return upsert_participation(participation_rows(game, entries))
+
+
+def settle_consecutive_losses(participant_ids, winner_ids):
+    """
+    Post-game loss streaks, in two UPDATE statements whatever the game size.
+
+    Winners' streaks are reset.  Every other participant's streak grows by
+    one; a player reaching 10 losses in a row gets 10 bonus and starts over.
+    ``participant_ids`` may be a list or a ``values_list`` queryset (then it
+    runs as a subquery); ``winner_ids`` is one id or an iterable of ids.
+    """
+    from django.db.models import Case, F, Value, When
+    from django.db.models.functions import Coalesce
+    from custom_auth.models import User
+
+    if isinstance(winner_ids, (int, str)):
+        winner_ids = [winner_ids]
+    winner_ids = [int(user_id) for user_id in winner_ids]
+
+    # Both SET expressions read the row as it was before the UPDATE, so a
+    # streak of 9 is the one this loss takes to 10.
+    tenth_loss = {"consecutive_losses__gte": 9}
+
+    with transaction.atomic():
+        participants = User.objects.filter(id__in=participant_ids)
+        participants.filter(id__in=winner_ids).update(consecutive_losses=0)
+        participants.exclude(id__in=winner_ids).update(
+            bonus=Case(
+                When(**tenth_loss, then=Coalesce(F("bonus"), Value(Decimal("0"))) + Decimal("10")),
+                default=F("bonus"),
+            ),
+            consecutive_losses=Case(
+                When(**tenth_loss, then=Value(0)),
+                default=Coalesce(F("consecutive_losses"), Value(0)) + 1,
+            ),
+        )
@@ -44,4 +44,433 @@ class WinnerCardsTest(TestCase):
         # Verify
         updated = Game.objects.get(id=game.id)
         self.assertEqual(updated.winner, user.id)
-        self.assertEqual(updated.winner_cards, [card.id])
\ No newline at end of file
+        self.assertEqual(updated.winner_cards, [card.id])
+
+from django.test import SimpleTestCase
+from game import patterns
+
+
+class PatternEngineTest(SimpleTestCase):
+    card = [
+        [1, 16, 31, 46, 61],
+        [2, 17, 32, 47, 62],
+        [3, 18, 0, 48, 63],
+        [4, 19, 33, 49, 64],
+        [5, 20, 34, 50, 65],
+    ]
+
+    def test_row_positions(self):
+        self.assertEqual(patterns.has_bingo(self.card, [3, 18, 48, 63, 0]), [11, 12, 13, 14, 15])
+
+    def test_no_bingo(self):
+        self.assertEqual(patterns.has_bingo(self.card, [1, 2, 3, 4]), [])
+
+    def test_corners_and_diagonal(self):
+        called = [1, 17, 0, 49, 65, 61, 5]
+        self.assertEqual(
+            patterns.has_bingo(self.card, called),
+            [1, 7, 13, 19, 25, 1, 5, 21, 25],
+        )
+
+    def test_accepts_packed_mask(self):
+        called = patterns.called_mask([16, 17, 18, 19, 20])
+        self.assertEqual(patterns.has_bingo(self.card, called), [2, 7, 12, 17, 22])
+
+
+class CardCatalogTest(TestCase):
+    def test_cards_are_decoded_once_and_checked_from_memory(self):
+        from game.card_catalog import CardCatalog
+
+        grid = [[1, 16, 31, 46, 61], [2, 17, 32, 47, 62], [3, 18, 0, 48, 63], [4, 19, 33, 49, 64], [5, 20, 34, 50, 65]]
+        card = Card.objects.create(numbers=json.dumps(grid))
+        catalog = CardCatalog()
+        catalog.load()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.cards([card.id]), [{"id": card.id, "numbers": tuple(map(tuple, grid))}])
+            self.assertEqual(catalog.has_bingo(card.id, [1, 2, 3, 4, 5]), [1, 6, 11, 16, 21])
+            self.assertIsNone(catalog.grid(card.id + 1))
+
+
+class GameTrackerTest(SimpleTestCase):
+    def test_reports_card_when_line_completes(self):
+        card = PatternEngineTest.card
+        tracker = patterns.GameTracker({7: patterns.card_number_masks(card)}, {7: 0})
+        tracker.call(patterns.FREE_SPACE)
+
+        self.assertEqual([tracker.call(n) for n in (3, 18, 48)], [[], [], []])
+        self.assertEqual(tracker.call(63), [7])
+        self.assertEqual(tracker.completed_for(0), [7])
+        self.assertEqual(tracker.winning_numbers(7), [11, 12, 13, 14, 15])
+        self.assertEqual(tracker.call(63), [])
+
+
+class ActiveGamesSnapshotTest(TestCase):
+    class DictRedis(dict):
+        def mget(self, keys):
+            return [self.get(key) for key in keys]
+
+    def test_running_games_are_read_with_one_query(self):
+        from django.utils import timezone
+        from game.active_games import build_active_games, running_games_cache
+
+        game = Game.objects.create(stake="20", winner_price=80, played="Playing", random_numbers="[]")
+        redis_client = self.DictRedis({
+            "stake_state_20_current_game_id": json.dumps(game.id),
+            f"game_state_{game.id}_is_running": "true",
+            "stake_state_10_next_game_start": json.dumps(timezone.now().timestamp() + 20),
+            "player_count_10": "3",
+        })
+        running_games_cache.invalidate()
+
+        with self.assertNumQueries(1):
+            snapshot = build_active_games(redis_client, lambda no_p, stake: no_p * stake)
+            build_active_games(redis_client, lambda no_p, stake: no_p * stake)
+
+        self.assertEqual(snapshot["20"], {"is_running": True, "remaining_seconds": 0, "winner_price": 80.0, "bonus": True})
+        self.assertEqual(snapshot["10"]["winner_price"], 30)
+        self.assertIn(snapshot["10"]["remaining_seconds"], (19, 20))
+        self.assertEqual(snapshot["30"]["is_running"], False)
+
+
+class BroadcastCoalescerTest(SimpleTestCase):
+    def test_requests_within_window_share_one_flush(self):
+        import threading
+        from game.broadcast import BroadcastCoalescer
+
+        flushed = []
+        done = threading.Event()
+
+        def flush():
+            flushed.append(1)
+            done.set()
+
+        coalescer = BroadcastCoalescer(window=0.05)
+        opened = [coalescer.request("test-room", flush) for _ in range(5)]
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(opened, [True, False, False, False, False])
+        self.assertEqual(flushed, [1])
+
+    def test_change_after_window_key_expired_is_not_lost(self):
+        import time
+        from game.broadcast import BroadcastCoalescer
+
+        class ExpiringRedis(dict):
+            def set(self, key, value, nx=False, px=None):
+                if nx and self.get(key, 0) > time.monotonic():
+                    return None
+                self[key] = time.monotonic() + px / 1000
+                return True
+
+        flushed = []
+        redis_client = ExpiringRedis()
+        coalescer = BroadcastCoalescer(window=0.5)  # Redis key lives 0.4s
+
+        opened = [coalescer.request("edge-room", flushed.append, 1, redis_client=redis_client)]
+        time.sleep(0.45)  # key expired, flush still pending
+        opened.append(coalescer.request("edge-room", flushed.append, 2, redis_client=redis_client))
+        time.sleep(0.15)  # first flush done
+        opened.append(coalescer.request("edge-room", flushed.append, 3, redis_client=redis_client))
+        time.sleep(0.6)
+
+        self.assertEqual(opened, [True, False, True])
+        self.assertEqual(flushed, [1, 3])
+
+
+class ChargeEntriesTest(TestCase):
+    def test_charges_all_players_in_one_bulk_write(self):
+        from decimal import Decimal
+        from game.settlement import charge_entries
+
+        rich = User.objects.create(phone_number="0911", name="rich", wallet=Decimal("100"), bonus=Decimal("0"))
+        split = User.objects.create(phone_number="0922", name="split", wallet=Decimal("15"), bonus=Decimal("10"))
+        poor = User.objects.create(phone_number="0933", name="poor", wallet=Decimal("5"), bonus=Decimal("0"))
+        entries = [
+            {"user": rich.id, "card": [1, 2]},
+            {"user": split.id, "card": [3, 4]},
+            {"user": poor.id, "card": [5]},
+            {"user": 0, "card": [6]},
+        ]
+
+        # SAVEPOINT + locking SELECT + bulk UPDATE (+ RELEASE)
+        with self.assertNumQueries(4):
+            accepted, rejected = charge_entries(entries, Decimal("10"), None)
+
+        self.assertEqual([e["user"] for e in accepted], [rich.id, split.id, 0])
+        self.assertEqual(rejected, [poor.id])
+        rich.refresh_from_db(); split.refresh_from_db(); poor.refresh_from_db()
+        self.assertEqual((rich.wallet, rich.bonus), (Decimal("80"), Decimal("0")))
+        self.assertEqual((split.wallet, split.bonus), (Decimal("0"), Decimal("5")))
+        self.assertEqual(poor.wallet, Decimal("5"))
+
+
+class PayoutRulesTest(SimpleTestCase):
+    def test_admin_cut_tiers(self):
+        from decimal import Decimal
+        from game import payout
+
+        ten = payout.for_stake("10")
+        self.assertEqual(ten.split(4), (Decimal("40"), Decimal("0")))
+        self.assertEqual(ten.split(5), (Decimal("45.0"), Decimal("5.0")))
+        self.assertEqual(ten.split(10), (Decimal("80.0"), Decimal("20.0")))
+        self.assertEqual(ten.split(200), payout.split_pot(2000))
+
+    def test_displayed_price_matches_settlement(self):
+        from game import payout
+
+        for stake in (10, 20, 30, 50, 100):
+            for cards in (1, 4, 5, 9, 10, 37):
+                self.assertEqual(
+                    payout.calculate_winner_price(cards, stake),
+                    float(payout.for_stake(stake).winner_price(cards)),
+                )
+        self.assertEqual(payout.calculate_winner_price("x", 10), 0.0)
+
+    def test_bonus_ladder(self):
+        from game import payout
+
+        twenty = payout.for_stake(20)
+        self.assertEqual(twenty.bonus(4, 10, "twisted"), 200)
+        self.assertEqual(twenty.bonus(6, 10, "twisted"), 180)
+        self.assertEqual(twenty.bonus(15, 10, "twisted"), 40)
+        self.assertEqual(twenty.bonus(16, 10, "twisted"), 0)
+        self.assertEqual(twenty.bonus(5, 9, "twisted"), 0)
+        self.assertEqual(twenty.bonus_text(10), "10X")
+        self.assertEqual(payout.for_stake(30).bonus(5, 50, "twisted"), 0)
+
+    def test_each_path_keeps_its_bonus(self):
+        from game import payout
+
+        twenty = payout.for_stake(20)
+        self.assertEqual(twenty.bonus(6, 10, "channels"), 160)
+        self.assertEqual(twenty.bonus(11, 10, "channels"), 20)
+        self.assertEqual(twenty.bonus(12, 10, "channels"), 0)
+        self.assertEqual(twenty.bonus(5, 10, "off"), 0)
+        self.assertEqual(payout.for_stake(30).bonus_text(50), "")
+
+
+class RandomPlayerCacheTest(TestCase):
+    def test_rows_are_loaded_once_per_version(self):
+        from decimal import Decimal
+        from custom_auth.models import RandomPlayer
+        from game.random_players import RandomPlayerCache, RANDOM_PLAYER_MAX_AGE, RANDOM_PLAYER_VERSION_KEY
+
+        ten = RandomPlayer.objects.create(stake=Decimal("10"), on_off=True, names=["a"])
+        RandomPlayer.objects.create(stake=Decimal("10"), names=["duplicate"])
+        twenty = RandomPlayer.objects.create(stake=Decimal("20"), names=["b"])
+        versions = {RANDOM_PLAYER_VERSION_KEY: "0"}
+        cache = RandomPlayerCache(redis_client=versions)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(cache.get("10"), ten)
+            self.assertEqual(cache.get(Decimal("20.00")), twenty)
+            self.assertEqual(cache.get(20), twenty)
+            self.assertIsNone(cache.get(30))
+            self.assertIsNone(cache.get("all"))
+
+        versions[RANDOM_PLAYER_VERSION_KEY] = "1"
+        cache._checked_at = 0.0
+        with self.assertNumQueries(1):
+            cache.get(10)
+        self.assertEqual(cache.version, 1)
+
+        # a missed bump is caught up once the rows are old enough
+        cache._loaded_at -= RANDOM_PLAYER_MAX_AGE
+        with self.assertNumQueries(1):
+            cache.get(10)
+
+    def test_save_survives_a_redis_outage(self):
+        from decimal import Decimal
+        from unittest import mock
+        import redis
+        from custom_auth.models import RandomPlayer
+
+        class DownRedis:
+            def incr(self, key):
+                raise redis.ConnectionError("down")
+
+        with mock.patch("game.random_players.r", DownRedis()), \
+                self.assertLogs("game.random_players", "ERROR"), \
+                self.captureOnCommitCallbacks(execute=True):
+            RandomPlayer.objects.create(stake=Decimal("10"), names=["a"])
+
+
+class MetricsHistogramTest(SimpleTestCase):
+    def test_buckets_are_cumulative_per_label_set(self):
+        from game import metrics
+
+        histogram = metrics.Histogram("test_seconds", "test", buckets=(0.1, 1.0))
+        metrics.REGISTRY.remove(histogram)
+        histogram.observe(0.05, type="bingo", stake=10)
+        histogram.observe(0.5, type="bingo", stake=10)
+        histogram.observe(5, type="bingo", stake=10)
+        histogram.observe(0.1, type="card_data", stake=20)
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{type="bingo",stake="10",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{type="bingo",stake="10",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{type="bingo",stake="10",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{type="bingo",stake="10"} 3', lines)
+        self.assertIn('test_seconds_bucket{type="card_data",stake="20",le="0.1"} 1', lines)
+
+    def test_unknown_types_share_one_escaped_series(self):
+        from game import metrics
+
+        histogram = metrics.Histogram("test_seconds", "test", buckets=(1.0,))
+        metrics.REGISTRY.remove(histogram)
+        for made_up in ("x1", "x2", ["list"], None):
+            histogram.observe(0.5, type=metrics.command_label(made_up), stake=10)
+        histogram.observe(0.5, type="bingo", stake='a"b\\c\n')
+
+        lines = histogram.render()
+        self.assertIn('test_seconds_count{type="other",stake="10"} 4', lines)
+        self.assertIn('test_seconds_count{type="bingo",stake="a\\"b\\\\c\\n"} 1', lines)
+        self.assertEqual(metrics.new_trace("no_such_command")["type"], "other")
+
+
+class ConsecutiveLossesTest(TestCase):
+    def test_streaks_are_settled_with_constant_queries(self):
+        from decimal import Decimal
+        from game.settlement import settle_consecutive_losses
+
+        winner = User.objects.create(phone_number="0944", name="winner", wallet=0, bonus=Decimal("0"), consecutive_losses=4)
+        loser = User.objects.create(phone_number="0955", name="loser", wallet=0, bonus=Decimal("0"), consecutive_losses=2)
+        tenth = User.objects.create(phone_number="0966", name="tenth", wallet=0, bonus=Decimal("5"), consecutive_losses=9)
+        outsider = User.objects.create(phone_number="0977", name="outsider", wallet=0, bonus=Decimal("0"), consecutive_losses=3)
+
+        # SAVEPOINT + two UPDATEs (+ RELEASE)
+        with self.assertNumQueries(4):
+            settle_consecutive_losses([winner.id, loser.id, tenth.id], winner.id)
+
+        for user in (winner, loser, tenth, outsider):
+            user.refresh_from_db()
+        self.assertEqual(winner.consecutive_losses, 0)
+        self.assertEqual(loser.consecutive_losses, 3)
+        self.assertEqual((tenth.consecutive_losses, tenth.bonus), (0, Decimal("15")))
+        self.assertEqual(outsider.consecutive_losses, 3)
+
+    def test_game_without_winner_counts_as_a_loss_for_everyone(self):
+        from decimal import Decimal
+        from django.db import transaction
+        from dbworker import apply_db_event
+
+        loser = User.objects.create(phone_number="0911", name="loser", wallet=0, bonus=Decimal("0"), consecutive_losses=2)
+        tenth = User.objects.create(phone_number="0922", name="tenth", wallet=0, bonus=Decimal("5"), consecutive_losses=9)
+        game = Game.objects.create(stake="10", played="Playing", random_numbers="[]", playerCard=[
+            {"user": loser.id, "card": [1]}, {"user": tenth.id, "card": [2]}, {"user": 0, "card": [3]},
+        ])
+
+        with transaction.atomic():
+            apply_db_event({"event": "GAME_ENDED", "data": {
+                "game_id": game.id, "winner_id": None, "total_calls": 76, "called_numbers": [0],
+            }})
+
+        for user in (loser, tenth):
+            user.refresh_from_db()
+        game.refresh_from_db()
+        self.assertEqual(game.played, "closed")
+        self.assertEqual(loser.consecutive_losses, 3)
+        self.assertEqual((tenth.consecutive_losses, tenth.bonus), (0, Decimal("15")))
+
+
+class ParticipationTest(TestCase):
+    def test_participation_is_upserted_in_one_insert(self):
+        from game.models import UserGameParticipation
+        from game.settlement import record_participation
+
+        one = User.objects.create(phone_number="0988", name="one", wallet=0, bonus=0)
+        two = User.objects.create(phone_number="0999", name="two", wallet=0, bonus=0)
+        game = Game.objects.create(stake="10", played="Started")
+        UserGameParticipation.objects.create(user=one, game=game, times_played=1)
+
+        with self.assertNumQueries(1):
+            record_participation(game, [{"user": one.id, "card": [1, 2, 3]}, {"user": two.id, "card": [[4], [5]]},
+                                        {"user": 0, "card": [6]}])
+
+        self.assertEqual(
+            dict(UserGameParticipation.objects.filter(game=game).values_list("user_id", "times_played")),
+            {one.id: 3, two.id: 2},
+        )
+
+
+class AsyncGameSchedulerTest(SimpleTestCase):
+    def test_pending_key_is_scheduled_once(self):
+        import asyncio
+        from game.scheduler import AsyncGameScheduler
+
+        async def run():
+            scheduler = AsyncGameScheduler()
+            fired = []
+
+            async def tick(n):
+                fired.append(n)
+
+            opened = [scheduler.call_later(0.01, "start:10", tick, n) for n in range(3)]
+            self.assertTrue(scheduler.is_pending("start:10"))
+            await asyncio.sleep(0.05)
+            self.assertFalse(scheduler.is_pending("start:10"))
+            return opened, fired
+
+        opened, fired = asyncio.run(run())
+        self.assertEqual(opened, [True, False, False])
+        self.assertEqual(fired, [0])
+
+
+class RoomSnapshotTest(SimpleTestCase):
+    def test_connect_frames_come_from_one_document(self):
+        from game import room_snapshot
+
+        snapshot = room_snapshot.RoomSnapshot(None, room_snapshot.stake_key(10))
+        players = [{"user": 7, "card": [12]}]
+        idle = {"type": "game_stat", "running": False, "number_of_players": 1, "remaining_seconds": 99}
+        doc = {**snapshot._lobby_mapping(idle, players, 4), "next_game_start": "1020.5"}
+
+        self.assertIsNone(room_snapshot.frames({}))
+        self.assertEqual(
+            [json.loads(frame) for frame in room_snapshot.frames(doc, now=1000)],
+            [{"type": "game_stat", "running": False, "number_of_players": 1, "remaining_seconds": 20},
+             {"type": "player_list", "seq": 4, "player_list": players}],
+        )
+        self.assertFalse(room_snapshot.needs_start(doc, now=1000))
+        self.assertTrue(room_snapshot.needs_start(doc, now=1030))
+
+        doc.update(snapshot._running_mapping({"type": "game_stat", "game_id": 5, "running": True, "called_numbers": [3]}))
+        self.assertEqual(
+            [json.loads(frame)["type"] for frame in room_snapshot.frames(doc, now=1000)],
+            ["game_in_progress", "game_stat", "player_list"],
+        )
+        self.assertFalse(room_snapshot.needs_start(doc, now=1030))
+
+
+class CardEndpointTest(TestCase):
+    def test_repeat_requests_revalidate_to_304(self):
+        from rest_framework.test import APIRequestFactory, force_authenticate
+        from game.card_catalog import catalog
+        from game.views import get_bingo_card, get_playing_bingo_card
+
+        grid = [[1, 16, 31, 46, 61], [2, 17, 32, 47, 62], [3, 18, 0, 48, 63], [4, 19, 33, 49, 64], [5, 20, 34, 50, 65]]
+        card = Card.objects.create(numbers=json.dumps(grid))
+        user = User.objects.create(phone_number="0911000000", name="cards")
+        game = Game.objects.create(stake="10", random_numbers="[]", playerCard=[{"user": user.id, "card": [card.id]}])
+        catalog.load()
+        self.addCleanup(setattr, catalog, "version", None)
+        factory = APIRequestFactory()
+
+        def get(view, params, **headers):
+            request = factory.get("/", params, **headers)
+            force_authenticate(request, user=user)
+            return view(request)
+
+        with self.assertNumQueries(0):
+            first = get(get_bingo_card, {"cardId": card.id})
+            repeat = get(get_bingo_card, {"cardId": card.id}, HTTP_IF_NONE_MATCH=first["ETag"])
+            pinned = get(get_bingo_card, {"cardId": card.id, "v": first["X-Card-Set-Version"]})
+
+        self.assertEqual(json.loads(first.content), [{"id": card.id, "numbers": grid}])
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertIn("immutable", pinned["Cache-Control"])
+
+        playing = get(get_playing_bingo_card, {"gameId": game.id}, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(playing.status_code, 304)
@@ -4,25 +4,69 @@ import uuid
 from datetime import datetime, timedelta
 from decimal import Decimal, InvalidOperation
 
+import redis
 import requests
 from django.core.cache import cache
 from django.db import models
 from django.db import transaction
 from django.db.models import Count, Q, Sum
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import permission_classes, api_view
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
 from custom_auth.models import User
-from game.models import Card, CustomAuthAbstractuser, CustomAuthUser, TransferLog
+from game.card_catalog import catalog as card_catalog
+from game.models import CustomAuthAbstractuser, CustomAuthUser, TransferLog
 from game.models import UserGameParticipation
 from .models import Agents, AgentsAccount, PaymentRequest
 from .models import DepositAccount
 from .models import Game
+from .ws_handlers import RedisState, r as redis_client
+
+
+# Card responses fetched with ?v=<card set revision> never change.
+CARD_CACHE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def card_response(request, revision, card_ids, body):
+    """
+    Pre-encoded card list with a strong ETag (card set revision + card ids).
+    A matching If-None-Match gets a 304; a request pinned to the current
+    revision (``?v=``) may be cached for good, anything else revalidates.
+    """
+    etag = '"%s:%s"' % (revision, ",".join(str(card_id) for card_id in card_ids))
+    if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in if_none_match or "*" in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+
+    response["ETag"] = etag
+    response["X-Card-Set-Version"] = revision
+    if request.GET.get("v") == revision:
+        patch_cache_control(response, private=True, max_age=CARD_CACHE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def game_player_card(game_id):
+    """The game's settled ``playerCard`` from Redis (set by the engine), else the database."""
+    try:
+        game_data = RedisState(redis_client, None).get_game_data(game_id)
+    except redis.RedisError:
+        game_data = None
+    if game_data and isinstance(game_data.get("playerCard"), list):
+        return game_data["playerCard"]
+
+    game = Game.objects.only("playerCard").get(id=game_id)
+    return game.playerCard
 
 
 @api_view(['GET'])
@@ -36,23 +80,14 @@ def get_bingo_card(request):
         return JsonResponse({"error": "Invalid card ID(s)"}, status=400)
 
     try:
-        # Fetch all card objects based on the provided IDs
-        cards = Card.objects.filter(id__in=[int(card_id) for card_id in card_ids])
+        # Look the cards up in the in-memory card catalog
+        revision, found, body = card_catalog.cards_json(int(card_id) for card_id in card_ids)
 
         # Check if the requested cards were found
-        if not cards:
+        if not found:
             return JsonResponse({"error": "Card(s) not found"}, status=404)
 
-        # Prepare response data for multiple cards
-        bingo_table_data = [
-            {
-                "id": card.id,
-                "numbers": json.loads(card.numbers)  # Load JSON field as a Python object
-            }
-            for card in cards
-        ]
-
-        return JsonResponse(bingo_table_data, safe=False)
+        return card_response(request, revision, found, body)
 
     except Exception as e:
         # Catch any unexpected errors and return a server error response
@@ -74,37 +109,31 @@ def get_playing_bingo_card(request):
         return flattened
 
     try:
-        # Retrieve the specified game
-        game = Game.objects.get(id=game_id)
-
+        # Retrieve the specified game's entries
+        players = game_player_card(game_id)
 
         # Parse playerCard JSON to find cards for the specified user
-        players = json.loads(game.playerCard)
+        if isinstance(players, str):
+            players = json.loads(players)
+        if isinstance(players, dict):
+            # selection map of a game that was not settled yet
+            players = [{"user": user, "card": card} for user, card in players.items()]
 
         # Find and flatten all card IDs for the specified user
         user_cards = []
         for player in players:
-            if player['user'] == int(request.user.id):
+            if int(player['user']) == int(request.user.id):
                 # Flatten card IDs for this player
                 user_cards.extend(flatten_card_ids(player['card'] if isinstance(player['card'], list) else [player['card']]))
 
-        # Fetch the Card objects
-        cards = Card.objects.filter(id__in=user_cards)
+        # Look the cards up in the in-memory card catalog
+        revision, found, body = card_catalog.cards_json(user_cards)
 
         # Check if any cards were found
-        if not cards.exists():
+        if not found:
             return JsonResponse({"error": "No cards found for this user in the specified game."}, status=404)
 
-        # Prepare response data for all user cards
-        bingo_table_data = [
-            {
-                "id": card.id,
-                "numbers": json.loads(card.numbers)  # Load JSON field format as a Python object
-            }
-            for card in cards
-        ]
-
-        return JsonResponse(bingo_table_data, safe=False)
+        return card_response(request, revision, found, body)
 
     except Game.DoesNotExist:
         return JsonResponse({"error": "Game not found"}, status=404)
@@ -3,15 +3,27 @@ import os
 import threading
 import time
 import random
+from contextlib import contextmanager
 from decimal import Decimal, InvalidOperation
-import uuid
 import redis
 
 from django.utils import timezone
 from asgiref.sync import async_to_sync
 
-from game.models import Game, Card
-from custom_auth.models import User, RandomPlayer
+from game.models import Game
+from game import patterns
+from game.card_catalog import catalog as card_catalog
+from game.scheduler import scheduler
+from game.lobby import LobbyStore
+from game.room_snapshot import RoomSnapshot, stake_key as snapshot_key
+from game.active_games import build_active_games
+from game.broadcast import lobby_broadcasts
+from game.settlement import charge_entries, record_participation
+from game import db_events
+from game import payout
+from game import metrics
+from game.random_players import random_players
+from custom_auth.models import User
 
 
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
@@ -22,27 +34,20 @@ channel_layer = None
 room_group_name = "game_all"
 stake = 10
 
+COUNTDOWN_SECONDS = 30  # lobby countdown before a game starts
+DRAW_INTERVAL = 4  # seconds between two drawn numbers
+RANDOM_PLAYER_CHECK_DELAY = 2  # head start real players get on each number
+BROADCAST_LOCK_TTL = 10  # draw lock expires unless renewed by the next draw
+# Persist called numbers every N draws while a game runs (0 = only at the end)
+GAME_CHECKPOINT_EVERY = int(os.environ.get("GAME_CHECKPOINT_EVERY", 15))
+
 def publish_event(stake, event, target_client_id=None):
     """
     Publish an event to Redis.
-    Only ONE worker is allowed to broadcast this event.
+    Lobby updates are rate limited by game.broadcast, not here: every event
+    published is delivered.
     """
     ch = f"game:{stake}:events"
-    
-    # Unique lock key for this stake & event type
-    event_type = event.get("type", "unknown")
-    lock_key = f"broadcast_lock:{stake}:{event_type}"
-    
-    # Unique token for safe lock release
-    lock_token = str(uuid.uuid4())
-
-    # Try to acquire lock (NX = only if not exists)
-    got_lock = r.set(lock_key, lock_token, nx=True, ex=1)  
-    # ex=1 ensures lock auto-expires after 1 second
-
-    if not got_lock:
-        # another worker already broadcasting this event
-        return  
 
     # Prepare payload
     payload = {
@@ -51,41 +56,32 @@ def publish_event(stake, event, target_client_id=None):
     }
 
     # Publish to Redis channel
-    r.publish(ch, json.dumps(payload))
-
-    # Safely release lock ONLY if we still own it
-    try:
-        release_script = """
-        if redis.call("GET", KEYS[1]) == ARGV[1] then
-            return redis.call("DEL", KEYS[1])
-        else
-            return 0
-        end
-        """
-        r.eval(release_script, 1, lock_key, lock_token)
-    except Exception:
-        pass
+    r.publish(ch, json.dumps(metrics.stamp(payload)))
+
+def publish_db_event(stake, event_type, data):
+    """Hand a row write to dbworker.py; the game engine never waits on the database."""
+    data.setdefault("stake", stake)
+    db_events.publish_db_event(r, event_type, data)
 
 # --- Redis state helpers ---
 class RedisState:
     def __init__(self, redis_client, stake):
         self.redis_client = redis_client
         self.stake = stake
+        self.lobby = LobbyStore(redis_client, stake)
+        self.snapshot = RoomSnapshot(redis_client, snapshot_key(stake))
 
 
     # --- Player selection ---
     def get_selected_players(self):
-        key = f"selected_players_{self.stake}"
-        data = self.redis_client.get(key)
-        return json.loads(data) if data else []
+        return self.lobby.get_selected_players()
 
     def set_selected_players(self, players):
-        key = f"selected_players_{self.stake}"
-        self.redis_client.set(key, json.dumps(players))
+        self.lobby.set_selected_players(players)
 
     # --- Player count ---
     def get_player_count(self):
-        return int(self.redis_client.get(f"player_count_{self.stake}") or 0)
+        return self.lobby.get_player_count()
 
     def set_player_count(self, count):
         self.redis_client.set(f"player_count_{self.stake}", count)
@@ -98,6 +94,13 @@ class RedisState:
     def set_game_state(self, key, value, game_id):
         self.redis_client.set(f"game_state_{game_id}_{key}", json.dumps(value))
     
+    def claim_winner(self, game_id, winner):
+        """First caller wins: the winner is recorded only if none is set yet."""
+        claimed = self.redis_client.set(f"game_state_{game_id}_winner", json.dumps(winner), nx=True)
+        if claimed:
+            self.set_game_state("bingo", True, game_id)
+        return bool(claimed)
+
     def save_game_data(self, game):
         """
         Save full game metadata to Redis.
@@ -149,6 +152,15 @@ class RedisState:
         remaining = max(0, int(next_start_ts - now))
         return remaining
 
+    def idle_stat(self):
+        return {
+            "type": "game_stat",
+            "running": False,
+            "message": "No game is currently running.",
+            "number_of_players": self.get_player_count(),
+            "remaining_seconds": self.get_remaining_time(),
+        }
+
     # --- End game ---
     def end_game(self, game_id):
         self.set_game_state("is_running", False, game_id=game_id)
@@ -156,85 +168,11 @@ class RedisState:
 
     # --- Winner price calculation ---
     def calculate_winner_price(self, no_p, stake):
-        try:
-            no_p = float(no_p)
-            stake = float(stake)
-            winner = no_p * stake
-            if winner > 100:
-                winner -= (winner * 0.2)
-            return round(winner, 2)
-        except (ValueError, TypeError):
-            return 0.0
+        return payout.calculate_winner_price(no_p, stake)
 
     # --- Active games ---
     def get_all_active_games(self):
-        active_games = {}
-        stakes = [10, 20, 30, 40, 50, 100, 150, 200]
-        bonus_stakes = {10, 20, 50}
-
-        current_time = timezone.now()
-        current_timestamp = current_time.timestamp()
-
-        for stake in stakes:
-            stake_str = str(stake)
-            stake_key = f"stake_state_{stake}_current_game_id"
-            next_start_key = f"stake_state_{stake}_next_game_start"
-            player_count_key = f"player_count_{stake}"
-
-            current_game_id = self.redis_client.get(stake_key)
-            current_game_id = json.loads(current_game_id) if current_game_id else None
-
-            next_game_start = self.redis_client.get(next_start_key)
-            next_game_start = json.loads(next_game_start) if next_game_start else None
-
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
-            has_bonus = stake in bonus_stakes
-
-            if is_running and current_game_id:
-                try:
-                    current_game = Game.objects.get(id=current_game_id)
-                except Game.DoesNotExist:
-                    active_games[stake_str] = {
-                        "is_running": False,
-                        "remaining_seconds": 0,
-                        "winner_price": 0,
-                        "bonus": has_bonus,
-                    }
-                    continue
-
-                if current_game.played == "closed":
-                    active_games[stake_str] = {
-                        "is_running": False,
-                        "remaining_seconds": 0,
-                        "winner_price": 0,
-                        "bonus": has_bonus,
-                    }
-                else:
-                    active_games[stake_str] = {
-                        "is_running": True,
-                        "remaining_seconds": 0,
-                        "winner_price": float(current_game.winner_price),
-                        "bonus": has_bonus,
-                    }
-
-            elif next_game_start and next_game_start > current_timestamp:
-                remaining = int(next_game_start - current_timestamp)
-                no_p = int(self.redis_client.get(player_count_key) or 0)
-                winner = self.calculate_winner_price(no_p, stake)
-                active_games[stake_str] = {
-                    "is_running": False,
-                    "remaining_seconds": remaining,
-                    "winner_price": winner,
-                    "bonus": has_bonus,
-                }
-            else:
-                active_games[stake_str] = {
-                    "is_running": False,
-                    "remaining_seconds": 0,
-                    "winner_price": 0,
-                    "bonus": has_bonus,
-                }
-        return active_games
+        return build_active_games(self.redis_client, self.calculate_winner_price)
     
     def broadcast_active_games(self):
         publish_event(
@@ -247,14 +185,31 @@ class RedisState:
 
     
     def broadcast_player_list(self):
-        # Send player list update
-        publish_event(
-            stake=self.stake,
-            event={
-                "type": "player_list",
-                "player_list": self.get_selected_players()
-            }
-        )
+        """Coalesced: lobby changes within one window share a single snapshot."""
+        lobby_broadcasts.request(f"lobby:{self.stake}", self._publish_lobby_state, redis_client=self.redis_client)
+        # Update the “all stakes” overview
+        lobby_broadcasts.request("lobby:all", self.broadcast_active_games, redis_client=self.redis_client)
+
+    def _publish_lobby_state(self):
+        # Connect-time document first, so a client joining now is never behind the deltas
+        snapshot_seq, players = self.lobby.snapshot()
+        self.snapshot.set_lobby(self.idle_stat(), players, snapshot_seq)
+
+        # Send only what changed since the last broadcast; a full list is
+        # needed when the lobby was reset or the delta log was trimmed.
+        from_seq, seq, changes = self.lobby.take_changes()
+        if changes is None:
+            self.publish_player_list_snapshot()
+        elif changes:
+            publish_event(
+                stake=self.stake,
+                event={
+                    "type": "player_list_delta",
+                    "from_seq": from_seq,
+                    "seq": seq,
+                    "changes": changes
+                }
+            )
 
         # Send player/game stats
         publish_event(
@@ -267,8 +222,18 @@ class RedisState:
             }
         )
 
-        # Update the “all stakes” overview
-        self.broadcast_active_games()
+    def publish_player_list_snapshot(self, target_client_id=None):
+        """Full player list tagged with its seq (on connect or after a client saw a gap)."""
+        seq, players = self.lobby.snapshot()
+        publish_event(
+            stake=self.stake,
+            event={
+                "type": "player_list",
+                "seq": seq,
+                "player_list": players
+            },
+            target_client_id=target_client_id
+        )
 
 class GameManager:
     def __init__(self, redis_state: RedisState, stake, room_group_name, client_id=None):
@@ -277,12 +242,39 @@ class GameManager:
         stake: stake (str or int)
         room_group_name: e.g. "game_10"
         client_id: the Twisted client_id to target single-client events
+
+        A manager lives as long as its stake (see redis_worker.py): per-message
+        state is only ``client_id``, set by ``handling()``.
         """
         self.redis_state = redis_state
         self.stake = str(stake)
         self.room_group_name = room_group_name
         self.client_id = client_id
-        self.lock = threading.Lock()
+        self.lock = threading.Lock()  # serializes client commands with the game start
+        self.trackers = {}  # game_id -> patterns.GameTracker for games drawn by this manager
+        self.events_channel = f"game:{self.stake}:events"
+
+        # --- stake config, read once ---
+        try:
+            self.stake_amount = Decimal(int(self.stake))
+            self.stake_payout = payout.for_stake(self.stake_amount)
+        except (ValueError, TypeError):
+            self.stake_amount = None
+            self.stake_payout = None
+
+    @contextmanager
+    def handling(self, client_id=None):
+        """Hold the stake lock while one client's command is handled."""
+        with self.lock:
+            self.client_id = client_id
+            try:
+                yield self
+            finally:
+                self.client_id = None
+
+    def random_player(self):
+        """The stake's RandomPlayer row (or None), from the process-wide cache."""
+        return random_players.get(self.stake)
 
     # ---- internal publish helper (uses redis pubsub format your Twisted server expects) ----
     def _publish(self, event, target_client_id=None, room_name=None):
@@ -293,8 +285,7 @@ class GameManager:
             payload["target_client_id"] = target_client_id
         if room_name:
             payload["room_name"] = room_name
-        ch = f"game:{self.stake}:events"
-        r.publish(ch, json.dumps(payload))
+        r.publish(self.events_channel, json.dumps(metrics.stamp(payload)))
     
     # ---- player management ----
     def add_player(self, payload):
@@ -323,29 +314,8 @@ class GameManager:
             )
             return
 
-        # load/set selected players
-        selected_players = self.redis_state.get_selected_players()
-        selected_players = [p for p in selected_players if p["user"] != player_id]
-
         card_ids = card_id if isinstance(card_id, list) else [card_id]
 
-        used_cards = set()
-        for p in selected_players:
-            # handle nested lists
-            for c in (p.get("card") or []):
-                if isinstance(c, list):
-                    used_cards.update(c)
-                else:
-                    used_cards.add(c)
-
-        conflicts = [c for c in card_ids if c in used_cards]
-        if conflicts:
-            self._publish(
-                {"type": "error", "message": f"Card(s) already selected: {conflicts}"},
-                target_client_id=self.client_id
-            )
-            return
-
         # validate user & balance
         try:
             user = User.objects.get(id=player_id)
@@ -357,34 +327,35 @@ class GameManager:
             self._publish({"type":"error","message":"User account is inactive."}, target_client_id=self.client_id)
             return
 
-        try:
-            stake_decimal = Decimal(int(self.stake))
-        except:
+        if self.stake_amount is None:
             self._publish({"type":"error","message":"Invalid stake."}, target_client_id=self.client_id)
             return
 
-        total_cost = stake_decimal * len(card_ids)
+        total_cost = self.stake_amount * len(card_ids)
 
         if (user.wallet + user.bonus) < total_cost:
             self._publish({"type":"error","message":"Insufficient balance."}, target_client_id=self.client_id)
             return
 
-        # all good → update redis state
-        selected_players.append({"user": int(player_id), "card": card_ids})
-        self.redis_state.set_selected_players(selected_players)
-        self.redis_state.set_player_count(sum(len(p["card"]) for p in selected_players))
+        # all good → reserve the cards; conflict check and count update are one atomic step
+        claimed, conflicts = self.redis_state.lobby.claim(player_id, card_ids)
+        if not claimed:
+            self._publish(
+                {"type": "error", "message": f"Card(s) already selected: {conflicts}"},
+                target_client_id=self.client_id
+            )
+            return
+        seq, selected_players = self.redis_state.lobby.snapshot()
 
         # send success only to this client (but include player_list so client can update UI)
         self._publish({
             "type": "add_player_success",
+            "seq": seq,
             "player_list": selected_players
         }, target_client_id=self.client_id)
 
-        # Also broadcast updated player_list to everyone (no target_client_id)
-        self._publish({
-            "type": "player_list",
-            "player_list": selected_players
-        }, target_client_id=None)
+        # Everyone else gets the coalesced player_list/game_stat
+        self.redis_state.broadcast_player_list()
 
     def remove_player(self, payload):
         """payload expects player_id"""
@@ -393,13 +364,15 @@ class GameManager:
             self._publish({"type":"error","message":"player_id required"}, target_client_id=self.client_id)
             return
 
-        selected_players = [p for p in self.redis_state.get_selected_players() if p["user"] != int(player_id)]
-        self.redis_state.set_selected_players(selected_players)
-        self.redis_state.set_player_count(sum(len(p["card"]) for p in selected_players))
+        self.redis_state.lobby.release(player_id)
 
         # Notify the caller and broadcast player_list
         self._publish({"type":"player_removed","user_id": player_id}, target_client_id=self.client_id)
-        self._publish({"type":"player_list","player_list": selected_players}, target_client_id=None)
+        self.redis_state.broadcast_player_list()
+
+    def sync_player_list(self, payload=None):
+        """A client noticed a gap in the player_list_delta seqs: resend the full list."""
+        self.redis_state.publish_player_list_snapshot(target_client_id=self.client_id)
 
     # ---- start game scheduling ----
     def try_start_game(self):
@@ -420,6 +393,7 @@ class GameManager:
                     self.redis_state.set_game_state("is_running", False, current_game_id)
                     current_game_id = None
                     self.redis_state.set_stake_state("current_game_id", None)
+                    self.redis_state.snapshot.clear_running()
             except Game.DoesNotExist:
                 pass
 
@@ -429,30 +403,49 @@ class GameManager:
 
         # schedule next game if none
         if not next_game_start or next_game_start < current_time.timestamp():
-            self.redis_state.set_stake_state("next_game_start", current_time.timestamp() + 30)
+            # the scheduler key makes concurrent requests for this stake share one countdown
+            if not scheduler.call_later(COUNTDOWN_SECONDS, f"start:{self.stake}", self._start_game_logic):
+                return None
+            next_game_start = current_time.timestamp() + COUNTDOWN_SECONDS
+            self.redis_state.set_stake_state("next_game_start", next_game_start)
+            self.redis_state.snapshot.set_countdown(next_game_start)
             # inform clients about countdown
-            self._publish({"type":"timer_message", "remaining_seconds":30}, target_client_id=None)
+            self._publish({"type":"timer_message", "remaining_seconds":COUNTDOWN_SECONDS}, target_client_id=None)
             self.redis_state.broadcast_active_games()
-            # start actual start in background
-            threading.Thread(target=self._delayed_start, daemon=True).start()
             # also try adding random players
-            threading.Thread(target=self.try_adding_random_players, daemon=True).start()
-            return {"type":"scheduled_start","remaining_seconds":30}
+            scheduler.call_later(3, f"random_players:{self.stake}", self.try_adding_random_players)
+            return {"type":"scheduled_start","remaining_seconds":COUNTDOWN_SECONDS}
         return None
 
-    def _delayed_start(self):
-        time.sleep(30)
-        self._start_game_logic()
-
     def _start_game_logic(self):
-        selected_players = self.redis_state.get_selected_players()
-        if not selected_players or len(selected_players) < 2:
+        # no card can be claimed between reading the lobby and marking the game running
+        with self.lock:
+            new_game, selected_players = self._create_game()
+        if new_game is None:
             # broadcast not enough players
             self._publish({"type":"error","message":"Not enough players to start"}, target_client_id=None)
             # reset schedule and keep trying
+            self.redis_state.set_stake_state("next_game_start", None)
+            self.redis_state.snapshot.set_countdown(None)
             self.try_start_game()
             return
 
+        # broadcast game started
+        self._publish({
+            "type":"game_started",
+            "game_id": new_game.id,
+            "player_list": selected_players,
+            "stake": self.stake
+        }, target_client_id=None)
+
+        # settle entries now; the draws are driven by the scheduler from here on
+        self.start_game_with_random_numbers(new_game, selected_players)
+
+    def _create_game(self):
+        selected_players = self.redis_state.get_selected_players()
+        if not selected_players or len(selected_players) < 2:
+            return None, selected_players
+
         # create game
         player_card_map = {str(p["user"]): p["card"] for p in selected_players}
         new_game = Game.objects.create(
@@ -472,17 +465,7 @@ class GameManager:
 
         self.redis_state.set_game_state("is_running", True, game_id=new_game.id)
         self.redis_state.set_stake_state("current_game_id", new_game.id)
-
-        # broadcast game started
-        self._publish({
-            "type":"game_started",
-            "game_id": new_game.id,
-            "player_list": selected_players,
-            "stake": self.stake
-        }, target_client_id=None)
-
-        # start number broadcaster thread
-        threading.Thread(target=self.start_game_with_random_numbers, args=(new_game, selected_players), daemon=True).start()
+        return new_game, selected_players
 
     def generate_random_numbers(self):
         import secrets
@@ -495,256 +478,119 @@ class GameManager:
     # ---- random players ----
     def try_adding_random_players(self):
         try:
-            rp = RandomPlayer.objects.filter(on_off=True, stake=Decimal(self.stake)).first()
+            rp = self.random_player()
         except Exception:
             return
-        if not rp:
+        if not rp or not rp.on_off:
             return
-        time.sleep(3)
         number_of_players = rp.number_of_players
         number_of_players = random.randint(max(1, number_of_players - 3), number_of_players + 2)
         selection = 2 if number_of_players >= 10 else 1
-        for _ in range(number_of_players // selection):
-            selected_players = self.redis_state.get_selected_players()
-            used = set()
-            for p in selected_players:
-                for c in p.get("card", []):
-                    if isinstance(c, list):
-                        used.update(c)
-                    else:
-                        used.add(c)
-            card_ids = []
-            while len(card_ids) < selection:
-                candidate = random.randint(1, 120)
-                if candidate not in used:
-                    card_ids.append(candidate)
-                    used.add(candidate)
-            selected_players.append({"user": 0, "card": card_ids})
-            self.redis_state.set_selected_players(selected_players)
-            # broadcast using redis format
-            self._publish({"type":"player_list","player_list":selected_players}, target_client_id=None)
-            self.redis_state.set_player_count(sum(len(p["card"]) for p in selected_players))
-            time.sleep(2)
-
-    # ---- number broadcast + game finish ----
-    def start_game_with_random_numbers(self, game, selected_players):
-        # similar to your previous implementation but using _publish for events
-        self.redis_state.set_game_state("is_running", True, game.id)
-        self.redis_state.set_game_state("bingo", False, game.id)
-
-        game.played = "Playing"
-        game.save()
-
-        stake_amount = Decimal(game.stake)
-        updated_player_cards = []
-
-        # deduplicate entries (keep last)
-        unique = {}
-        zeros = []
-        for e in selected_players:
-            if int(e["user"]) == 0:
-                zeros.append(e)
-            else:
-                unique[e["user"]] = e
-        dedup = zeros + list(unique.values())
-
-        # handle deductions and build updated_player_cards
-        for entry in dedup:
-            try:
-                if int(entry["user"]) == 0:
-                    cards = entry["card"]
-                    flat = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
-                    # deduct from RandomPlayer wallet
-                    rp = RandomPlayer.objects.filter(stake=Decimal(self.stake)).first()
-                    if rp:
-                        rp.wallet -= stake_amount * len(flat)
-                        rp.save(update_fields=["wallet"])
-                else:
-                    uid = int(entry["user"])
-                    cards = entry["card"]
-                    flat = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
-                    user = User.objects.get(id=uid)
-                    total = stake_amount * len(flat)
-                    avail = user.wallet + user.bonus
-                    if avail < total:
-                        # remove player due to insufficient funds
-                        continue
-                    remaining = total
-                    if user.wallet >= remaining:
-                        user.wallet -= remaining
-                        remaining = Decimal("0")
-                    else:
-                        remaining -= user.wallet
-                        user.wallet = Decimal("0")
-                    if remaining > 0:
-                        user.bonus -= remaining
-                    user.save()
-                entry["card"] = flat
-                updated_player_cards.append(entry)
-            except Exception:
-                # skip problematic entry
-                continue
-
-        game.numberofplayers = sum(len(p["card"]) for p in updated_player_cards)
-        game.playerCard = updated_player_cards
-
-        winner_price = stake_amount * game.numberofplayers
-        if winner_price >= 100:
-            admin_cut = winner_price * Decimal("0.2")
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-        elif 50 <= winner_price < 100:
-            admin_cut = winner_price * Decimal("0.1")
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-        else:
-            game.admin_cut = Decimal("0")
-        game.winner_price = winner_price
-        game.save()
-
-        bonus_text = "10X" if int(self.stake) in (10, 20, 50) and game.numberofplayers >= 10 else ""
+        self._add_random_player(number_of_players // selection, selection)
 
-        # broadcast game_stat
-        self._publish({
-            "type": "game_stat",
-            "number_of_players": game.numberofplayers,
-            "stake": game.stake,
-            "winner_price": float(game.winner_price),
-            "bonus": bonus_text,
-            "game_id": game.id,
-            "is_running": True
-        }, target_client_id=None)
+    def _add_random_player(self, remaining, selection):
+        """One random-player entry per tick, every 2 seconds, until the countdown ends."""
+        next_game_start = self.redis_state.get_stake_state("next_game_start")
+        if remaining <= 0 or not next_game_start or next_game_start < time.time():
+            return
 
-        time.sleep(5)
-        # draw numbers
-        numbers = json.loads(game.random_numbers)
-        for num in numbers:
-            # stop conditions
-            is_running = self.redis_state.get_game_state("is_running", game.id)
-            bingo_flag = self.redis_state.get_game_state("bingo", game.id)
-            if not is_running or bingo_flag:
+        lobby = self.redis_state.lobby
+        used = lobby.taken_cards()
+        free = [c for c in range(1, 121) if c not in used]
+        # a real player may grab a card between the read and the claim; just pick again
+        for _ in range(3):
+            if len(free) < selection:
                 break
+            card_ids = random.sample(free, selection)
+            claimed, conflicts = lobby.claim(0, card_ids)
+            if claimed:
+                self.redis_state.broadcast_player_list()
+                break
+            free = [c for c in free if c not in conflicts]
 
-            with self.lock:
-                # broadcast number
-                self._publish({"type":"random_number","random_number":num,"game_id":game.id}, target_client_id=None)
-                called = self.redis_state.get_game_state("called_numbers", game.id) or []
-                if not isinstance(called, list):
-                    called = []
-                called.append(num)
-                self.redis_state.set_game_state("called_numbers", called, game.id)
-
-            # allow random players check
-            time.sleep(2)
-            self.check_bingo_for_random_players(called, game)
-            time.sleep(2)
-
-        # finalize game
-        game.played = "closed"
-        game.save()
-        self.redis_state.set_game_state("is_running", False, game.id)
+        scheduler.call_later(2, f"random_players:{self.stake}", self._add_random_player, remaining - 1, selection)
 
-        # reset selection
-        self.redis_state.set_selected_players([])
-        self.redis_state.set_player_count(0)
-        self._publish({"type":"player_list","player_list":[]}, target_client_id=None)
-        # schedule next
-        self.try_start_game()
+    def _build_tracker(self, game):
+        """Index the game's cards once so each draw only touches the cards holding that number."""
+        cards, owners = {}, {}
+        for entry in game.playerCard:
+            for card_id in entry["card"]:
+                number_masks = card_catalog.masks(card_id)
+                if number_masks is None:
+                    continue
+                cards[int(card_id)] = number_masks
+                owners[int(card_id)] = int(entry["user"])
+        tracker = patterns.GameTracker(cards, owners)
+        tracker.call(patterns.FREE_SPACE)
+        self.trackers[game.id] = tracker
+        return tracker
 
     # ---- bingo checks for random players (keeps old logic but uses _publish) ----
     def check_bingo_for_random_players(self, calledNumbers, game):
-        from game.models import Card
-        from custom_auth.models import RandomPlayer
-
         selected_players = game.playerCard
 
         if game.winner != 0 or game.played == "closed":
             return
+        if self.redis_state.get_game_state("bingo", game.id):
+            return
 
+        # called numbers live in Redis; dbworker writes them with the final row
         called_numbers_list = calledNumbers + [0]
-        game.total_calls = len(called_numbers_list)
-        game.save_called_numbers(called_numbers_list)
-        game.save()
-
-        for entry in selected_players:
-            if entry["user"] == 0:
-                for card_id in entry["card"]:
-                    try:
-                        card = Card.objects.get(id=card_id)
-                    except Card.DoesNotExist:
-                        continue
-                    numbers = json.loads(card.numbers)
-                    winning_numbers = self.has_bingo(numbers, called_numbers_list)
-                    if winning_numbers:
-                        random_ids = [217, 72, 173, 1, 170]
-                        rp = RandomPlayer.objects.filter(stake=Decimal(self.stake)).first()
-                        if not rp:
-                            continue
-                        random_name = random.choice(rp.names) if rp.names else "Random"
-                        random_id = random.choice(random_ids)
-                        bones_amount = 0
-                        stake = int(self.stake)
-                        if stake in (10,20,50) and game.numberofplayers >= 10:
-                            bones = len(called_numbers_list)
-                            # multiplier logic same as before
-                            if bones <= 5:
-                                multiplier = 10
-                            elif bones == 6:
-                                multiplier = 9
-                            elif bones == 7:
-                                multiplier = 8
-                            elif bones == 8:
-                                multiplier = 7
-                            elif bones == 9:
-                                multiplier = 6
-                            elif bones == 10:
-                                multiplier = 5
-                            elif bones == 11:
-                                multiplier = 4
-                            elif bones == 12:
-                                multiplier = 3
-                            elif bones == 13:
-                                multiplier = 3
-                            elif bones == 14:
-                                multiplier = 2
-                            elif bones == 15:
-                                multiplier = 2
-                            else:
-                                multiplier = 0
-                            bones_amount = stake * multiplier
-
-                        game.winner = random_id
-                        game.winner_card = card.id
-                        game.winner_name = random_name
-                        game.played = "closed"
-                        game.total_calls = len(called_numbers_list)
-                        game.save()
-
-                        bingo_event = {
-                            "type": "result",
-                            "data": [{
-                                "card_name": card.id,
-                                "message": "Bingo",
-                                "name": random_name,
-                                "user_id": random_id,
-                                "card": json.loads(card.numbers),
-                                "winning_numbers": winning_numbers,
-                                "called_numbers": called_numbers_list,
-                                "bones_won": bones_amount
-                            }],
-                            "game_id": game.id
-                        }
-
-                        bingo_flag = self.redis_state.get_game_state("bingo", game.id)
-                        if bingo_flag is False:
-                            # credit random player
-                            rp.wallet += (game.winner_price + bones_amount)
-                            rp.save()
-                            self.redis_state.set_game_state("bingo", True, game.id)
-                            # broadcast bingo to all
-                            self._publish(bingo_event, target_client_id=None)
-
-                        return
+
+        tracker = self.trackers.get(game.id)
+        if tracker is not None:
+            # only random-player cards the incremental engine saw complete a line
+            random_cards = tracker.completed_for(0)
+        else:
+            random_cards = [card_id for entry in selected_players if entry["user"] == 0 for card_id in entry["card"]]
+
+        for card_id in random_cards:
+            numbers = card_catalog.grid(card_id)
+            if numbers is None:
+                continue
+            if tracker is not None:
+                winning_numbers = tracker.winning_numbers(card_id)
+            else:
+                winning_numbers = card_catalog.has_bingo(card_id, called_numbers_list)
+            if winning_numbers:
+                random_ids = [217, 72, 173, 1, 170]
+                rp = self.random_player()
+                if not rp:
+                    continue
+                random_name = random.choice(rp.names) if rp.names else "Random"
+                random_id = random.choice(random_ids)
+                bones_amount = self.stake_payout.bonus(len(called_numbers_list), game.numberofplayers, "twisted")
+
+                bingo_event = {
+                    "type": "result",
+                    "data": [{
+                        "card_name": card_id,
+                        "message": "Bingo",
+                        "name": random_name,
+                        "user_id": random_id,
+                        "card": numbers,
+                        "winning_numbers": winning_numbers,
+                        "called_numbers": called_numbers_list,
+                        "bones_won": bones_amount
+                    }],
+                    "game_id": game.id
+                }
+
+                winner = {
+                    "winner_id": random_id,
+                    "winner_card": card_id,
+                    "winner_name": random_name,
+                    "random_player": True,
+                    "bones_won": bones_amount,
+                    "total_calls": len(called_numbers_list),
+                }
+                if self.redis_state.claim_winner(game.id, winner):
+                    # random player is credited by dbworker with the final game row
+                    self._publish_game_ended(game, winner)
+                    # broadcast bingo to all
+                    self._publish(bingo_event, target_client_id=None)
+
+                return
     def check_bingo(self,payload):
         current_game_id = self.redis_state.get_stake_state("current_game_id")
         is_running = self.redis_state.get_game_state("is_running", current_game_id) if current_game_id else False
@@ -762,8 +608,7 @@ class GameManager:
         self.checkBingo(user_id, called_numbers, current_game_id)
 
     def checkBingo(self, user_id, called_numbers, game_id):
-        import json
-        from game.models import Card, Game
+        from game.models import Game
         from custom_auth.models import User
 
         result = []
@@ -795,13 +640,11 @@ class GameManager:
             return
 
         # --- Check if game already has a winner ---
-        if game.played == "closed" or game.winner:
+        if game.played == "closed" or game.winner or self.redis_state.get_game_state("bingo", game.id):
             return
 
         # --- Normalize called numbers (+ free space) ---
         called_numbers = list(set(called_numbers + [0]))
-        game.total_calls = len(called_numbers)
-        game.save_called_numbers(called_numbers)
 
         # --- Flatten cards ---
         def flatten(lst):
@@ -812,54 +655,42 @@ class GameManager:
                     yield int(item)
 
         card_ids = list(flatten(player_cards))
-        cards = Card.objects.filter(id__in=card_ids)
+        cards = card_catalog.cards(card_ids)
 
         user = User.objects.get(id=user_id)
 
         bingo_found = False
+        called = patterns.called_mask(called_numbers)
 
         for card in cards:
-            numbers = json.loads(card.numbers)
-            winning_numbers = self.has_bingo(numbers, called_numbers)
+            winning_numbers = card_catalog.has_bingo(card["id"], called)
 
             if not winning_numbers:
                 continue
 
             # --- Calculate bones if applicable ---
-            bones_amount = 0
-            stake = int(game.stake)
-            if stake in (10, 20, 50) and game.numberofplayers >= 10:
-                bones = len(called_numbers)
-                multiplier_map = {
-                    5: 10, 6: 9, 7: 8, 8: 7,
-                    9: 6, 10: 5, 11: 4, 12: 3,
-                    13: 3, 14: 2, 15: 2
-                }
-                bones_amount = stake * multiplier_map.get(bones, 0)
-
-            # --- Update game winner fields ---
-            game.winner = user.id
-            game.winner_card = card.id
-            game.winner_name = user.name
-            game.played = "closed"
-            game.total_calls = len(called_numbers)
-            game.bonus = bones_amount
-
-            # Save all winner fields explicitly
-            game.save(update_fields=["winner", "winner_card", "winner_name", "played", "total_calls", "bonus"])
-
-            # --- Pay user once ---
-            if not self.redis_state.get_game_state("bingo", game.id):
-                user.wallet += game.winner_price + bones_amount
-                user.save()
-                self.redis_state.set_game_state("bingo", True, game.id)
+            bones_amount = payout.for_stake(game.stake).bonus(len(called_numbers), game.numberofplayers, "twisted")
+
+            # --- Record the winner once; dbworker writes the row and pays ---
+            winner = {
+                "winner_id": user.id,
+                "winner_card": card["id"],
+                "winner_name": user.name,
+                "random_player": False,
+                "bones_won": bones_amount,
+                "total_calls": len(called_numbers),
+            }
+            if not self.redis_state.claim_winner(game.id, winner):
+                return
+            # durable right away: the draw loop that closes the room may never run again
+            self._publish_game_ended(game, winner)
 
             result.append({
-                "card_name": card.id,
+                "card_name": card["id"],
                 "message": "Bingo",
                 "name": user.name,
                 "user_id": user.id,
-                "card": json.loads(card.numbers),
+                "card": card["numbers"],
                 "winning_numbers": winning_numbers,
                 "called_numbers": called_numbers,
                 "bones_won": bones_amount
@@ -893,63 +724,7 @@ class GameManager:
 
 
     def has_bingo(self, card, called_numbers):
-        winning_columns = 0
-        corner_count = 0
-        winning_numbers = []
-
-        # Check diagonals
-        diagonal2 = [card[i][i] for i in range(len(card))]
-        diagonal1 = [card[i][len(card) - 1 - i] for i in range(len(card))]
-        if all(number in called_numbers for number in diagonal2):
-            winning_numbers.extend([1, 7, 13, 19, 25])
-        if all(number in called_numbers for number in diagonal1):
-            winning_numbers.extend([5, 9, 13, 17, 21])
-
-        # Check rows
-        for row_index, row in enumerate(card):
-            if all(number in called_numbers for number in row):
-                winning_numbers.extend([(row_index * 5) + i + 1 for i in range(5)])
-
-        # Check columns
-        for col in range(len(card[0])):
-            if all(card[row][col] in called_numbers for row in range(len(card))):
-                winning_columns = col + 1
-                winning_numbers.extend([winning_columns + (i * 5) for i in range(5)])
-
-        # Check corners
-        if card[0][0] in called_numbers:
-            corner_count += 1
-        if card[0][4] in called_numbers:
-            corner_count += 1
-        if card[4][0] in called_numbers:
-            corner_count += 1
-        if card[4][4] in called_numbers:
-            corner_count += 1
-
-        if corner_count == 4:
-            winning_numbers.extend([1, 5, 21, 25])
-
-        inner_corner_count = 0
-        # Check the top-left corner (1, 1)
-        if card[1][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the top-right corner (1, 5)
-        if card[1][3] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-left corner (5, 1)
-        if card[3][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-right corner (5, 5)
-        if card[3][3] in called_numbers:
-            inner_corner_count += 1
-
-        if inner_corner_count == 4:
-            winning_numbers.extend([7, 9, 17, 19])
-
-        return winning_numbers
+        return patterns.has_bingo(card, called_numbers)
 
     def get_card_data(self, payload):
         user_id = payload.get("userId")
@@ -985,15 +760,8 @@ class GameManager:
             )
             return
 
-        # --- Fetch card objects ---
-        cards = Card.objects.filter(id__in=user_cards)
-        bingo_table_data = [
-            {
-                "id": card.id,
-                "numbers": json.loads(card.numbers)
-            }
-            for card in cards
-        ]
+        # --- Fetch card grids ---
+        bingo_table_data = card_catalog.cards(user_cards)
 
         # --- Send card data to specific user ---
         publish_event(
@@ -1015,11 +783,7 @@ class GameManager:
             try:
                 current_game = Game.objects.get(id=current_game_id)
                 # Bonus text logic
-                stake_value = int(self.stake or 0)
-                if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                    bonus_text = "10X"
-                else:
-                    bonus_text = ""
+                bonus_text = self.stake_payout.bonus_text(current_game.numberofplayers)
 
                 stats = {
                     "type": "game_stat",
@@ -1059,9 +823,7 @@ class GameManager:
     def start_game_with_random_numbers(self, game, selected_players):
         import json
         import uuid
-        import time
         from decimal import Decimal
-        from custom_auth.models import RandomPlayer, User
 
         # --- Redis client ---
         redis_client = getattr(self.redis_state, "redis_client", None)
@@ -1073,11 +835,10 @@ class GameManager:
 
         # --- Distributed lock ---
         lock_key = f"game:{game.id}:broadcast_lock"
-        lock_ttl = 10  # lock expires every 10 seconds unless renewed
         lock_token = str(uuid.uuid4())
 
         try:
-            acquired = redis_client.set(lock_key, lock_token, nx=True, ex=lock_ttl)
+            acquired = redis_client.set(lock_key, lock_token, nx=True, ex=BROADCAST_LOCK_TTL)
             if not acquired:
                 print(f"🔒 Another worker already broadcasting for game {game.id}. Exiting.")
                 return
@@ -1093,7 +854,7 @@ class GameManager:
             game.save()
 
             # random player
-            random_player = RandomPlayer.objects.filter(stake=Decimal(self.stake)).first()
+            random_player = self.random_player()
 
             # broadcast "playing"
             publish_event(
@@ -1107,7 +868,6 @@ class GameManager:
 
             # ------- Remove duplicates + charge money -------
             stake_amount = Decimal(game.stake)
-            updated_player_cards = []
             unique_entries = {}
 
             for entry in selected_players:
@@ -1121,83 +881,26 @@ class GameManager:
                 entry for k, entry in unique_entries.items() if k != "zero_users"
             ]
 
-            for entry in dedup_players:
-                try:
-                    user_id = entry["user"]
-                    cards = entry["card"]
-
-                    # flatten cards if nested
-                    flat_cards = (
-                        [c for sub in cards for c in sub]
-                        if cards and isinstance(cards[0], list)
-                        else cards
-                    )
-
-                    total_ded = stake_amount * len(flat_cards)
-
-                    if int(user_id) == 0:
-                        if random_player:
-                            random_player.wallet -= total_ded
-                            random_player.save(update_fields=['wallet'])
-                    else:
-                        try:
-                            user = User.objects.get(id=user_id)
-                        except User.DoesNotExist:
-                            continue
-
-                        if (user.wallet + user.bonus) < total_ded:
-                            self.remove_player(user_id)
-                            continue
-
-                        remaining = total_ded
-
-                        if user.wallet >= remaining:
-                            user.wallet -= remaining
-                            remaining = Decimal('0')
-                        else:
-                            remaining -= user.wallet
-                            user.wallet = Decimal('0')
-
-                        if remaining > 0:
-                            user.bonus -= remaining
-
-                        try:
-                            user.no_of_games_played = (user.no_of_games_played or 0) + 1
-                        except:
-                            pass
-
-                        user.save()
-
-                    entry["card"] = flat_cards
-                    updated_player_cards.append(entry)
-
-                except Exception as e:
-                    print("Error processing entry:", e)
-                    try:
-                        self.remove_player(user_id)
-                    except:
-                        pass
+            # one transaction: lock every participant, charge in memory, bulk write
+            updated_player_cards, rejected = charge_entries(dedup_players, stake_amount, random_player)
+            for user_id in rejected:
+                self.redis_state.lobby.release(user_id)
+            record_participation(game, updated_player_cards)
 
             # update game model
             game.numberofplayers = sum(len(p["card"]) for p in updated_player_cards)
             game.playerCard = updated_player_cards
 
-            winner_price = stake_amount * game.numberofplayers
-
-            if winner_price >= 100:
-                admin_cut = winner_price * Decimal('0.2')
-                winner_price -= admin_cut
-            elif 50 <= winner_price < 100:
-                admin_cut = winner_price * Decimal('0.1')
-                winner_price -= admin_cut
-            else:
-                admin_cut = Decimal('0')
-
+            winner_price, admin_cut = payout.for_stake(stake_amount).split(game.numberofplayers)
             game.admin_cut = admin_cut
             game.winner_price = winner_price
             game.save()
+            # settled entries, for the card endpoints (see game/views.py)
+            self.redis_state.save_game_data(game)
 
-            bonus_text = "10X" if int(self.stake or 0) in [10, 20, 50] and game.numberofplayers >= 10 else ""
+            self._build_tracker(game)
+
+            bonus_text = payout.for_stake(stake_amount).bonus_text(game.numberofplayers)
 
             publish_event(
                 stake=self.stake,
@@ -1211,66 +914,116 @@ class GameManager:
                     'is_running': True
                 }
             )
-
-            time.sleep(5)
+            self.redis_state.snapshot.set_running(self._running_stat(game, []))
 
             # ------------ MAIN NUMBER LOOP ------------
+            # Each draw is a scheduler tick; deadlines advance by DRAW_INTERVAL
+            # from the previous deadline so the cadence does not drift.
             random_numbers = json.loads(game.random_numbers)
+            first_draw = scheduler.now() + 5
+            scheduler.call_at(first_draw, f"draw:{game.id}", self._draw_number,
+                              game, random_numbers, 0, first_draw, lock_key, lock_token)
 
-            for num in random_numbers:
+        except Exception as e:
+            print("🚨 start_game_with_random_numbers error:", e)
+            self._release_broadcast_lock(game, lock_key, lock_token)
 
-                # renew lock (HEARTBEAT)
-                current = redis_client.get(lock_key)
-                if current != lock_token:
-                    print(f"❌ Lost lock for game {game.id}. Stopping loop.")
-                    return
+    def _running_stat(self, game, called):
+        """``game_stat`` a client joining the running game gets (see game/room_snapshot.py)."""
+        return {
+            "type": "game_stat",
+            "number_of_players": game.numberofplayers,
+            "stake": game.stake,
+            "winner_price": float(game.winner_price),
+            "bonus": self.stake_payout.bonus_text(game.numberofplayers),
+            "game_id": game.id,
+            "running": True,
+            "called_numbers": called,
+        }
 
-                redis_client.expire(lock_key, lock_ttl)
+    def _draw_number(self, game, random_numbers, index, deadline, lock_key, lock_token):
+        redis_client = self.redis_state.redis_client
+        try:
+            # renew lock (HEARTBEAT)
+            current = redis_client.get(lock_key)
+            if current != lock_token:
+                print(f"❌ Lost lock for game {game.id}. Stopping loop.")
+                self.trackers.pop(game.id, None)
+                return
 
-                # stop if bingo or stopped externally
-                if not self.redis_state.get_game_state("is_running", game.id):
-                    break
+            redis_client.expire(lock_key, BROADCAST_LOCK_TTL)
 
-                if self.redis_state.get_game_state("bingo", game.id):
-                    break
+            # stop if bingo, stopped externally or out of numbers
+            if (index >= len(random_numbers)
+                    or not self.redis_state.get_game_state("is_running", game.id)
+                    or self.redis_state.get_game_state("bingo", game.id)):
+                self._finish_game(game, lock_key, lock_token)
+                return
 
-                last_sent = self.redis_state.get_game_state("last_sent_number", game.id)
-                if last_sent == num:
-                    continue
+            num = random_numbers[index]
+            last_sent = self.redis_state.get_game_state("last_sent_number", game.id)
+            if last_sent == num:
+                self._draw_number(game, random_numbers, index + 1, deadline, lock_key, lock_token)
+                return
 
-                publish_event(
-                    stake=self.stake,
-                    event={
-                        'type': 'random_number',
-                        'random_number': num,
-                        'game_id': game.id
-                    }
-                )
+            publish_event(
+                stake=self.stake,
+                event={
+                    'type': 'random_number',
+                    'random_number': num,
+                    'game_id': game.id,
+                    'sent_at': time.time(),  # lets clients (and the load test) see fan-out delay
+                }
+            )
 
-                # save state
-                called = self.redis_state.get_game_state("called_numbers", game.id) or []
-                if not isinstance(called, list):
-                    called = []
-                called.append(num)
+            # save state
+            called = self.redis_state.get_game_state("called_numbers", game.id) or []
+            if not isinstance(called, list):
+                called = []
+            called.append(num)
 
-                self.redis_state.set_game_state("called_numbers", called, game.id)
-                self.redis_state.set_game_state("last_sent_number", num, game.id)
+            self.redis_state.set_game_state("called_numbers", called, game.id)
+            self.redis_state.set_game_state("last_sent_number", num, game.id)
+            self.redis_state.snapshot.set_running(self._running_stat(game, called))
+            self.trackers[game.id].call(num)
 
-                time.sleep(2)
+            if GAME_CHECKPOINT_EVERY and len(called) % GAME_CHECKPOINT_EVERY == 0:
+                publish_db_event(self.stake, "GAME_CHECKPOINT", {
+                    "game_id": game.id,
+                    "called_numbers": called + [0],
+                    "total_calls": len(called) + 1,
+                })
 
-                # check random players
-                try:
-                    self.check_bingo_for_random_players(called, game)
-                except Exception as e:
-                    print("check_bingo_for_random_players error:", e)
+            # give real players a head start before random players are checked
+            scheduler.call_at(deadline + RANDOM_PLAYER_CHECK_DELAY, f"check:{game.id}", self._check_after_draw,
+                              game, random_numbers, index, deadline, called, lock_key, lock_token)
 
-                time.sleep(2)
+        except Exception as e:
+            print("🚨 start_game_with_random_numbers error:", e)
+            self._release_broadcast_lock(game, lock_key, lock_token)
+
+    def _check_after_draw(self, game, random_numbers, index, deadline, called, lock_key, lock_token):
+        # check random players
+        try:
+            self.check_bingo_for_random_players(called, game)
+        except Exception as e:
+            print("check_bingo_for_random_players error:", e)
 
+        next_draw = deadline + DRAW_INTERVAL
+        scheduler.call_at(next_draw, f"draw:{game.id}", self._draw_number,
+                          game, random_numbers, index + 1, next_draw, lock_key, lock_token)
+
+    def _finish_game(self, game, lock_key, lock_token):
+        try:
             # ------------ END GAME ------------
             self.redis_state.set_game_state("is_running", False, game.id)
+            self.redis_state.snapshot.clear_running()
+
+            # a claimed winner was persisted when it was claimed; otherwise nobody won
+            if not self.redis_state.get_game_state("winner", game.id):
+                self._publish_game_ended(game, {})
 
             self.redis_state.set_selected_players([])
-            self.redis_state.set_player_count(0)
             self.redis_state.broadcast_player_list()
 
             self.try_start_game()
@@ -1279,16 +1032,36 @@ class GameManager:
             print("🚨 start_game_with_random_numbers error:", e)
 
         finally:
-            # safe unlock with Lua
-            try:
-                release_script = """
-                if redis.call("GET", KEYS[1]) == ARGV[1] then
-                    return redis.call("DEL", KEYS[1])
-                else
-                    return 0
-                end
-                """
-                redis_client.eval(release_script, 1, lock_key, lock_token)
-                print(f"🔓 Released lock {lock_key}")
-            except Exception as e:
-                print("⚠️ Failed releasing lock:", e)
+            self._release_broadcast_lock(game, lock_key, lock_token)
+
+    def _publish_game_ended(self, game, winner):
+        """One write-behind row for the whole game (winner, calls, payout), see dbworker.py."""
+        called = self.redis_state.get_game_state("called_numbers", game.id) or []
+        publish_db_event(self.stake, "GAME_ENDED", {
+            "game_id": game.id,
+            "winner_id": winner.get("winner_id"),
+            "winner_card": winner.get("winner_card", 0),
+            "winner_name": winner.get("winner_name", ""),
+            "random_player": winner.get("random_player", False),
+            "winner_price": float(game.winner_price),
+            "bones_won": winner.get("bones_won", 0),
+            "total_calls": winner.get("total_calls", len(called) + 1),
+            "called_numbers": called + [0],
+        })
+
+    def _release_broadcast_lock(self, game, lock_key, lock_token):
+        self.trackers.pop(game.id, None)
+
+        # safe unlock with Lua
+        try:
+            release_script = """
+            if redis.call("GET", KEYS[1]) == ARGV[1] then
+                return redis.call("DEL", KEYS[1])
+            else
+                return 0
+            end
+            """
+            self.redis_state.redis_client.eval(release_script, 1, lock_key, lock_token)
+            print(f"🔓 Released lock {lock_key}")
+        except Exception as e:
+            print("⚠️ Failed releasing lock:", e)
@@ -1,20 +1,30 @@
+import asyncio
 import json
-import threading
 import time
 import random
 
 from django.template.defaultfilters import lower
 from django.utils import timezone
-from channels.generic.websocket import WebsocketConsumer
-from asgiref.sync import async_to_sync
-import redis
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from redis import asyncio as aioredis
 import uuid
 
+from game import patterns
+from game.card_catalog import bump_version as bump_card_catalog_version
+from game.scheduler import async_scheduler
+from game.broadcast import lobby_broadcasts
+from game import room_snapshot
+from game.settlement import record_participation, settle_consecutive_losses
+from game import payout
 
-class GroupConsumer(WebsocketConsumer):
-    redis_client = redis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+class GroupConsumer(AsyncWebsocketConsumer):
+    # Redis state through redis.asyncio, countdowns and draw loops as tasks on the
+    # server's event loop; only ORM work leaves the loop (database_sync_to_async).
+    redis_client = aioredis.StrictRedis(host='localhost', port=6379, db=0, decode_responses=True)
     game_threads_started = set()
-    lock = threading.Lock()
+    lock = asyncio.Lock()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -85,85 +95,74 @@ class GroupConsumer(WebsocketConsumer):
                 print(f"[Regen] {i}/{total} cards regenerated...")
     
         print(f"[Regen] ✅ All {total} non-active cards regenerated successfully.")
+        bump_card_catalog_version()
     
-    def connect(self):
-        from group.models import Group
-
+    async def connect(self):
         self.group = self.scope['url_route']['kwargs']['group']
         self.room_group_name = f'game_{self.group}'
-        self.accept()
+        await self.accept()
 
-        async_to_sync(self.channel_layer.group_add)(
+        await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
 
-        group = Group.objects.get(id=self.group)
-        current_game_id = self.get_group_state("current_game_id")
-        is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
+        # One HGETALL of the frames the game loop keeps encoded; the slow
+        # path below only runs until the room's first document exists.
+        doc = await self.snapshot.load()
+        frames = room_snapshot.frames(doc)
+        if frames is not None:
+            for frame in frames:
+                await self.send(text_data=frame)
+            if room_snapshot.needs_start(doc):
+                await self.try_start_game()
+            return
+
+        current_game_id = await self.get_group_state("current_game_id")
+        is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
+        group, current_game = await self.load_room(current_game_id if is_running else None)
         stats = {}
 
         if is_running:
-            from game.models import Game
-            current_game = Game.objects.get(id=current_game_id)
-            current_time = timezone.now()
-            if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400 or current_game.played == "closed":
-                print(f"Game {current_game_id} expired after 400s on connect — closing...")
-                current_game.played = "closed"
-                current_game.save(update_fields=["played"])
-                self.set_game_state("is_running", False, current_game_id)
-                self.set_group_state("current_game_id", None)
+            if current_game is None:
+                await self.set_game_state("is_running", False, current_game_id)
+                await self.set_group_state("current_game_id", None)
+                await self.snapshot.clear_running()
                 is_running = False
             else:
-                # Bonus text logic
-                stake_value = int(group.stake or 0)
-                if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                    bonus_text = "10X"
-                else:
-                    bonus_text = ""
-
-                stats = {
-                    "type": "game_stat",
-                    'number_of_players': current_game.numberofplayers,
-                    'stake': float(current_game.stake),
-                    'winner_price': float(current_game.winner_price),
-                    'bonus': bonus_text,
-                    'number_of_patterns': group.number_of_patterns,
-                    'game_id': current_game.id,
-                    "running": True,
-                    "called_numbers": self.get_game_state("called_numbers", current_game_id) or [],
-                }
-                self.send(text_data=json.dumps({
+                stats = self.running_game_stat(
+                    group, current_game, await self.get_game_state("called_numbers", current_game_id) or [])
+                await self.send(text_data=json.dumps({
                     "type": "game_in_progress",
                     "game_id": current_game_id
                 }))
         else:
-            self.try_start_game()
+            await self.try_start_game()
             stats = {
                 "type": "game_stat",
                 "running": False,
                 "message": "No game is currently running.",
-                "number_of_players": self.get_player_count(),
-                "remaining_seconds": self.get_remaining_time(),
+                "number_of_players": await self.get_player_count(),
+                "remaining_seconds": await self.get_remaining_time(),
                 "stake": float(group.stake)
             }
 
-        self.send(text_data=json.dumps(stats))
-        self.send(text_data=json.dumps({
+        await self.send(text_data=json.dumps(stats))
+        await self.send(text_data=json.dumps({
             'type': 'player_list',
-            'player_list': self.get_selected_players()
+            'player_list': await self.get_selected_players()
         }))
 
-    def disconnect(self, close_code):
-        async_to_sync(self.channel_layer.group_discard)(
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    def receive(self, text_data):
+    async def receive(self, text_data):
         # Handle empty or None messages
         if not text_data or text_data.strip() == "":
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "error",
                 "message": "Empty message received."
             }))
@@ -172,7 +171,7 @@ class GroupConsumer(WebsocketConsumer):
         try:
             data = json.loads(text_data)
         except json.JSONDecodeError:
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "error",
                 "message": "Invalid JSON format."
             }))
@@ -180,36 +179,35 @@ class GroupConsumer(WebsocketConsumer):
 
         if data['type'] == 'select_number':
 
-            current_game_id = self.get_group_state("current_game_id")
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
+            current_game_id = await self.get_group_state("current_game_id")
+            is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
 
             if is_running:
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "error",
                     "message": "Game already in progress. Please wait for the next round."
                 }))
                 return
 
-            self.add_player(data['player_id'], data['card_id'])
+            await self.add_player(data['player_id'], data['card_id'])
 
         if data['type'] == 'remove_number':
-            self.remove_player(data['userId'])
+            await self.remove_player(data['userId'])
 
         if data['type'] == 'bingo':
-            async_to_sync(self.checkBingo(int(data['userId']), data['calledNumbers'], data['gameId']))
-            bingo = self.get_game_state("bingo", game_id=data['gameId'])
+            await self.checkBingo(int(data['userId']), data['calledNumbers'], data['gameId'])
+            bingo = await self.get_game_state("bingo", game_id=data['gameId'])
             if bingo:
-                self.set_game_state("is_running", False, game_id=data['gameId'])
-                self.set_group_state("current_game_id", None)
-                self.set_selected_players([])
-                self.set_player_count(0)
-                self.broadcast_player_list()
+                await self.set_game_state("is_running", False, game_id=data['gameId'])
+                await self.set_group_state("current_game_id", None)
+                await self.snapshot.clear_running()
+                await self.set_selected_players([])
+                await self.set_player_count(0)
+                await self.broadcast_player_list()
 
         if data['type'] == 'card_data':
-            from game.models import Card
-
             user_cards = []
-            selected_players = self.get_selected_players()
+            selected_players = await self.get_selected_players()
             for player in selected_players:
                 if player['user'] == int(data.get("userId")):
                     cards_field = player['card']
@@ -228,55 +226,34 @@ class GroupConsumer(WebsocketConsumer):
 
             if not user_cards:
                 print("No cards found for user, skipping response.")
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "no_cards",
                     "message": "No cards found for user."
                 }))
                 return  # ✅ Don't send empty card data
 
-            cards = Card.objects.filter(id__in=user_cards)
-            bingo_table_data = [
-                {
-                    "id": card.id,
-                    "numbers": json.loads(card.numbers)
-                }
-                for card in cards
-            ]
+            bingo_table_data = await self.load_cards(user_cards)
             print("Sending cards:", bingo_table_data)
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "card_data",
                 "cards": bingo_table_data
             }))
             return
 
         if data['type'] == "get_group_stat":
-            from game.models import Game
-            from group.models import Group
-            current_game_id = self.get_group_state("current_game_id")
-            is_running = self.get_game_state("is_running", current_game_id) if current_game_id else False
-            
-            group = Group.objects.get(id=self.group)
+            current_game_id = await self.get_group_state("current_game_id")
+            is_running = await self.get_game_state("is_running", current_game_id) if current_game_id else False
+
+            group, current_game = await self.load_room(current_game_id if is_running else None)
             stats = {}
             if is_running:
-
-                current_game = Game.objects.get(id=current_game_id)
-                current_time = timezone.now()
-                
-
-                if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400 or current_game.played == "closed":
-                    print(f"Game {current_game_id} expired after 400s on connect — closing...")
-                    current_game.played = "closed"
-                    current_game.save(update_fields=["played"])
-                    self.set_game_state("is_running", False, current_game_id)
-                    self.set_group_state("current_game_id", None)
+                if current_game is None:
+                    await self.set_game_state("is_running", False, current_game_id)
+                    await self.set_group_state("current_game_id", None)
                     is_running = False
                 else:
                     # Bonus text logic
-                    stake_value = int(self.group or 0)
-                    if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                        bonus_text = "10X"
-                    else:
-                        bonus_text = ""
+                    bonus_text = payout.for_stake(self.group or 0).bonus_text(current_game.numberofplayers)
 
                     stats = {
                         "type": "game_stat",
@@ -287,87 +264,105 @@ class GroupConsumer(WebsocketConsumer):
                         'bonus': bonus_text,
                         'game_id': current_game.id,
                         "running": True,
-                        "called_numbers": self.get_game_state("called_numbers", current_game_id) or [],
+                        "called_numbers": await self.get_game_state("called_numbers", current_game_id) or [],
                     }
             else:
                 stats = {
                     "type": "game_stat",
                     "running": False,
                     "message": "No game is currently running.",
-                    "number_of_players": self.get_player_count(),
-                    "remaining_seconds": self.get_remaining_time(),
+                    "number_of_players": await self.get_player_count(),
+                    "remaining_seconds": await self.get_remaining_time(),
                     "stake": float(group.stake)
                 }
 
-            self.send(text_data=json.dumps(stats))
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps(stats))
+            await self.send(text_data=json.dumps({
                 'type': 'player_list',
-                'player_list': self.get_selected_players()
+                'player_list': await self.get_selected_players()
             }))
 
         if data['type'] == "block_user":
             user_id = data.get("userId")
             if user_id:
-                self.block(user_id)
-                self.remove_player(user_id)
-                self.send(text_data=json.dumps({
+                await self.block(user_id)
+                await self.remove_player(user_id)
+                await self.send(text_data=json.dumps({
                     "type": "user_blocked",
                     "message": f"User {user_id} has been blocked."
                 }))
             else:
-                self.send(text_data=json.dumps({
+                await self.send(text_data=json.dumps({
                     "type": "error",
                     "message": "User ID not provided."
                 }))
 
         if data['type'] == "fetch_active_game":
-            self.send(text_data=json.dumps({
+            await self.send(text_data=json.dumps({
                 "type": "active_game_data",
-                "data": self.get_all_active_games()
+                "data": await self.get_all_active_games()
             }))
 
+    def running_game_stat(self, group, game, called):
+        # Bonus text logic
+        bonus_text = payout.for_stake(group.stake or 0).bonus_text(game.numberofplayers)
+
+        return {
+            "type": "game_stat",
+            'number_of_players': game.numberofplayers,
+            'stake': float(game.stake),
+            'winner_price': float(game.winner_price),
+            'bonus': bonus_text,
+            'number_of_patterns': group.number_of_patterns,
+            'game_id': game.id,
+            "running": True,
+            "called_numbers": called,
+        }
+
     # --- Redis state helpers ---
-    def get_selected_players(self):
+    @property
+    def snapshot(self):
+        return room_snapshot.AsyncRoomSnapshot(self.redis_client, room_snapshot.group_key(self.group))
+
+    async def get_selected_players(self):
         key = f"selected_players_{self.group}"
-        data = self.redis_client.get(key)
+        data = await self.redis_client.get(key)
         return json.loads(data) if data else []
 
-    def set_selected_players(self, players):
+    async def set_selected_players(self, players):
         key = f"selected_players_{self.group}"
-        self.redis_client.set(key, json.dumps(players))
+        await self.redis_client.set(key, json.dumps(players))
 
-    def get_player_count(self):
-        return int(self.redis_client.get(f"player_count_{self.group}") or 0)
+    async def get_player_count(self):
+        return int(await self.redis_client.get(f"player_count_{self.group}") or 0)
 
-    def set_player_count(self, count):
-        self.redis_client.set(f"player_count_{self.group}", count)
+    async def set_player_count(self, count):
+        await self.redis_client.set(f"player_count_{self.group}", count)
 
-    def get_game_state(self, key, game_id):
-        game_id = game_id
-        val = self.redis_client.get(f"game_state_{game_id}_{key}")
+    async def get_game_state(self, key, game_id):
+        val = await self.redis_client.get(f"game_state_{game_id}_{key}")
         return json.loads(val) if val else None
 
-    def set_game_state(self, key, value, game_id):
-        game_id = game_id
-        self.redis_client.set(f"game_state_{game_id}_{key}", json.dumps(value))
+    async def set_game_state(self, key, value, game_id):
+        await self.redis_client.set(f"game_state_{game_id}_{key}", json.dumps(value))
 
-    def get_group_state(self, key):
-        val = self.redis_client.get(f"group_state_{self.group}_{key}")
+    async def get_group_state(self, key):
+        val = await self.redis_client.get(f"group_state_{self.group}_{key}")
         return json.loads(val) if val else None
 
-    def set_group_state(self, key, value):
-        self.redis_client.set(f"group_state_{self.group}_{key}", json.dumps(value))
+    async def set_group_state(self, key, value):
+        await self.redis_client.set(f"group_state_{self.group}_{key}", json.dumps(value))
 
-    def get_bingo_page_users(self):
-        data = self.redis_client.get(f"bingo_page_users_{self.group}")
+    async def get_bingo_page_users(self):
+        data = await self.redis_client.get(f"bingo_page_users_{self.group}")
         return set(json.loads(data)) if data else set()
 
-    def set_bingo_page_users(self, users):
-        self.redis_client.set(f"bingo_page_users_{self.group}", json.dumps(list(users)))
+    async def set_bingo_page_users(self, users):
+        await self.redis_client.set(f"bingo_page_users_{self.group}", json.dumps(list(users)))
 
-    def end_game(self, game_id):
-        self.set_game_state("is_running", False, game_id=game_id)
-        self.set_group_state("current_game_id", None)
+    async def end_game(self, game_id):
+        await self.set_game_state("is_running", False, game_id=game_id)
+        await self.set_group_state("current_game_id", None)
 
     def safe_float(self, val):
         try:
@@ -387,31 +382,181 @@ class GroupConsumer(WebsocketConsumer):
             return data
 
     def calculate_winner_price(self, no_p, stake):
-        try:
-            no_p = float(no_p)
-            stake = float(stake)
-            winner = no_p * stake
+        return payout.calculate_winner_price(no_p, stake)
 
-            if winner > 100:
-                winner -= (winner * 0.2)
+    # --- Database (the only blocking work; runs on the ORM thread) ---
+    @database_sync_to_async
+    def get_group(self):
+        from group.models import Group
+        return Group.objects.get(id=self.group)
 
-            # Optional: round to 2 decimal places
-            winner = round(winner, 2)
+    @database_sync_to_async
+    def get_user(self, user_id):
+        from custom_auth.models import User
+        return User.objects.get(id=user_id)
 
-            return winner
+    @database_sync_to_async
+    def load_room(self, running_game_id):
+        """
+        ``(group, current_game)``.  A running game that is over 400s old (or
+        already closed) is closed and returned as None.
+        """
+        from game.models import Game
+        from group.models import Group
 
-        except (ValueError, TypeError) as e:
-            print(f"Error calculating winner price: {e}")
-            return 0.0
+        group = Group.objects.get(id=self.group)
+        if not running_game_id:
+            return group, None
 
-    # --- Player management ---
-    def add_player(self, player_id, card_id):
+        current_game = Game.objects.get(id=running_game_id)
+        current_time = timezone.now()
+        if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400 or current_game.played == "closed":
+            print(f"Game {running_game_id} expired after 400s on connect — closing...")
+            current_game.played = "closed"
+            current_game.save(update_fields=["played"])
+            return group, None
+        return group, current_game
+
+    @database_sync_to_async
+    def close_expired_game(self, game_id, current_time):
+        """
+        Close a game that has been running for more than 400s.  Returns True
+        if it was closed, None if it does not exist.
+        """
+        from game.models import Game
+        try:
+            current_game = Game.objects.get(id=game_id)
+        except Game.DoesNotExist:
+            print(f"Game {game_id} not found.")
+            return None
+        if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400:
+            print(f"Game {game_id} expired after 400s — closing...")
+            current_game.played = "closed"
+            current_game.save(update_fields=["played"])
+            return True
+        return False
+
+    @database_sync_to_async
+    def load_cards(self, user_cards):
+        from game.models import Card
+
+        cards = Card.objects.filter(id__in=user_cards)
+        return [
+            {
+                "id": card.id,
+                "numbers": json.loads(card.numbers)
+            }
+            for card in cards
+        ]
+
+    @database_sync_to_async
+    def create_game(self, group, selected_players):
+        from game.models import Game
+
+        player_card_map = {str(p['user']): p['card'] for p in selected_players}
+        new_game = Game.objects.create(
+            stake=group.stake,
+            numberofplayers=sum(len(c) for c in player_card_map.values()),
+            playerCard=player_card_map,
+            random_numbers=json.dumps(self.generate_random_numbers()),
+            winner_price=0,
+            admin_cut=0,
+            created_at=timezone.now(),
+            started_at=timezone.now(),
+            played='Started'
+        )
+        print(f"New game created with ID: {new_game.id}")
+        return new_game
+
+    @database_sync_to_async
+    def settle_entries(self, game, deduplicated_players):
+        """Charge every entry and price the game; returns ``(group, rejected user ids)``."""
         from custom_auth.models import User
         from decimal import Decimal
         from group.models import Group
 
-        selected_players = self.get_selected_players()
         group = Group.objects.get(id=self.group)
+        stake_amount = Decimal(game.stake)
+        updated_player_cards = []
+        rejected = []
+
+        for entry in deduplicated_players:
+            try:
+                user_id = entry["user"]
+                cards = entry["card"]
+                flat_cards = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
+                total_deduction = stake_amount * len(flat_cards)
+                user = User.objects.get(id=user_id)
+
+                # ✅ STEP 1: Check combined balance (wallet + bonus)
+                available_balance = user.wallet + user.bonus
+                if available_balance < total_deduction:
+                    rejected.append(user_id)
+                    continue
+
+                # ✅ STEP 2: Deduct from wallet first
+                remaining = total_deduction
+                if user.wallet >= remaining:
+                    user.wallet -= remaining
+                    remaining = Decimal('0')
+                else:
+                    remaining -= user.wallet
+                    user.wallet = Decimal('0')
+
+                # ✅ STEP 3: Deduct remaining from bonus
+                if remaining > 0:
+                    user.bonus -= remaining
+
+                # ✅ STEP 4: Update user's total games played
+                try:
+                    user.no_of_games_played = (user.no_of_games_played or 0) + 1
+                except AttributeError:
+                    print(f"User {user_id} does not have 'no_of_games_played' field, skipping increment.")
+
+                user.save()
+                entry["card"] = flat_cards
+                updated_player_cards.append(entry)
+
+            except Exception as e:
+                print(f"[Deduction or Participation Error] {e}")
+                rejected.append(user_id)
+
+        # ✅ Record user-game participation
+        record_participation(game, updated_player_cards)
+
+        game.numberofplayers = sum(len(p['card']) for p in updated_player_cards)
+        game.playerCard = updated_player_cards
+
+        winner_price, admin_cut = payout.for_stake(stake_amount).split(game.numberofplayers)
+        game.admin_cut = admin_cut
+        if admin_cut:
+            group.group_wallet += admin_cut * group.group_percentage
+
+        game.winner_price = winner_price
+        game.save()
+        group.save()
+        return group, rejected
+
+    @database_sync_to_async
+    def close_game(self, game_id):
+        from game.models import Game
+        game = Game.objects.get(id=game_id)
+        game.played = 'closed'
+        game.save()
+
+    @database_sync_to_async
+    def credit_winner(self, user_id, amount):
+        from custom_auth.models import User
+        acc = User.objects.get(id=user_id)
+        acc.wallet += amount
+        acc.save()
+
+    # --- Player management ---
+    async def add_player(self, player_id, card_id):
+        from decimal import Decimal
+
+        selected_players = await self.get_selected_players()
+        group = await self.get_group()
 
         # Remove existing entry for this user (if re-adding)
         selected_players = [p for p in selected_players if p['user'] != player_id]
@@ -427,7 +572,7 @@ class GroupConsumer(WebsocketConsumer):
         # Check if requested cards are already taken
         conflicting_cards = [cid for cid in card_ids if cid in used_cards]
         if conflicting_cards:
-            async_to_sync(self.channel_layer.send)(
+            await self.channel_layer.send(
                 self.channel_name,
                 {
                     'type': 'error',
@@ -437,9 +582,9 @@ class GroupConsumer(WebsocketConsumer):
             return
 
         # User lookup and validation
-        user = User.objects.get(id=player_id)
+        user = await self.get_user(player_id)
         if not user.is_active:
-            async_to_sync(self.channel_layer.send)(
+            await self.channel_layer.send(
                 self.channel_name,
                 {
                     'type': 'error',
@@ -452,7 +597,7 @@ class GroupConsumer(WebsocketConsumer):
         available_balance=user.wallet + user.bonus
 
         if available_balance< total_cost:
-            async_to_sync(self.channel_layer.send)(
+            await self.channel_layer.send(
                 self.channel_name,
                 {
                     'type': 'error',
@@ -463,53 +608,66 @@ class GroupConsumer(WebsocketConsumer):
 
         # Add the player to the selection
         selected_players.append({'user': player_id, 'card': card_ids})
-        self.set_selected_players(selected_players)
+        await self.set_selected_players(selected_players)
 
         # Update player count
         player_count = sum(len(p['card']) for p in selected_players)
-        self.set_player_count(player_count)
+        await self.set_player_count(player_count)
 
         # Notify user
-        self.send(text_data=json.dumps({
+        await self.send(text_data=json.dumps({
             "type": "success",
             "message": "card selected!",
             "card_ids": card_ids
         }))
 
         # Notify all players
-        self.broadcast_player_list()
+        await self.broadcast_player_list()
 
-    def remove_player(self, player_id):
-        selected_players = [p for p in self.get_selected_players() if p['user'] != player_id]
-        self.set_selected_players(selected_players)
-        self.set_player_count(sum(len(p['card']) for p in selected_players))
-        self.send(text_data=json.dumps({
+    async def remove_player(self, player_id):
+        selected_players = [p for p in await self.get_selected_players() if p['user'] != player_id]
+        await self.set_selected_players(selected_players)
+        await self.set_player_count(sum(len(p['card']) for p in selected_players))
+        await self.send(text_data=json.dumps({
             "type": "player_removed",
             "user_id": player_id
         }))
-        self.broadcast_player_list()
-
-    def broadcast_player_list(self):
-        from group.models import Group
-        group = Group.objects.get(id=self.group)
-        async_to_sync(self.channel_layer.group_send)(
+        await self.broadcast_player_list()
+
+    async def broadcast_player_list(self):
+        # Coalesced: lobby changes within one window share a single snapshot
+        await lobby_broadcasts.arequest(f"channels:group_{self.group}", self._send_lobby_state, redis_client=self.redis_client)
+
+    async def _send_lobby_state(self):
+        group = await self.get_group()
+        players = await self.get_selected_players()
+        number_of_players = await self.get_player_count()
+        await self.snapshot.set_lobby({
+            "type": "game_stat",
+            "running": False,
+            "message": "No game is currently running.",
+            "number_of_players": number_of_players,
+            "stake": float(group.stake)
+        }, players)
+
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'update_player_list',
-                'player_list': self.get_selected_players()
+                'player_list': players
             }
         )
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_stat',
-                'number_of_players': self.get_player_count(),
+                'number_of_players': number_of_players,
                 'stake': float(group.stake),
-                'remaining_seconds': self.get_remaining_time()
+                'remaining_seconds': await self.get_remaining_time()
             }
         )
 
-    def try_start_game(self):
+    async def try_start_game(self):
         """
         Attempts to start a new game in the group.
         - Closes expired running games.
@@ -517,33 +675,27 @@ class GroupConsumer(WebsocketConsumer):
         - Sends countdown updates to all group members.
         """
 
-        from game.models import Game
-        from group.models import Group
-
         current_time = timezone.now()
-        current_game_id = self.get_group_state("current_game_id")
-        next_game_start = self.get_group_state("next_game_start")
+        current_game_id = await self.get_group_state("current_game_id")
+        next_game_start = await self.get_group_state("next_game_start")
 
         # ✅ Check if a running game has expired (e.g., ran too long)
         if current_game_id:
-            is_running = self.get_game_state("is_running", current_game_id)
+            is_running = await self.get_game_state("is_running", current_game_id)
             if is_running:
-                try:
-                    current_game = Game.objects.get(id=current_game_id)
-                    if current_game.started_at and (current_time - current_game.started_at).total_seconds() > 400:
-                        print(f"Game {current_game_id} expired after 400s — closing...")
-                        current_game.played = "closed"
-                        current_game.save(update_fields=["played"])
-                        self.set_game_state("is_running", False, current_game_id)
-                        self.set_group_state("current_game_id", None)
-                        current_game_id = None
-                except Game.DoesNotExist:
-                    print(f"Game {current_game_id} not found.")
-                    self.set_group_state("current_game_id", None)
+                closed = await self.close_expired_game(current_game_id, current_time)
+                if closed:
+                    await self.set_game_state("is_running", False, current_game_id)
+                    await self.set_group_state("current_game_id", None)
+                    await self.snapshot.clear_running()
+                    current_game_id = None
+                elif closed is None:
+                    await self.set_group_state("current_game_id", None)
+                    await self.snapshot.clear_running()
 
         # 🔁 If a game is still running after timeout check, skip starting new
-        if current_game_id and self.get_game_state("is_running", current_game_id):
-            async_to_sync(self.channel_layer.group_send)(
+        if current_game_id and await self.get_game_state("is_running", current_game_id):
+            await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     "type": "game_in_progress",
@@ -553,7 +705,7 @@ class GroupConsumer(WebsocketConsumer):
             return
 
         # ✅ Get group info
-        group = self.group if isinstance(self.group, Group) else Group.objects.get(id=self.group)
+        group = await self.get_group()
 
         remaining_seconds=0
 
@@ -572,12 +724,13 @@ class GroupConsumer(WebsocketConsumer):
                 # Default fallback: start immediately + 30s countdown
                 next_start_time = None
 
-            self.set_group_state("next_game_start", next_start_time)
+            await self.set_group_state("next_game_start", next_start_time)
+            await self.snapshot.set_countdown(next_start_time)
             remaining_seconds = int(next_start_time - current_time.timestamp())
 
             # ✅ Send remaining seconds (countdown) to all users
             if next_start_time:
-                async_to_sync(self.channel_layer.group_send)(
+                await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         'type': 'timer_message',
@@ -586,50 +739,29 @@ class GroupConsumer(WebsocketConsumer):
                 )
 
                 # ✅ Delayed start (e.g., 30s countdown)
-                def delayed_start():
-                    if remaining_seconds > 0:
-                        time.sleep(remaining_seconds)
-                    self._start_game_logic()
-
-                threading.Thread(target=delayed_start, daemon=True).start()
+                async_scheduler.call_later(max(remaining_seconds, 0), f"group_start:{self.group}", self._start_game_logic)
 
-    def _start_game_logic(self):
-        from game.models import Game
-        from django.utils import timezone
-        from group.models import Group
-        group = Group.objects.get(id=self.group)
+    async def _start_game_logic(self):
+        group = await self.get_group()
 
-        selected_players = self.get_selected_players()
+        selected_players = await self.get_selected_players()
         if not selected_players or len(selected_players) < 2:
-            async_to_sync(self.channel_layer.group_send)(
+            await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'error',
                     'message': 'Not enough players selected. Cannot start game.'
                 }
             )
-            self.try_start_game()
+            await self.try_start_game()
             return
 
-        player_card_map = {str(p['user']): p['card'] for p in selected_players}
-        new_game = Game.objects.create(
-            stake=group.stake,
-            numberofplayers=sum(len(c) for c in player_card_map.values()),
-            playerCard=player_card_map,
-            random_numbers=json.dumps(self.generate_random_numbers()),
-            winner_price=0,
-            admin_cut=0,
-            created_at=timezone.now(),
-            started_at=timezone.now(),
-            played='Started'
-        )
-        new_game.save()
-        print(f"New game created with ID: {new_game.id}")
+        new_game = await self.create_game(group, selected_players)
 
-        self.set_game_state("is_running", True, game_id=new_game.id)
-        self.set_group_state("current_game_id", new_game.id)
+        await self.set_game_state("is_running", True, game_id=new_game.id)
+        await self.set_group_state("current_game_id", new_game.id)
 
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_started',
@@ -640,89 +772,10 @@ class GroupConsumer(WebsocketConsumer):
             }
         )
 
-        threading.Thread(
-            target=self.start_game_with_random_numbers,
-            args=(new_game, selected_players),
-            daemon=True
-        ).start()
-
-    # # --- Automatic Game Loop ---
-    # def auto_game_start_loop(self):
-    #     while True:
-    #         selected_players = self.get_selected_players()
-    #         player_count = self.get_player_count()
-    #         active_games = self.get_active_games()
-
-    #         print(f"Checking game start conditions: {player_count} players, {len(active_games)} active games")
-    #         if len(active_games) < 2:
-    #             from game.models import Game  # ✅ Make sure it's the correct path
-    #             from django.utils import timezone
-
-    #             self.set_stake_state("next_game_start", timezone.now().timestamp() + 30)
-
-    #             async_to_sync(self.channel_layer.group_send)(
-    #                 self.room_group_name,
-    #                 {
-    #                     'type': 'timer_message',
-    #                     'remaining_seconds': 30,
-    #                 }
-    #             )
-
-    #             time.sleep(30)  # Wait before checking again
-
-    #             print("Starting a new game with selected players:", selected_players)
-    #             # Build the playerCard map: {user_id: [card_ids]}
-    #             player_card_map = {
-    #                 str(p['user']): p['card'] for p in selected_players
-    #             }
-
-    #             # Calculate number of cards
-    #             number_of_cards = sum(len(c) for c in player_card_map.values())
-
-    #             # Create game in DB
-    #             new_game = Game.objects.create(
-    #                 stake=group.stake,
-    #                 numberofplayers=number_of_cards,
-    #                 playerCard=player_card_map,
-    #                 random_numbers=json.dumps(self.generate_random_numbers()),
-    #                 winner_price=0,  # Can be updated later
-    #                 admin_cut=0,     # Can be calculated
-    #                 created_at=timezone.now(),
-    #                 started_at=timezone.now(),
-    #                 played='Started'
-    #             )
-    #             new_game.save()
-    #             print(f"New game created with ID: {new_game.id} and stake: {group.stake}")
-
-    #             # Add game_id to Redis active games
-    #             active_games.append(new_game.id)
-    #             self.set_active_games(active_games)
-
-    #             # Broadcast the game start
-    #             async_to_sync(self.channel_layer.group_send)(
-    #                 self.room_group_name,
-    #                 {
-    #                     'type': 'game_started',
-    #                     'game_id': new_game.id,
-    #                     'player_list': selected_players,
-    #                     'stake': group.stake
-    #                 }
-    #             )
-
-    #             print(f"Starting game with ID: {new_game.id} and players: {selected_players}")
-    #             threading.Thread(
-    #                 target=self.start_game_with_random_numbers,
-    #                 args=(new_game, selected_players),
-    #                 daemon=True
-    #             ).start()
-    #             print(f"Game thread started for game ID: {new_game.id}")
-    #             # Reset players for new cycle
-    #             self.set_selected_players([])
-    #             self.set_player_count(0)
-    #             self.broadcast_player_list()
-
-    def get_remaining_time(self):
-        next_start_ts = self.get_group_state("next_game_start")
+        async_scheduler.spawn(f"group_draw:{new_game.id}", self.start_game_with_random_numbers, new_game, selected_players)
+
+    async def get_remaining_time(self):
+        next_start_ts = await self.get_group_state("next_game_start")
         if not next_start_ts:
             return 0
         now = time.time()
@@ -738,23 +791,15 @@ class GroupConsumer(WebsocketConsumer):
             numbers[i], numbers[j] = numbers[j], numbers[i]
         return numbers
 
-    def start_game_with_random_numbers(self, game, selected_players):
-        from custom_auth.models import User
-        from decimal import Decimal
-        import json
-        from game.models import Game, UserGameParticipation  # ✅ Import new model
-        from group.models import Group
-
+    async def start_game_with_random_numbers(self, game, selected_players):
         self.game_id = game.id
-        self.set_game_state("is_running", True, game.id)
-        self.set_game_state("bingo", False, game.id)
+        await self.set_game_state("is_running", True, game.id)
+        await self.set_game_state("bingo", False, game.id)
 
         game.played = 'Playing'
-        game.save()
+        await database_sync_to_async(game.save)()
 
-        group = Group.objects.get(id=self.group)
-
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'playing',
@@ -763,93 +808,17 @@ class GroupConsumer(WebsocketConsumer):
             }
         )
 
-        stake_amount = Decimal(game.stake)
-        updated_player_cards = []
-
         # Remove duplicate users: keep only last submitted entry per user
         unique_entries = {entry["user"]: entry for entry in selected_players}
         deduplicated_players = list(unique_entries.values())
 
-        for entry in deduplicated_players:
-            try:
-                user_id = entry["user"]
-                cards = entry["card"]
-                flat_cards = [c for sub in cards for c in sub] if isinstance(cards[0], list) else cards
-                total_deduction = stake_amount * len(flat_cards)
-                user = User.objects.get(id=user_id)
-
-                # ✅ STEP 1: Check combined balance (wallet + bonus)
-                available_balance = user.wallet + user.bonus
-                if available_balance < total_deduction:
-                    self.remove_player(user_id)
-                    continue
-
-                # ✅ STEP 2: Deduct from wallet first
-                remaining = total_deduction
-                if user.wallet >= remaining:
-                    user.wallet -= remaining
-                    remaining = Decimal('0')
-                else:
-                    remaining -= user.wallet
-                    user.wallet = Decimal('0')
-
-                # ✅ STEP 3: Deduct remaining from bonus
-                if remaining > 0:
-                    user.bonus -= remaining
+        group, rejected = await self.settle_entries(game, deduplicated_players)
+        for user_id in rejected:
+            await self.remove_player(user_id)
 
-                # ✅ STEP 4: Record user-game participation
-                participation, created = UserGameParticipation.objects.get_or_create(
-                    user=user,
-                    game=game,
-                    defaults={'times_played': 1}
-                )
-                if not created:
-                    participation.times_played += 1
-                    participation.save(update_fields=['times_played'])
+        bonus_text = payout.for_stake(group.stake or 0).bonus_text(game.numberofplayers)
 
-                # ✅ STEP 5: Update user's total games played
-                try:
-                    user.no_of_games_played = (user.no_of_games_played or 0) + 1
-                except AttributeError:
-                    print(f"User {user_id} does not have 'no_of_games_played' field, skipping increment.")
-
-                user.save()
-                entry["card"] = flat_cards
-                updated_player_cards.append(entry)
-
-            except Exception as e:
-                print(f"[Deduction or Participation Error] {e}")
-                self.remove_player(user_id)
-
-        game.numberofplayers = sum(len(p['card']) for p in updated_player_cards)
-        game.playerCard = updated_player_cards
-
-        winner_price = stake_amount * game.numberofplayers
-
-        if winner_price >= 100:
-            admin_cut = winner_price * Decimal('0.2')  # 20%
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-            group.group_wallet += admin_cut * group.group_percentage
-        elif 50 <= winner_price < 100:
-            admin_cut = winner_price * Decimal('0.1')  # 10%
-            winner_price -= admin_cut
-            game.admin_cut = admin_cut
-            group.group_wallet += admin_cut * group.group_percentage
-        else:
-            game.admin_cut = Decimal('0')
-
-        game.winner_price = winner_price
-        game.save()
-        group.save()
-
-        stake_value = int(group.stake or 0)
-        if stake_value in [10, 20, 50] and game.numberofplayers >= 10:
-            bonus_text = "10X"
-        else:
-            bonus_text = ""
-
-        async_to_sync(self.channel_layer.group_send)(
+        await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'game_stat',
@@ -862,17 +831,19 @@ class GroupConsumer(WebsocketConsumer):
                 "is_running": True,
             }
         )
+        running_stat = self.running_game_stat(group, game, [])
+        await self.snapshot.set_running(running_stat)
 
-        time.sleep(5)
+        await asyncio.sleep(5)
         # Broadcast random numbers every 4 seconds
         for num in json.loads(game.random_numbers):
-            is_running = self.get_game_state("is_running", game.id)
-            bingo = self.get_game_state("bingo", game.id)
+            is_running = await self.get_game_state("is_running", game.id)
+            bingo = await self.get_game_state("bingo", game.id)
             if not is_running or bingo:
                 break
 
-            with self.lock:
-                async_to_sync(self.channel_layer.group_send)(
+            async with self.lock:
+                await self.channel_layer.group_send(
                     self.room_group_name,
                     {
                         'type': 'random_number',
@@ -881,63 +852,64 @@ class GroupConsumer(WebsocketConsumer):
                     }
                 )
 
-                called = self.get_game_state("called_numbers", game.id) or []
+                called = await self.get_game_state("called_numbers", game.id) or []
                 if not isinstance(called, list):
                     called = []
                 called.append(num)
-                self.set_game_state("called_numbers", called, game.id)
+                await self.set_game_state("called_numbers", called, game.id)
+                running_stat["called_numbers"] = called
+                await self.snapshot.set_running(running_stat)
 
-            time.sleep(4)
+            await asyncio.sleep(4)
 
-        game = Game.objects.get(id=game.id)
-        game.played = 'closed'
-        game.save()
-        self.set_game_state("is_running", False, game.id)
+        await self.close_game(game.id)
+        await self.set_game_state("is_running", False, game.id)
+        await self.snapshot.clear_running()
 
         # Reset selection state
-        self.set_selected_players([])
-        self.set_player_count(0)
-        self.broadcast_player_list()
+        await self.set_selected_players([])
+        await self.set_player_count(0)
+        await self.broadcast_player_list()
         # self.regenerate_all_cards()
-        self.try_start_game()
+        await self.try_start_game()
 
      # NEW HELPER: Update consecutive losses after game ends with a winner
     def update_consecutive_losses_after_game(self, game_id, winner_user_id):
-            from custom_auth.models import User
-            from game.models import UserGameParticipation
+        from game.models import UserGameParticipation
 
-            # Get all user IDs who participated in this game
-            participant_user_ids = UserGameParticipation.objects.filter(game_id=game_id).values_list('user_id',
-                                                                                                     flat=True)
-            for user_id in participant_user_ids:
-                try:
-                    user = User.objects.get(id=user_id)
-            
-                    # Ensure defaults for safety
-                    if user.consecutive_losses is None:
-                        user.consecutive_losses = 0
-                    if user.bonus is None:
-                        user.bonus = 0
-            
-                    if user_id == winner_user_id:
-                        # Winner: reset loss streak
-                        user.consecutive_losses = 0
-                        user.save(update_fields=['consecutive_losses'])
-                    else:
-                        user.consecutive_losses += 1
-                        if user.consecutive_losses >= 10:
-                            user.bonus += 10
-                            user.consecutive_losses = 0
-                            user.save(update_fields=['bonus', 'consecutive_losses'])
-                        else:
-                            user.save(update_fields=['consecutive_losses'])
-            
-                    print(
-                        f"[LOSS TRACK] User {user_id}: consecutive_losses = {user.consecutive_losses}, bonus = {user.bonus}")
-                except User.DoesNotExist:
-                    continue
+        participant_ids = UserGameParticipation.objects.filter(game_id=game_id).values_list('user_id', flat=True)
+        settle_consecutive_losses(participant_ids, winner_user_id)
+
+    async def checkBingo(self, user_id, calledNumbers, game_id):
+        outcome = await self.settle_bingo_claim(user_id, calledNumbers, game_id)
+        if outcome is None:
+            return
 
-    def checkBingo(self, user_id, calledNumbers, game_id):
+        to_room, result, game_id, prize = outcome
+        message = {
+            'type': 'result',
+            'data': result,
+            'game_id': game_id
+        }
+        if not to_room:
+            await self.send(text_data=json.dumps(message))
+            return
+
+        # Notify all players in the room group about the result
+        await self.channel_layer.group_send(self.room_group_name, message)
+        bingo = await self.get_game_state("bingo", game_id)
+        if bingo == False:
+            await self.credit_winner(user_id, prize)
+            await self.set_game_state("bingo", True, game_id)
+
+    @database_sync_to_async
+    def settle_bingo_claim(self, user_id, calledNumbers, game_id):
+        """
+        Check a player's claim and close the game on bingo.  Returns
+        ``(to_room, result, game_id, prize)``: a won game's result goes to the
+        whole room and ``prize`` is the winner's credit, any other result only
+        to the caller; None sends nothing.
+        """
         from game.models import Card, Game
         from custom_auth.models import User
         from group.models import Group
@@ -955,12 +927,7 @@ class GroupConsumer(WebsocketConsumer):
         if not player_cards:
             # User does not have any cards associated
             result.append({'user_id': user_id, 'message': 'Not a Player'})
-            self.send(text_data=json.dumps({
-                'type': 'result',
-                'data': result,
-                'game_id': game.id,
-            }))
-            return
+            return False, result, game.id, None
 
         # Flatten it safely
         def flatten(lst):
@@ -975,10 +942,10 @@ class GroupConsumer(WebsocketConsumer):
         print(f"Checking Bingo for user {user_id} with cards: {user_cards}")
 
         if game.winner != 0:
-            return
+            return None
 
         if game.played == 'closed':
-            return
+            return None
 
             # Include a zero at the end of the called numbers (for "free space" if applicable)
         # if not set(calledNumbers).issubset(self.get_game_state("called_numbers",game.id) or []):
@@ -990,16 +957,6 @@ class GroupConsumer(WebsocketConsumer):
         game.save_called_numbers(called_numbers_list)
         game.save()
 
-        def flatten_card_ids(card_list):
-            """Recursively flatten card IDs to handle any nested lists."""
-            flattened = []
-            for card in card_list:
-                if isinstance(card, list):
-                    flattened.extend(flatten_card_ids(card))
-                else:
-                    flattened.append(int(card))
-            return flattened
-
         # Fetch the Card objects
         cards = Card.objects.filter(id__in=user_cards)
 
@@ -1016,36 +973,7 @@ class GroupConsumer(WebsocketConsumer):
 
                 acc = User.objects.get(id=user_id)
 
-                # Get stake amount (assuming game.stake or similar field exists)
-                stake = game.stake
-                bones_amount = 0
-
-                if stake == 10 or stake == 20 or stake == 50:
-
-                    if game.numberofplayers >= 10:
-                    
-                        # Determine number of bones
-                        bones = len(called_numbers_list) 
-
-                        # Determine multiplier based on bones
-                        if bones <= 5:
-                            multiplier = 10
-                        elif bones == 6:
-                            multiplier = 8
-                        elif bones == 7:
-                            multiplier = 6
-                        elif bones == 8:
-                            multiplier = 4
-                        elif bones == 9:
-                            multiplier = 3
-                        elif bones == 10:
-                            multiplier = 2
-                        elif bones == 11:
-                            multiplier = 1
-                        else:
-                            multiplier = 0
-                    
-                        bones_amount = stake * multiplier
+                bones_amount = payout.for_stake(game.stake).bonus(len(called_numbers_list), game.numberofplayers, "off")
                 self.update_consecutive_losses_after_game(game_id, user_id)
                 # Bingo achieved
                 result.append({
@@ -1068,22 +996,8 @@ class GroupConsumer(WebsocketConsumer):
                 group.save()
                 game.save()
 
-                # Notify all players in the room group about the result
-                async_to_sync(self.channel_layer.group_send)(
-                    self.room_group_name,
-                    {
-                        'type': 'result',
-                        'data': result,
-                        'game_id': game.id
-                    }
-                )
-                bingo = self.get_game_state("bingo", game.id)
-                if bingo == False:
-                    acc.wallet += game.winner_price + bones_amount
-                    acc.save()
-                    self.set_game_state("bingo", True, game.id)
-                return  # Exit once Bingo is found for any card
-            
+                return True, result, game.id, game.winner_price + bones_amount  # Exit once Bingo is found for any card
+
         for card in cards:
             numbers = json.loads(card.numbers)
             print(f"Checking card {card.id} for user {user_id} with numbers: {numbers}")
@@ -1097,12 +1011,7 @@ class GroupConsumer(WebsocketConsumer):
                     'cards_checked': player_cards,
                     'called_numbers': called_numbers_list
                 })
-                self.send(text_data=json.dumps({
-                    'type': 'result',
-                    'data': result,
-                    'game_id': game.id
-                }))
-                return
+                return False, result, game.id, None
 
         # If no Bingo was found for any card
         result.append({
@@ -1111,87 +1020,24 @@ class GroupConsumer(WebsocketConsumer):
             'cards_checked': player_cards,
             'called_numbers': called_numbers_list
         })
-        self.send(text_data=json.dumps({
-            'type': 'result',
-            'data': result,
-            'game_id': game.id
-        }))
+        return False, result, game.id, None
 
     def has_bingo(self, card, called_numbers):
-        winning_columns = 0
-        corner_count = 0
-        winning_numbers = []
-        patterns_found = 0
-
-        print("Checking card for Bingo:", card)
-        print("Called numbers:", called_numbers)
-
-        # Check diagonals
-        diagonal2 = [card[i][i] for i in range(len(card))]
-        diagonal1 = [card[i][len(card) - 1 - i] for i in range(len(card))]
-        if all(number in called_numbers for number in diagonal2):
-            winning_numbers.extend([1, 7, 13, 19, 25])
-            patterns_found += 1
-        if all(number in called_numbers for number in diagonal1):
-            winning_numbers.extend([5, 9, 13, 17, 21])
-            patterns_found += 1
-
-        # Check rows
-        for row_index, row in enumerate(card):
-            if all(number in called_numbers for number in row):
-                winning_numbers.extend([(row_index * 5) + i + 1 for i in range(5)])
-                patterns_found += 1
-
-        # Check columns
-        for col in range(len(card[0])):
-            if all(card[row][col] in called_numbers for row in range(len(card))):
-                winning_columns = col + 1
-                winning_numbers.extend([winning_columns + (i * 5) for i in range(5)])
-                patterns_found += 1
-
-        # Check corners
-        if card[0][0] in called_numbers:
-            corner_count += 1
-        if card[0][4] in called_numbers:
-            corner_count += 1
-        if card[4][0] in called_numbers:
-            corner_count += 1
-        if card[4][4] in called_numbers:
-            corner_count += 1
-
-        if corner_count == 4:
-            winning_numbers.extend([1, 5, 21, 25])
-            patterns_found += 1
-
-        inner_corner_count = 0
-        # Check the top-left corner (1, 1)
-        if card[1][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the top-right corner (1, 5)
-        if card[1][3] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-left corner (5, 1)
-        if card[3][1] in called_numbers:
-            inner_corner_count += 1
-
-        # Check the bottom-right corner (5, 5)
-        if card[3][3] in called_numbers:
-            inner_corner_count += 1
-
-        if inner_corner_count == 4:
-            winning_numbers.extend([7, 9, 17, 19])
-            patterns_found += 1
-
-        return winning_numbers, patterns_found
-
-    def block(self, user_id):
-        from game.models import Game
-        current_game_id = self.get_stake_state("current_game_id")
+        hits = patterns.hit_mask(patterns.card_number_masks(card), patterns.called_mask(called_numbers))
+        matched = patterns.matched_patterns(hits)
+        winning_numbers = [position for _, positions in matched for position in positions]
+        return winning_numbers, len(matched)
+
+    async def block(self, user_id):
+        current_game_id = await self.get_stake_state("current_game_id")
         if not current_game_id:
             return
-        last_game = Game.objects.get(id=current_game_id)
+        await self.remove_from_game(current_game_id, user_id)
+
+    @database_sync_to_async
+    def remove_from_game(self, game_id, user_id):
+        from game.models import Game
+        last_game = Game.objects.get(id=game_id)
         players = json.loads(last_game.playerCard)
         updated_list = [item for item in players if int(item['user']) != user_id]
         last_game.playerCard = json.dumps(updated_list)
@@ -1199,14 +1045,14 @@ class GroupConsumer(WebsocketConsumer):
         last_game.save()
 
     # --- WebSocket Handlers ---
-    def update_player_list(self, event):
-        self.send(text_data=json.dumps({
+    async def update_player_list(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'player_list',
             'player_list': event['player_list']
         }))
 
-    def game_stat(self, event):
-        self.send(text_data=json.dumps({
+    async def game_stat(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'game_stat',
             'number_of_players': event['number_of_players'],
             'stake': event['stake'],
@@ -1219,9 +1065,9 @@ class GroupConsumer(WebsocketConsumer):
             'number_of_patterns': event.get('number_of_patterns', 1),
         }))
 
-    def game_started(self, event):
+    async def game_started(self, event):
         print("🎯 [WS] game_started called:", event)
-        self.send(text_data=json.dumps({
+        await self.send(text_data=json.dumps({
             'type': 'game_started',
             'game_id': event['game_id'],
             'player_list': event['player_list'],
@@ -1229,34 +1075,34 @@ class GroupConsumer(WebsocketConsumer):
             'group': event['group']
         }))
 
-    def error(self, event):
-        self.send(text_data=json.dumps({
+    async def error(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'error',
             'message': event['message']
         }))
 
-    def random_number(self, event):
-        self.send(text_data=json.dumps({
+    async def random_number(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'random_number',
             'random_number': event['random_number'],
             'game_id': event['game_id']
         }))
 
-    def timer_message(self, event):
-        self.send(text_data=json.dumps({
+    async def timer_message(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'timer_message',
             'remaining_seconds': event['remaining_seconds'],
         }))
 
-    def playing(self, event):
-        self.send(text_data=json.dumps({
+    async def playing(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'playing',
             'game_id': event['game_id'],
             'message': event['message']
         }))
 
-    def game_stats(self, event):
-        self.send(text_data=json.dumps({
+    async def game_stats(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'game_stats',
             'number_of_players': event['number_of_players'],
             'stake': event['stake'],
@@ -1265,21 +1111,21 @@ class GroupConsumer(WebsocketConsumer):
             'game_id': event['game_id']
         }))
 
-    def result(self, event):
-        self.send(text_data=json.dumps({
+    async def result(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'result',
             'data': event['data'],
             'game_id': event['game_id']
         }))
 
-    def no_cards(self, event):
-        self.send(text_data=json.dumps({
+    async def no_cards(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'no_cards',
             'message': event['message']
         }))
 
-    def active_game_data(self, event):
-        self.send(text_data=json.dumps({
+    async def active_game_data(self, event):
+        await self.send(text_data=json.dumps({
             'type': 'active_game_data',
             'data': event['data']
         }))
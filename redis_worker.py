@@ -5,6 +5,8 @@ import os
 import django
 import json
 import redis
+import socket
+import threading
 import time
 
 # Django setup
@@ -13,10 +15,23 @@ django.setup()
 
 from game.models import Game, Card
 from game.ws_handlers import GameManager, RedisState
+from game.card_catalog import catalog as card_catalog
+from game import command_queue
+from game import metrics
+from django.db import close_old_connections
 
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
 
+# Each stake's command stream is owned by one worker at a time (a lease that
+# is renewed while the stake thread runs); other processes pick up the rest.
+COMMAND_LEASE_MS = int(os.environ.get("COMMAND_LEASE_MS", 10000))
+COMMAND_BLOCK_MS = int(os.environ.get("COMMAND_BLOCK_MS", 2000))
+COMMAND_BATCH_SIZE = int(os.environ.get("COMMAND_BATCH_SIZE", 50))
+MAX_STAKES_PER_WORKER = int(os.environ.get("MAX_STAKES_PER_WORKER", 0))  # 0 = no limit
+BACKLOG_REPORT_INTERVAL = float(os.environ.get("BACKLOG_REPORT_INTERVAL", 10))
+METRICS_PORT = int(os.environ.get("WORKER_METRICS_PORT", 9101))  # 0 = no /metrics endpoint
+
 r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
 channel_layer = None  
 room_group_name = "game_all"
@@ -32,7 +47,24 @@ def publish_event(stake, event, target_client_id=None):
         "event": event,
         "target_client_id": target_client_id  # None means broadcast
     }
-    r.publish(ch, json.dumps(payload))
+    r.publish(ch, json.dumps(metrics.stamp(payload)))
+
+# --- One GameManager per stake ---
+# Created on the first command for a stake and reused afterwards, so the
+# manager's lock, cached stake config and game trackers outlive a message.
+managers = {}
+managers_lock = threading.Lock()
+
+def get_manager(stake):
+    stake = str(stake)
+    manager = managers.get(stake)
+    if manager is None:
+        with managers_lock:
+            manager = managers.get(stake)
+            if manager is None:
+                manager = GameManager(RedisState(r, stake), stake, "game_" + stake)
+                managers[stake] = manager
+    return manager
 
 def process_message(msg):
     """Process incoming Redis messages."""
@@ -47,16 +79,24 @@ def process_message(msg):
     stake = incoming.get("stake")
     payload = incoming.get("payload", {})
     msg_type = payload.get("type")
-    room_group_name = "game_" + str(stake)
     client_id = incoming.get("client_id")
 
-    redis_state = RedisState(r, stake)
-    manager = GameManager(redis_state, stake, channel_layer, room_group_name)
-
-    redis_state = RedisState(r, stake)
-    manager = GameManager(redis_state, stake, room_group_name,client_id)
-
+    # events published by the handler carry the command's trace
+    trace = incoming.get("trace")
+    type_label = metrics.command_label(msg_type)
+    if trace:
+        metrics.queue_delay.observe(max(time.time() - trace["received"], 0), type=type_label, stake=stake)
+    token = metrics.current_trace.set(trace)
+    started = time.perf_counter()
+    try:
+        manager = get_manager(stake)
+        with manager.handling(client_id):
+            handle_command(manager, stake, msg_type, payload, client_id)
+    finally:
+        metrics.handler_time.observe(time.perf_counter() - started, type=type_label, stake=stake)
+        metrics.current_trace.reset(token)
 
+def handle_command(manager, stake, msg_type, payload, client_id):
     # --- Handle number selection ---
     if msg_type == "select_number":
         result = manager.add_player(payload=payload)
@@ -91,6 +131,10 @@ def process_message(msg):
         if result:
             publish_event(stake, result, target_client_id=client_id)
 
+    # --- Client saw a gap in player_list_delta seqs ---
+    elif msg_type == "player_list_sync":
+        manager.sync_player_list(payload=payload)
+
     # --- Block user ---
     elif msg_type == "block_user":
         user_id = payload.get("userId")
@@ -114,21 +158,134 @@ def process_message(msg):
     else:
         publish_event(stake, {"type": "error", "message": f"Unknown message type: {msg_type}"})
 
-def on_message(msg):
-    """Redis pubsub callback."""
-    if msg['type'] in ('message','pmessage'):
-        process_message(msg)
+# KEYS: owner key; ARGV: consumer, lease ms.  Extends the lease only if we still own it.
+RENEW_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# KEYS: owner key; ARGV: consumer.
+RELEASE_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("DEL", KEYS[1])
+end
+return 0
+"""
+
+
+class StakeWorker(threading.Thread):
+    """Handles one stake's command stream, in order, while holding its lease."""
+
+    def __init__(self, stake, consumer):
+        super().__init__(name=f"stake-{stake}", daemon=True)
+        self.stake = stake
+        self.consumer = consumer
+        self.stream = command_queue.command_stream(stake)
+        self.owner_key = command_queue.owner_key(stake)
+
+    def renew_lease(self):
+        return bool(r.eval(RENEW_LEASE_SCRIPT, 1, self.owner_key, self.consumer, COMMAND_LEASE_MS))
+
+    def take_over_pending(self):
+        """
+        Claim whatever the previous owner read but never acknowledged.  Its
+        lease lapsed at least COMMAND_LEASE_MS after its last renewal, so an
+        entry idle for less than that may still be in its hands.
+        """
+        start = "0-0"
+        while True:
+            claimed = r.xautoclaim(self.stream, command_queue.COMMAND_GROUP, self.consumer,
+                                   min_idle_time=COMMAND_LEASE_MS, start_id=start, count=COMMAND_BATCH_SIZE)
+            start = claimed[0]
+            if start == "0-0":
+                return
+
+    def handle(self, entries):
+        """
+        Run a batch in order.  The lease is renewed before each entry, since a
+        slow batch can outlast it; once it is lost the rest stays pending for
+        the new owner and False is returned.
+        """
+        for entry_id, fields in entries:
+            if not self.renew_lease():
+                return False
+            try:
+                process_message({"data": fields.get("data")})
+            except Exception as e:
+                print(f"❌ Error handling command {entry_id} for stake {self.stake}:", e)
+            r.xack(self.stream, command_queue.COMMAND_GROUP, entry_id)
+        return True
+
+    def run(self):
+        print(f"Worker {self.consumer} owns stake {self.stake}")
+        try:
+            command_queue.ensure_group(r, self.stake)
+            self.take_over_pending()
+            # Our own pending list first (taken over or left by a crash), then new entries
+            last_id = "0"
+            while self.renew_lease():
+                response = r.xreadgroup(command_queue.COMMAND_GROUP, self.consumer, {self.stream: last_id},
+                                        count=COMMAND_BATCH_SIZE, block=COMMAND_BLOCK_MS)
+                entries = response[0][1] if response else []
+                if not entries and last_id != ">":
+                    last_id = ">"
+                    continue
+                close_old_connections()
+                if not self.handle(entries):
+                    break
+            print(f"Worker {self.consumer} lost the lease on stake {self.stake}")
+        except redis.RedisError as e:
+            print(f"Redis error on stake {self.stake}:", e)
+        finally:
+            try:
+                r.eval(RELEASE_LEASE_SCRIPT, 1, self.owner_key, self.consumer)
+            except redis.RedisError:
+                pass
+            close_old_connections()
+
+
+def report_backlog():
+    backlog = command_queue.stake_backlog(r)
+    command_queue.publish_backlog(r, backlog)
+    busy = {stake: depth for stake, depth in backlog.items() if depth["lag"] or depth["pending"]}
+    if busy:
+        print("Command backlog:", ", ".join(
+            f"{stake}: {depth['lag']} queued / {depth['pending']} pending" for stake, depth in busy.items()
+        ))
+    return backlog
+
 
 def run():
     """Start Redis worker."""
-    pubsub = r.pubsub()
-    pubsub.psubscribe('game:*:incoming')  # pattern
-    print("Worker subscribed to pattern game:*:incoming")
-    for msg in pubsub.listen():
-        # Only handle actual messages
-        if msg['type'] not in ('message','pmessage'):
-            continue
-        process_message(msg)
+    card_catalog.load()
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT)
+        print(f"Worker metrics on :{METRICS_PORT}/metrics")
+    consumer = f"{socket.gethostname()}-{os.getpid()}"
+    workers = {}
+    last_report = 0
+    print(f"Worker {consumer} consuming {command_queue.command_stream('*')} streams")
+
+    while True:
+        try:
+            workers = {stake: worker for stake, worker in workers.items() if worker.is_alive()}
+            for stake in r.smembers(command_queue.COMMAND_STAKES_KEY):
+                if stake in workers:
+                    continue
+                if MAX_STAKES_PER_WORKER and len(workers) >= MAX_STAKES_PER_WORKER:
+                    break
+                if r.set(command_queue.owner_key(stake), consumer, nx=True, px=COMMAND_LEASE_MS):
+                    workers[stake] = StakeWorker(stake, consumer)
+                    workers[stake].start()
+
+            if time.monotonic() - last_report >= BACKLOG_REPORT_INTERVAL:
+                last_report = time.monotonic()
+                report_backlog()
+        except redis.RedisError as e:
+            print("Redis error in worker supervisor:", e)
+        time.sleep(1)
 
 if __name__ == "__main__":
     run()
@@ -5,26 +5,196 @@
 # Environment variables (optional):
 #   REDIS_HOST, REDIS_PORT
 
+import asyncio
+
+# Twisted runs on top of an asyncio loop so redis.asyncio works inside the reactor.
+# The reactor must be installed before anything imports twisted.internet.reactor.
+from twisted.internet import asyncioreactor
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
+asyncioreactor.install(loop)
+
 from autobahn.twisted.websocket import WebSocketServerProtocol, WebSocketServerFactory
 from twisted.internet import reactor, endpoints
+from twisted.web import resource, server
 import redis
+import redis.asyncio as aioredis
 import os
 import json
 import urllib.parse
-import threading
 import time
-import os
 import django
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Bingo.settings")
 django.setup()
 
 from game.ws_handlers import RedisState
+from game import command_queue
+from game import metrics
+from game import payout
+from game import room_snapshot
 
 REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
 REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
 
-connected_clients = {}  # room_name -> set of WebSocket instances
+EVENTS_PATTERN = "game:*:events"
+METRICS_PORT = int(os.environ.get("WS_METRICS_PORT", 9100))  # 0 = no /metrics endpoint
+
+# Blocking reads done while building a client's initial state share one pool
+r = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+
+class RoomHub:
+    """
+    Process-wide Redis side of the server.
+
+    One pub/sub connection (pattern ``game:*:events``) is shared by every room
+    and every client; each message is dispatched once to the local clients of
+    its room.  Client commands are appended to the per-stake command streams
+    (see game/command_queue.py) through the same pooled async client.
+
+    A broadcast is serialized and framed once and the same bytes are written
+    to every recipient; targeted events are looked up by client id.
+    """
+
+    def __init__(self):
+        self.rooms = {}  # room_name -> set of WebSocket instances
+        self.clients = {}  # client_id -> WebSocket instance
+        self.redis = aioredis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+        self._listener = None
+
+    def start(self):
+        if self._listener is None:
+            self._listener = asyncio.ensure_future(self._listen())
+
+    # --- rooms ---
+    def join(self, client):
+        clients = self.rooms.setdefault(client.room_name, set())
+        clients.add(client)
+        self.clients[client.client_id] = client
+        print(f"Client registered: {client.client_id} in {client.room_name} (total {len(clients)})")
+
+    def leave(self, client):
+        if self.clients.get(client.client_id) is client:
+            del self.clients[client.client_id]
+        clients = self.rooms.get(client.room_name)
+        if clients and client in clients:
+            clients.remove(client)
+            if not clients:
+                self.rooms.pop(client.room_name, None)
+            print(f"Client unregistered: {client.client_id} from {client.room_name}")
+
+    # --- redis ---
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe(EVENTS_PATTERN)
+                print(f"Subscribed to Redis pattern: {EVENTS_PATTERN}")
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        self.dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Error in Redis pubsub listener:", e)
+            finally:
+                try:
+                    await pubsub.reset()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)  # reconnect
+
+    def enqueue(self, stake, data, on_error=None):
+        """Append a client command to its stake's stream for redis_worker.py."""
+        future = asyncio.ensure_future(self._enqueue(stake, data))
+
+        def done(f):
+            if not f.cancelled() and f.exception() is not None:
+                print("Failed to enqueue command:", f.exception())
+                if on_error:
+                    on_error()
+
+        future.add_done_callback(done)
+        return future
+
+    async def _enqueue(self, stake, data):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            await command_queue.queue_command(pipe, stake, data).execute()
+
+    def dispatch(self, channel, msg):
+        """
+        msg is a JSON string with keys:
+          - event: dict (the payload to send to client(s))
+          - target_client_id: optional (only this client_id receives it)
+          - room_name: optional explicit room, defaults to the channel's stake room
+        """
+        arrived = time.time()
+        started = time.perf_counter()
+        try:
+            payload = json.loads(msg)
+            event = payload.get("event", payload)  # if payload already is event dict
+            target_client_id = payload.get("target_client_id")
+            room_name = payload.get("room_name")  # optional: explicit room
+            trace = payload.get("trace") or {}
+        except Exception:
+            # fallback: send raw string to the channel's room
+            event = msg
+            target_client_id = None
+            room_name = None
+            trace = {}
+
+        stake = channel.split(':')[1]
+        room = room_name or f"game_{stake}"
+        event_type = event.get("type") if isinstance(event, dict) else None
+        if "published" in trace:
+            metrics.event_delay.observe(max(arrived - trace["published"], 0), type=event_type, stake=stake)
+        if "received" in trace:
+            metrics.round_trip.observe(max(arrived - trace["received"], 0), type=trace.get("type"), stake=stake)
+        try:
+            self._send(room, event, target_client_id)
+        finally:
+            metrics.fanout_time.observe(time.perf_counter() - started, type=event_type, stake=stake)
+
+    def _send(self, room, event, target_client_id):
+        # encode once for every recipient
+        if isinstance(event, (dict, list)):
+            data = json.dumps(event).encode('utf-8')
+        else:
+            data = str(event).encode('utf-8')
+
+        if target_client_id:
+            client = self.clients.get(target_client_id)
+            if client is not None and client.room_name == room:
+                try:
+                    client.send_ws_bytes(data)
+                except Exception as e:
+                    print(f"Error sending to client {target_client_id}: {e}")
+            return
+
+        clients = list(self.rooms.get(room, ()))
+        if not clients:
+            # no registered clients in that room
+            return
+
+        # frame once; iterate snapshot to avoid mutation issues
+        prepared = clients[0].factory.prepareMessage(data, isBinary=False)
+        for client in clients:
+            try:
+                client.send_prepared_ws_message(prepared)
+            except Exception as e:
+                print(f"Error sending to client {getattr(client,'client_id',None)}: {e}")
+
+
+hub = RoomHub()
+
+
+class MetricsResource(resource.Resource):
+    isLeaf = True
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return metrics.render().encode("utf-8")
 
 def extract_stake_from_path(path_bytes):
     try:
@@ -41,30 +211,17 @@ def extract_stake_from_path(path_bytes):
 class BingoWSProtocol(WebSocketServerProtocol):
     def onConnect(self, request):
         self.request = request
-        self._redis = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
         self.stake = extract_stake_from_path(request.path)
         if not self.stake:
             qs = urllib.parse.parse_qs(urllib.parse.urlparse(request.uri).query)
             self.stake = (qs.get('stake') or [None])[0]
         self.room_name = f"game_{self.stake}" if self.stake else "game_unknown"
         self.client_id = f"{self.peer}-{id(self)}"
-        self._stop_pubsub = threading.Event()
-        self.channel_incoming = f"game:{self.stake}:incoming"  # <-- define here
 
     def onOpen(self):
-        # Start Redis Pub/Sub listener
-        self.pubsub = self._redis.pubsub()
-        channel = f"game:{self.stake}:events"
-        self.pubsub.subscribe(channel)
-        print(f"Subscribed to Redis channel: {channel}")
-        threading.Thread(target=self.listen_to_redis, daemon=True).start()
-        redis_state = RedisState(self._redis, self.stake)
-
-        # --- register this client into connected_clients ---
-        clients = connected_clients.setdefault(self.room_name, set())
-        clients.add(self)
-        print(f"Client registered: {self.client_id} in {self.room_name} (total {len(clients)})")
-        # ---------------------------------------------------
+        # Events for this room arrive through the process-wide subscription
+        hub.join(self)
+        redis_state = RedisState(r, self.stake)
 
         # ... rest of onOpen (send initial state) ...
 
@@ -77,6 +234,18 @@ class BingoWSProtocol(WebSocketServerProtocol):
                 "data": all_games
             }))
         else:
+            # One HGETALL: the game engine keeps this room's connect frames
+            # encoded (game/room_snapshot.py); the DB is only read until the
+            # first document is published.
+            doc = redis_state.snapshot.load()
+            frames = room_snapshot.frames(doc)
+            if frames is not None:
+                for frame in frames:
+                    self.send_ws_message(frame)
+                if room_snapshot.needs_start(doc):
+                    self.request_game_start()
+                return
+
             current_game_id = redis_state.get_stake_state("current_game_id")
             is_running = redis_state.get_game_state("is_running", current_game_id) if current_game_id else False
 
@@ -86,11 +255,7 @@ class BingoWSProtocol(WebSocketServerProtocol):
                     current_game = Game.objects.get(id=current_game_id)
 
                     # Bonus text logic
-                    stake_value = int(self.stake or 0)
-                    if stake_value in [10, 20, 50] and current_game.numberofplayers >= 10:
-                        bonus_text = "10X"
-                    else:
-                        bonus_text = ""
+                    bonus_text = payout.for_stake(self.stake or 0).bonus_text(current_game.numberofplayers)
 
                     stats = {
                         "type": "game_stat",
@@ -109,116 +274,47 @@ class BingoWSProtocol(WebSocketServerProtocol):
                         "game_id": current_game_id
                     }))
                 except Game.DoesNotExist:
-                    self._redis.publish(self.channel_incoming, json.dumps({
-                        "client_id": self.client_id,
-                        "remote": str(self.peer),
-                        "room_name": self.room_name,
-                        "stake": self.stake,
-                        "payload": {"type": "request_game_start"}}))
-                    stats = {
-                        "type": "game_stat",
-                        "running": False,
-                        "message": "No game is currently running.",
-                        "number_of_players": redis_state.get_player_count(),
-                        "remaining_seconds": redis_state.get_remaining_time(),
-                    }
+                    self.request_game_start()
+                    stats = redis_state.idle_stat()
             else:
-                self._redis.publish(self.channel_incoming, json.dumps({
-                        "client_id": self.client_id,
-                        "remote": str(self.peer),
-                        "room_name": self.room_name,
-                        "stake": self.stake,
-                        "payload": {"type": "request_game_start"}}))
-                stats = {
-                    "type": "game_stat",
-                    "running": False,
-                    "message": "No game is currently running.",
-                    "number_of_players": redis_state.get_player_count(),
-                    "remaining_seconds": redis_state.get_remaining_time(),
-                }
+                self.request_game_start()
+                stats = redis_state.idle_stat()
 
             # Send initial stats
             self.send_ws_message(json.dumps(stats))
-            # Send current selected player list
+            # Send current selected player list; later updates are seq'd deltas
+            seq, players = redis_state.lobby.snapshot()
             self.send_ws_message(json.dumps({
                 "type": "player_list",
-                "player_list": redis_state.get_selected_players()
+                "seq": seq,
+                "player_list": players
             }))
 
+    def request_game_start(self):
+        hub.enqueue(self.stake, json.dumps({
+            "client_id": self.client_id,
+            "remote": str(self.peer),
+            "room_name": self.room_name,
+            "stake": self.stake,
+            "payload": {"type": "request_game_start"},
+            "trace": metrics.new_trace("request_game_start")}))
 
-    def listen_to_redis(self):
-        try:
-            for message in self.pubsub.listen():
-                if self._stop_pubsub.is_set():
-                    break
-                if message['type'] == 'message':
-                    data = message['data']
-                    # Broadcast to all clients in the room
-                    reactor.callFromThread(self.broadcast_ws_message, data)
-        except Exception as e:
-            print("Error in Redis pubsub listener:", e)
-
-    def broadcast_ws_message(self, msg):
-        """
-        msg is a JSON string with keys:
-          - event: dict (the payload to send to client(s))
-          - target_client_id: optional (only this client_id receives it)
-        """
-        try:
-            payload = json.loads(msg)
-            event = payload.get("event", payload)  # if payload already is event dict
-            target_client_id = payload.get("target_client_id")
-            room_name = payload.get("room_name")  # optional: explicit room
-        except Exception:
-            # fallback: try to send raw string to this connection's room
-            event = msg
-            target_client_id = None
-            room_name = None
-
-        # prefer explicit room_name in message, else use this connection's room_name
-        room = room_name or self.room_name
-
-        clients = list(connected_clients.get(room, set()))
-        if not clients:
-            # no registered clients in that room
-            return
-
-        # send to matching clients; iterate snapshot to avoid mutation issues
-        for client in clients:
-            try:
-                if target_client_id and client.client_id != target_client_id:
-                    continue
-                # ensure we send JSON string
-                if isinstance(event, (dict, list)):
-                    client.send_ws_message(json.dumps(event))
-                else:
-                    client.send_ws_message(str(event))
-            except Exception as e:
-                print(f"Error sending to client {getattr(client,'client_id',None)}: {e}")
+    def send_ws_message(self, msg):
+        self.send_ws_bytes(msg.encode('utf-8'))
 
+    def send_ws_bytes(self, data):
+        if self.transport and not self.transport.disconnecting:
+            self.sendMessage(data, isBinary=False)
 
-    def send_ws_message(self, msg):
+    def send_prepared_ws_message(self, prepared):
         if self.transport and not self.transport.disconnecting:
-            self.sendMessage(msg.encode('utf-8'), isBinary=False)
+            self.sendPreparedMessage(prepared)
 
     def connectionLost(self, reason):
-        if hasattr(self, "_stop_pubsub"):
-            self._stop_pubsub.set()
-
-        if hasattr(self, "pubsub"):
-            try:
-                self.pubsub.close()
-            except Exception:
-                pass
-
         # --- unregister this client ---
         try:
-            clients = connected_clients.get(getattr(self, "room_name", None))
-            if clients and self in clients:
-                clients.remove(self)
-                if not clients:
-                    connected_clients.pop(self.room_name, None)
-                print(f"Client unregistered: {getattr(self,'client_id',None)} from {getattr(self,'room_name',None)}")
+            if hasattr(self, "room_name"):
+                hub.leave(self)
         except Exception as e:
             print("Error unregistering client:", e)
         # ---------------------------------------------------
@@ -241,14 +337,15 @@ class BingoWSProtocol(WebSocketServerProtocol):
             "remote": str(self.peer),
             "room_name": self.room_name,
             "stake": self.stake,
-            "payload": data
+            "payload": data,
+            "trace": metrics.new_trace(data.get("type") if isinstance(data, dict) else None),
         }
 
-        try:
-            self._redis.publish(self.channel_incoming, json.dumps(outgoing))
-        except Exception as e:
-            print("Failed to publish to Redis incoming:", e)
-            self.send_ws_message(json.dumps({"type": "error", "message": "publish_failed"}))
+        hub.enqueue(
+            self.stake,
+            json.dumps(outgoing),
+            on_error=lambda: self.send_ws_message(json.dumps({"type": "error", "message": "publish_failed"})),
+        )
 
 
 if __name__ == "__main__":
@@ -256,5 +353,11 @@ if __name__ == "__main__":
     factory.protocol = BingoWSProtocol
     endpoint = endpoints.TCP4ServerEndpoint(reactor, 9000)
     endpoint.listen(factory)
+    reactor.callWhenRunning(hub.start)
+    if METRICS_PORT:
+        metrics_root = resource.Resource()
+        metrics_root.putChild(b"metrics", MetricsResource())
+        endpoints.TCP4ServerEndpoint(reactor, METRICS_PORT).listen(server.Site(metrics_root))
+        print(f"Metrics on :{METRICS_PORT}/metrics")
     print("Twisted WebSocket server listening on 0.0.0.0:9000")
     reactor.run()